@@ -0,0 +1,385 @@
+"""Benchmarks of LogCutter (local) and RemoteLogCutter (against a local SSH stand-in server).
+
+Every case runs in a fresh process, so its peak RSS is its own. Generated logs are cached in --data-dir.
+
+Examples:
+    python benchmarks/bench_cut.py --size-mb 256 --remote --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_cut.py --size-mb 256 --remote --compare benchmarks/baseline.json
+    python benchmarks/bench_cut.py --formats iso --scan-bytes 4096,16384,65536  # tune LogCutter.linear_scan_bytes
+    python benchmarks/bench_cut.py --out-of-order-rate 0.01 --slack 2 --verify 200  # check the searches against a linear scan
+    python benchmarks/bench_cut.py --memory-limit-mb 16 --check-flat-rss 8 --remote --stream  # peak RSS must not grow with the file size
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "src" / "log_harvester"))
+sys.path.insert(0, str(BENCHMARKS_DIR))
+
+from generate_logs import FORMATS, generate  # noqa: E402
+
+# Number of lines parsed to measure the timestamp parsing speed
+PARSE_SAMPLE_LINES = 200_000
+# Keyword of the filtered case of --check-flat-rss, kept by about one line in 16
+FILTER_KEYWORD = "[worker-7]"
+# Metrics compared with the baseline: lower is better for times, higher for rates
+COMPARED_METRICS = {"locate_s": "lower", "copy_s": "lower", "parse_lines_per_s": "higher", "copy_mb_per_s": "higher"}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def window_of(meta: dict, fraction: float) -> tuple[str, str]:
+    """A window of the given fraction of the file's time span, in its middle."""
+    first = datetime.fromisoformat(meta["first_time"])
+    span = datetime.fromisoformat(meta["last_time"]) - first
+    from_date = first + span * (0.5 - fraction / 2)
+    return (from_date.isoformat(sep=" ", timespec="seconds"),
+            (from_date + span * fraction + timedelta(seconds=1)).isoformat(sep=" ", timespec="seconds"))
+
+
+def run_local_case(case: dict) -> dict:
+    from LogCutter import LogCutter
+    log_cutter = LogCutter(case["from_date"], case["to_date"], case["dest_path"], time_slack=case["slack"],
+                           buffer_size=case["buffer_size"])
+    log_cutter.linear_scan_bytes = case["scan_bytes"]
+    result = {}
+    with open(case["path"], "rb") as log_file:
+        file_stat = os.fstat(log_file.fileno())
+        started = time.perf_counter()
+        parser = log_cutter.detect_timestamp_parser(log_file, reference_time=file_stat.st_mtime)
+        start_offset, end_offset = log_cutter.locate_window(log_file, file_stat.st_size, parser)
+        result["locate_s"] = time.perf_counter() - started
+
+        dest_file_path = log_cutter.prepare_dest_file_path(case["path"])
+        started = time.perf_counter()
+        with open(dest_file_path, "wb") as dest_file:
+            log_cutter.copy_byte_range(log_file, dest_file, start_offset, end_offset)
+        result["copy_s"] = time.perf_counter() - started
+
+        if case.get("parse", True):
+            log_file.seek(0)
+            lines = [log_file.readline() for _ in range(PARSE_SAMPLE_LINES)]
+            started = time.perf_counter()
+            for line in lines:
+                parser.parse(line)
+            result["parse_lines_per_s"] = len(lines) / (time.perf_counter() - started)
+    result["format_detected"] = parser.name
+    result["window_bytes"] = end_offset - start_offset
+    return result
+
+
+def run_remote_case(case: dict) -> dict:
+    from LogCutter import LogCutter
+    from RemoteLogCutter import RemoteLogCutter
+    log_cutter = LogCutter(case["from_date"], case["to_date"], case["dest_path"], time_slack=case["slack"],
+                           buffer_size=case["buffer_size"])
+    log_cutter.linear_scan_bytes = case["scan_bytes"]
+    result = {}
+    started = time.perf_counter()
+    remote_lc = RemoteLogCutter(case["from_date"], case["to_date"], case["dest_path"], "127.0.0.1", "bench", "bench", port=case["port"],
+                                buffer_size=case["buffer_size"])
+    result["connect_s"] = time.perf_counter() - started
+    try:
+        with remote_lc.get_sftp_client().open(case["path"], "rb") as remote_file:
+            file_attr = remote_file.stat()
+            started = time.perf_counter()
+            parser = log_cutter.detect_timestamp_parser(remote_file, reference_time=file_attr.st_mtime)
+            start_offset, end_offset = log_cutter.locate_window(remote_file, file_attr.st_size, parser)
+            result["locate_s"] = time.perf_counter() - started
+
+            dest_file_path = log_cutter.prepare_dest_file_path(case["path"])
+            started = time.perf_counter()
+            with open(dest_file_path, "wb") as dest_file:
+                remote_lc.download_range(remote_file, dest_file, start_offset, end_offset)
+            result["copy_s"] = time.perf_counter() - started
+    finally:
+        remote_lc.close()
+    result["format_detected"] = parser.name
+    result["window_bytes"] = end_offset - start_offset
+    return result
+
+
+def run_stream_case(case: dict) -> dict:
+    """RemoteLogCutter with server_side_cut=False: the file is streamed from its beginning and cut while it's downloaded."""
+    from LogCutter import LogCutter
+    from RemoteLogCutter import RemoteLogCutter
+    remote_lc = RemoteLogCutter(case["from_date"], case["to_date"], case["dest_path"], "127.0.0.1", "bench", "bench",
+                                port=case["port"], server_side_cut=False, buffer_size=case["buffer_size"])
+    log_cutter = LogCutter(case["from_date"], case["to_date"], case["dest_path"], stats=remote_lc.stats, time_slack=case["slack"],
+                           buffer_size=case["buffer_size"])
+    try:
+        started = time.perf_counter()
+        with remote_lc.stats.track_file(case["path"]):
+            remote_lc.cut_streaming(log_cutter, case["path"])
+        elapsed = time.perf_counter() - started
+    finally:
+        remote_lc.close()
+    counters = remote_lc.stats.counters
+    return {"locate_s": 0.0, "copy_s": elapsed, "window_bytes": counters["bytes_written"],
+            "bytes_transferred": counters["bytes_transferred"]}
+
+
+def run_gzip_filter_case(case: dict) -> dict:
+    """A gzip rotation cut on the fly through a keyword filter: the decompressed stream, the filter and the output are buffered."""
+    from LogCutter import LogCutter
+    from LogFilter import LogFilter
+    log_cutter = LogCutter(case["from_date"], case["to_date"], case["dest_path"], time_slack=case["slack"],
+                           log_filter=LogFilter(keywords=[FILTER_KEYWORD]), buffer_size=case["buffer_size"])
+    started = time.perf_counter()
+    log_cutter.cut_log_file(case["path"])
+    elapsed = time.perf_counter() - started
+    return {"locate_s": 0.0, "copy_s": elapsed, "window_bytes": log_cutter.stats.counters["bytes_written"]}
+
+
+def first_offset_at_or_after(timestamped: list[tuple[int, float]], timestamp: float, file_size: int) -> int:
+    """The answer of a search by brute force: the offset of the first line whose timestamp matches or exceeds timestamp."""
+    return next((offset for offset, line_timestamp in timestamped if line_timestamp >= timestamp), file_size)
+
+
+def run_verify_case(case: dict) -> dict:
+    """Check locate_window and locate_windows against a linear scan of the whole file for random windows.
+
+    Out-of-order lines (--out-of-order-rate) are found at the edges only if --slack covers their skew.
+    """
+    from LogCutter import LogCutter
+    rng = random.Random(case["seed"])
+    mismatches = []
+    with open(case["path"], "rb") as log_file:
+        file_size = os.fstat(log_file.fileno()).st_size
+        parser = LogCutter("1970-01-01 00:00:00", None, case["dest_path"]).detect_timestamp_parser(log_file)
+        log_file.seek(0)
+        timestamped = []
+        offset = 0
+        for line in log_file:
+            line_timestamp = parser.parse(line)
+            if line_timestamp is not None:
+                timestamped.append((offset, line_timestamp))
+            offset += len(line)
+        first, last = timestamped[0][1], max(line_timestamp for _, line_timestamp in timestamped)
+
+        def random_date() -> str:
+            # Whole seconds from a bit before the first line to a bit after the last one
+            return datetime.fromtimestamp(int(rng.uniform(first - 60, last + 60)), timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+        for _ in range(case["verify"]):
+            edges = sorted({random_date() for _ in range(6)})
+            windows = [(edges[i], edges[i + 1]) for i in range(0, len(edges) - 1, 2)]
+            for from_date, to_date in windows:
+                log_cutter = LogCutter(from_date, to_date, case["dest_path"], time_slack=case["slack"])
+                log_cutter.linear_scan_bytes = case["scan_bytes"]
+                expected = (first_offset_at_or_after(timestamped, log_cutter.from_timestamp, file_size),
+                            first_offset_at_or_after(timestamped, log_cutter.to_timestamp, file_size))
+                found = log_cutter.locate_window(log_file, file_size, parser)
+                if found != expected:
+                    mismatches.append({"search": "locate_window", "window": [from_date, to_date], "expected": expected, "found": found})
+            log_cutter = LogCutter(None, None, case["dest_path"], windows=windows, time_slack=case["slack"])
+            log_cutter.linear_scan_bytes = case["scan_bytes"]
+            expected = [(first_offset_at_or_after(timestamped, start, file_size), first_offset_at_or_after(timestamped, end, file_size))
+                        for start, end in log_cutter.windows]
+            found = log_cutter.locate_windows(log_file, file_size, parser)
+            if found != expected:
+                mismatches.append({"search": "locate_windows", "windows": windows, "expected": expected, "found": found})
+    return {"verified": case["verify"], "mismatches": mismatches}
+
+
+def run_case_in_process(case: dict) -> dict:
+    """Run one case in a fresh interpreter and return its measurements."""
+    output = subprocess.run([sys.executable, __file__, "--run-case", json.dumps(case)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def prepare_data(args: argparse.Namespace, log_format: str) -> dict:
+    """Generate the log file of a format once and reuse it while the generator arguments stay the same."""
+    name = (f"{log_format}_{args.size_mb:g}mb_{args.lines_per_second:g}lps_st{args.stack_trace_rate:g}"
+            f"_ooo{args.out_of_order_rate:g}.log")
+    path = Path(args.data_dir) / name
+    meta_path = path.with_suffix(".meta.json")
+    if path.exists() and meta_path.exists():
+        return json.loads(meta_path.read_text())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    print(f"Generating {path} ...", file=sys.stderr)
+    meta = generate(str(path), log_format=log_format, size_mb=args.size_mb, lines_per_second=args.lines_per_second,
+                    stack_trace_rate=args.stack_trace_rate, out_of_order_rate=args.out_of_order_rate)
+    meta_path.write_text(json.dumps(meta))
+    return meta
+
+
+def gzip_copy_of(meta: dict) -> str:
+    """Path of a gzip copy of a generated log, made once."""
+    gzip_path = meta["path"] + ".gz"
+    if not os.path.exists(gzip_path):
+        with open(meta["path"], "rb") as log_file, gzip.open(gzip_path + ".part", "wb", compresslevel=1) as gzip_file:
+            shutil.copyfileobj(log_file, gzip_file, 1024 * 1024)
+        os.replace(gzip_path + ".part", gzip_path)
+    return gzip_path
+
+
+def check_flat_rss(args: argparse.Namespace, port: int | None, buffer_size: int | None) -> bool:
+    """Run every mode on a log of --size-mb and on one --check-flat-rss times bigger.
+
+    The window is the same fraction of both files, so it grows with them too.
+    Returns False if the peak RSS of a mode grows more than --max-rss-growth-mb.
+    """
+    modes = ["local", "gzip_filter"] + (["remote"] if args.remote else []) + (["stream"] if args.remote and args.stream else [])
+    ok = True
+    for log_format in args.formats.split(","):
+        peaks = {}
+        for size_mb in (args.size_mb, args.size_mb * args.check_flat_rss):
+            meta = prepare_data(argparse.Namespace(**{**vars(args), "size_mb": size_mb}), log_format)
+            from_date, to_date = window_of(meta, args.window_fraction)
+            for mode in modes:
+                case = {"mode": mode, "path": os.path.abspath(gzip_copy_of(meta) if mode == "gzip_filter" else meta["path"]),
+                        "from_date": from_date, "to_date": to_date,
+                        "dest_path": os.path.abspath(os.path.join(args.data_dir, "out", mode)),
+                        "scan_bytes": int(args.scan_bytes.split(",")[0]), "slack": args.slack, "port": port,
+                        "buffer_size": buffer_size, "parse": False}
+                result = run_case_in_process(case)
+                peaks.setdefault(mode, []).append((size_mb, result["window_bytes"], result["peak_rss_mb"]))
+        for mode, ((small_mb, small_window, small_peak), (large_mb, large_window, large_peak)) in peaks.items():
+            growth = large_peak - small_peak
+            flag = ""
+            if growth > args.max_rss_growth_mb:
+                flag = "  <-- RSS GROWS WITH THE INPUT"
+                ok = False
+            print(f"{f'rss:{mode}:{log_format}':40} {small_mb:g} MB file ({small_window / 1024 / 1024:.1f} MB out) {small_peak:6.1f} MB -> "
+                  f"{large_mb:g} MB file ({large_window / 1024 / 1024:.1f} MB out) {large_peak:6.1f} MB ({growth:+.1f} MB){flag}")
+    return ok
+
+
+def finish_result(result: dict) -> dict:
+    result["copy_mb_per_s"] = result["window_bytes"] / (1024 * 1024) / max(result["copy_s"], 1e-9)
+    return {key: round(value, 4) if isinstance(value, float) else value for key, value in result.items()}
+
+
+def compare_with_baseline(results: dict, baseline: dict, max_regression: float) -> bool:
+    """Print the change of every metric against the baseline. Returns False if any metric regressed more than allowed."""
+    ok = True
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric, better in COMPARED_METRICS.items():
+            if metric not in result or metric not in baseline[key] or not baseline[key][metric]:
+                continue
+            ratio = result[metric] / baseline[key][metric]
+            regression = ratio - 1 if better == "lower" else 1 - ratio
+            flag = ""
+            if regression > max_regression:
+                flag = "  <-- REGRESSION"
+                ok = False
+            print(f"{key:40} {metric:18} {baseline[key][metric]:>12.4f} -> {result[metric]:>12.4f} ({ratio:6.2f}x){flag}")
+    return ok
+
+
+def main() -> int:
+    from LogCutter import LogCutter, buffer_size_for_memory_limit
+    parser = argparse.ArgumentParser(description="Benchmark log cutting.")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", default="bench_data", help="Directory for generated logs and cut outputs.")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="Comma-separated timestamp formats.")
+    parser.add_argument("--size-mb", type=float, default=64)
+    parser.add_argument("--lines-per-second", type=float, default=50.0)
+    parser.add_argument("--stack-trace-rate", type=float, default=0.02)
+    parser.add_argument("--out-of-order-rate", type=float, default=0.0)
+    parser.add_argument("--window-fraction", type=float, default=0.01, help="Part of the file's time span to cut.")
+    parser.add_argument("--slack", type=float, default=0.0, help="LogCutter time_slack: seconds lines can be out of order.")
+    parser.add_argument("--verify", type=int, metavar="N", help="Instead of timing, check the searches of N random windows against a linear scan.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed of --verify.")
+    parser.add_argument("--scan-bytes", default=str(LogCutter.linear_scan_bytes),
+                        help="Comma-separated LogCutter.linear_scan_bytes values to compare (default: the product's value).")
+    parser.add_argument("--remote", action="store_true", help="Also benchmark RemoteLogCutter against a local SSH stand-in server.")
+    parser.add_argument("--stream", action="store_true", help="With --remote, also benchmark the streaming remote mode (server_side_cut=False).")
+    parser.add_argument("--memory-limit-mb", type=float, help="Bound the buffers of the cutters as the memory_limit_mb setting does for one file at a time.")
+    parser.add_argument("--check-flat-rss", type=float, metavar="FACTOR",
+                        help="Instead of timing, check that the peak RSS of every mode stays flat on a log FACTOR times bigger than --size-mb.")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=16.0, help="Allowed peak RSS growth of --check-flat-rss.")
+    parser.add_argument("--output", help="Write the results as JSON.")
+    parser.add_argument("--save-baseline", help="Store the results as the baseline.")
+    parser.add_argument("--compare", help="Compare the results with a stored baseline.")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed relative regression when comparing (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    if args.run_case:
+        case = json.loads(args.run_case)
+        run_case = {"local": run_local_case, "remote": run_remote_case, "stream": run_stream_case, "gzip_filter": run_gzip_filter_case,
+                    "verify": run_verify_case}[case["mode"]]
+        result = run_case(case)
+        result["peak_rss_mb"] = peak_rss_mb()
+        print(json.dumps(result))
+        return 0
+
+    port = None
+    if args.remote:
+        from ssh_server import start_server
+        port = start_server()
+    buffer_size = buffer_size_for_memory_limit(args.memory_limit_mb, 1)
+    if args.check_flat_rss:
+        return 0 if check_flat_rss(args, port, buffer_size) else 1
+
+    results = {}
+    for log_format in args.formats.split(","):
+        meta = prepare_data(args, log_format)
+        from_date, to_date = window_of(meta, args.window_fraction)
+        if args.verify:
+            failed = False
+            for scan_bytes in (int(value) for value in args.scan_bytes.split(",")):
+                case = {"mode": "verify", "path": os.path.abspath(meta["path"]), "dest_path": os.path.abspath(os.path.join(args.data_dir, "out", "verify")),
+                        "scan_bytes": scan_bytes, "slack": args.slack, "verify": args.verify, "seed": args.seed}
+                result = run_case_in_process(case)
+                print(f"{f'verify:{log_format}:{scan_bytes}':40} {result['verified']} random window sets, {len(result['mismatches'])} mismatches")
+                for mismatch in result["mismatches"][:10]:
+                    print(f"    {json.dumps(mismatch)}")
+                failed = failed or bool(result["mismatches"])
+            if failed:
+                return 1
+            continue
+        for scan_bytes in (int(value) for value in args.scan_bytes.split(",")):
+            modes = ["local"] + (["remote"] if args.remote else []) + (["stream"] if args.remote and args.stream else [])
+            for mode in modes:
+                key = f"{mode}:{log_format}:{scan_bytes}"
+                case = {
+                    "mode": mode,
+                    "path": os.path.abspath(meta["path"]),
+                    "from_date": from_date,
+                    "to_date": to_date,
+                    "dest_path": os.path.abspath(os.path.join(args.data_dir, "out", mode)),
+                    "scan_bytes": scan_bytes,
+                    "slack": args.slack,
+                    "port": port,
+                    "buffer_size": buffer_size,
+                }
+                result = finish_result(run_case_in_process(case))
+                result["file_mb"] = round(meta["bytes"] / (1024 * 1024), 1)
+                results[key] = result
+                parse_rate = f"{result['parse_lines_per_s']:10.0f}" if "parse_lines_per_s" in result else f"{'-':>10}"
+                print(f"{key:40} locate {result['locate_s']:8.4f}s  copy {result['copy_s']:8.4f}s "
+                      f"({result['copy_mb_per_s']:8.1f} MB/s)  parse {parse_rate} lines/s  "
+                      f"window {result['window_bytes'] / 1024 / 1024:8.1f} MB  peak RSS {result['peak_rss_mb']:6.1f} MB")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=4))
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(results, indent=4))
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if not compare_with_baseline(results, baseline, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""Synthetic log generator for the LogHarvester benchmarks.
+
+Examples:
+    python benchmarks/generate_logs.py --format iso --size-mb 512 bench_data/iso.log
+    python benchmarks/generate_logs.py --format syslog --size-mb 20480 --stack-trace-rate 0.05 --out-of-order-rate 0.01 big.log
+"""
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+START_TIME = datetime(2025, 10, 9)
+LEVELS = ["INFO", "INFO", "INFO", "DEBUG", "WARN", "ERROR"]
+
+
+def _format_iso(t: datetime) -> str:
+    return f"{t:%Y-%m-%d %H:%M:%S}.{t.microsecond // 1000:03d}Z"
+
+
+def _format_iso_t(t: datetime) -> str:
+    return f"{t:%Y-%m-%dT%H:%M:%S}"
+
+
+def _format_human(t: datetime) -> str:
+    return f"{t:%b} {t.day}, {t.year} {t.hour % 12 or 12}:{t.minute:02d} {'PM' if t.hour >= 12 else 'AM'}"
+
+
+def _format_slash(t: datetime) -> str:
+    return f"{t:%m/%d/%Y %H:%M:%S}"
+
+
+def _format_syslog(t: datetime) -> str:
+    return f"{t:%b} {t.day:2d} {t:%H:%M:%S} node01 app[1234]:"
+
+
+def _format_clf(t: datetime) -> str:
+    return f'10.0.0.1 - - [{t:%d/%b/%Y:%H:%M:%S} +0000] "GET /api/items HTTP/1.1" 200 512'
+
+
+# Epoch logs hold real POSIX time: the generated times are local, like in the other formats
+def _format_epoch(t: datetime) -> str:
+    return f"{t.timestamp():.3f}"
+
+
+def _format_epoch_ms(t: datetime) -> str:
+    return f"{int(t.timestamp() * 1000)}"
+
+
+FORMATS = {
+    "iso": _format_iso,
+    "iso_t": _format_iso_t,
+    "human": _format_human,
+    "slash": _format_slash,
+    "syslog": _format_syslog,
+    "clf": _format_clf,
+    "epoch": _format_epoch,
+    "epoch_ms": _format_epoch_ms,
+}
+
+
+def generate(path: str, log_format: str = "iso", size_mb: float = 64, lines_per_second: float = 50.0,
+             stack_trace_rate: float = 0.0, stack_trace_lines: int = 30, out_of_order_rate: float = 0.0,
+             out_of_order_skew: float = 2.0, seed: int = 1) -> dict:
+    """Write a synthetic log file and return its metadata.
+
+    Args:
+        path (str): Output file.
+        log_format (str): One of FORMATS.
+        size_mb (float): Approximate size of the file.
+        lines_per_second (float): Average timestamp density.
+        stack_trace_rate (float): Probability that a line is followed by a multiline stack trace without timestamps.
+        stack_trace_lines (int): Maximum length of a stack trace.
+        out_of_order_rate (float): Probability that a line's timestamp is moved back by up to out_of_order_skew seconds.
+        seed (int): Random seed, the same arguments always give the same file.
+
+    Returns:
+        dict: {"path", "format", "bytes", "lines", "timestamped_lines", "first_time", "last_time"} (times in ISO format).
+    """
+    rng = random.Random(seed)
+    format_time = FORMATS[log_format]
+    target_bytes = int(size_mb * 1024 * 1024)
+    step = 1.0 / lines_per_second
+    t = START_TIME
+    written = lines = timestamped_lines = 0
+    buffer = []
+    buffered = 0
+    with open(path, "w", encoding="utf-8", newline="\n") as log_file:
+        while written + buffered < target_bytes:
+            t += timedelta(seconds=rng.uniform(0, 2 * step))
+            line_time = t
+            if out_of_order_rate and rng.random() < out_of_order_rate:
+                line_time = t - timedelta(seconds=rng.uniform(0, out_of_order_skew))
+            line = f"{format_time(line_time)} {rng.choice(LEVELS)} [worker-{rng.randint(1, 16)}] request {lines} handled in {rng.randint(1, 999)} ms\n"
+            buffer.append(line)
+            buffered += len(line)
+            lines += 1
+            timestamped_lines += 1
+            if stack_trace_rate and rng.random() < stack_trace_rate:
+                for frame in range(rng.randint(1, stack_trace_lines)):
+                    line = f"    at com.example.service.Handler.method{frame}(Handler.java:{rng.randint(1, 2000)})\n"
+                    buffer.append(line)
+                    buffered += len(line)
+                    lines += 1
+            if buffered >= 1024 * 1024:
+                log_file.write("".join(buffer))
+                written += buffered
+                buffer = []
+                buffered = 0
+        log_file.write("".join(buffer))
+        written += buffered
+    # Like a real log, the file was last modified when its last line was written (syslog year inference relies on it)
+    os.utime(path, (t.timestamp(), t.timestamp()))
+    return {
+        "path": path,
+        "format": log_format,
+        "bytes": written,
+        "lines": lines,
+        "timestamped_lines": timestamped_lines,
+        "first_time": START_TIME.isoformat(sep=" "),
+        "last_time": t.isoformat(sep=" "),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic log file for benchmarks.")
+    parser.add_argument("path")
+    parser.add_argument("--format", dest="log_format", choices=sorted(FORMATS), default="iso")
+    parser.add_argument("--size-mb", type=float, default=64)
+    parser.add_argument("--lines-per-second", type=float, default=50.0)
+    parser.add_argument("--stack-trace-rate", type=float, default=0.0)
+    parser.add_argument("--stack-trace-lines", type=int, default=30)
+    parser.add_argument("--out-of-order-rate", type=float, default=0.0)
+    parser.add_argument("--out-of-order-skew", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(generate(**vars(args)), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Minimal local SSH/SFTP server used as a stand-in for a remote host in the benchmarks.
+
+It accepts any username and password and serves the local filesystem read-only over SFTP,
+so RemoteLogCutter can be measured without a real sshd. Not meant for anything but benchmarks.
+"""
+import logging
+import os
+import socket
+import threading
+
+import paramiko
+
+
+class _Server(paramiko.ServerInterface):
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+
+class _ReadOnlyHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class _ReadOnlySFTPServer(paramiko.SFTPServerInterface):
+    def list_folder(self, path):
+        try:
+            entries = []
+            for name in os.listdir(path):
+                attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(path, name)))
+                attr.filename = name
+                entries.append(attr)
+            return entries
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            read_file = open(path, "rb")
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle = _ReadOnlyHandle(flags)
+        handle.readfile = read_file
+        handle.filename = path
+        return handle
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0) -> int:
+    """Start the server in daemon threads.
+
+    Returns:
+        int: The port it listens on.
+    """
+    # Clients closing their connections are expected, not worth a traceback
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    host_key = paramiko.RSAKey.generate(2048)
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(100)
+
+    def serve_connection(connection):
+        transport = paramiko.Transport(connection)
+        transport.add_server_key(host_key)
+        transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _ReadOnlySFTPServer)
+        transport.start_server(server=_Server())
+        while transport.is_active():
+            transport.join(1)
+
+    def accept_loop():
+        while True:
+            connection, _ = listener.accept()
+            threading.Thread(target=serve_connection, args=(connection,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return listener.getsockname()[1]
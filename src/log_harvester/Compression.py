@@ -0,0 +1,221 @@
+import io
+import os
+import queue
+import re
+import threading
+
+
+COMPRESSION_SUFFIXES = {
+    ".gz": "gzip",
+    ".bz2": "bz2",
+    ".xz": "xz",
+    ".zst": "zstd",
+}
+
+# Compressions of the cut logs and their suffixes
+OUTPUT_SUFFIXES = {
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+# Levels of the output compressions: fast enough to keep up with cutting
+GZIP_OUTPUT_LEVEL = 6
+ZSTD_OUTPUT_LEVEL = 3
+# Buffer of a compressed output, small writes are batched before they are handed to the compression thread
+COMPRESSED_OUTPUT_BUFFER_SIZE = 1024 * 1024
+# Buffers waiting for the compression thread of an output, it bounds the memory used when cutting is faster than compressing
+COMPRESSION_QUEUE_SIZE = 8
+
+# app.log, app.log.1, app.log.2.gz, app.log-20251009.zst, ...
+ROTATED_LOG_NAME = re.compile(r"\.log(?:[.-]\d+)*(?:\.(?:gz|bz2|xz|zst))?$")
+
+# Errors of reading a (possibly corrupted or truncated) compressed or plain log file.
+# Decompression errors are re-raised as OSError by DecompressionErrors.
+READ_ERRORS = (OSError, EOFError, ValueError)
+
+
+def compression_of(path: str) -> str | None:
+    """Return the compression of a file from its name ("gzip", "bz2", "xz", "zstd"), or None if it's plain text."""
+    for suffix, compression in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+
+def strip_compression_suffix(path: str) -> str:
+    """app.log.2.gz -> app.log.2"""
+    for suffix in COMPRESSION_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def is_log_file_name(name: str) -> bool:
+    """Check if a file name looks like a log or one of its rotations (compressed or not)."""
+    return ROTATED_LOG_NAME.search(name) is not None
+
+
+class DecompressionErrors(io.BufferedIOBase):
+    """Binary stream wrapper that turns library-specific decompression errors (lzma.LZMAError, zstd.ZstdError) into OSError."""
+
+    def __init__(self, stream, errors: tuple):
+        self.stream = stream
+        self.errors = errors
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        try:
+            return self.stream.read(size)
+        except self.errors as e:
+            raise OSError(f"Corrupted compressed data: {e}") from e
+
+    def readline(self, size: int = -1) -> bytes:
+        try:
+            return self.stream.readline(size)
+        except self.errors as e:
+            raise OSError(f"Corrupted compressed data: {e}") from e
+
+    def close(self) -> None:
+        self.stream.close()
+        super().close()
+
+
+def open_decompressed(fileobj, compression: str):
+    """Wrap a binary file object in a stream that decompresses it on the fly.
+
+    The compression modules are imported here, so they don't slow down the start when no compressed logs are cut.
+
+    Args:
+        fileobj: Binary file object with the compressed data (local or SFTP file).
+        compression (str): One of the values of COMPRESSION_SUFFIXES.
+
+    Returns:
+        A binary file object with readline() that yields the decompressed data.
+
+    Raises:
+        ValueError: The compression is unknown or its module is not installed.
+    """
+    if compression == "gzip":
+        import gzip
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if compression == "bz2":
+        import bz2
+        return bz2.BZ2File(fileobj, mode="rb")
+    if compression == "xz":
+        import lzma
+        return DecompressionErrors(lzma.LZMAFile(fileobj, mode="rb"), (lzma.LZMAError,))
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstandard module is not installed, .zst logs can't be read")
+        return DecompressionErrors(io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(fileobj)), (zstandard.ZstdError,))
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def open_compressor(fileobj, compression: str):
+    """Wrap a binary file object in a stream that compresses the data written to it.
+
+    Closing the returned stream finishes the compressed data but doesn't close fileobj.
+
+    Raises:
+        ValueError: The compression is unknown or its module is not installed.
+    """
+    if compression == "gzip":
+        import gzip
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=GZIP_OUTPUT_LEVEL)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstandard module is not installed, the output can't be compressed with zstd")
+        return zstandard.ZstdCompressor(level=ZSTD_OUTPUT_LEVEL).stream_writer(fileobj, closefd=False)
+    raise ValueError(f"Unknown output compression: {compression}")
+
+
+def check_output_compression(compression: str) -> None:
+    """Fail early, before anything is cut, if the output can't be compressed with compression.
+
+    Raises:
+        ValueError: The compression is unknown or its module is not installed.
+    """
+    open_compressor(io.BytesIO(), compression).close()
+
+
+class ThreadedCompressedWriter(io.RawIOBase):
+    """Write-only stream that compresses into a file in a worker thread.
+
+    zlib and zstd release the GIL while they compress, so cutting the next chunk of a log
+    overlaps with compressing the previous one instead of compression being a serial step.
+    Writes are queued in chunks of at most chunk_size bytes, so the queue holds at most
+    COMPRESSION_QUEUE_SIZE * chunk_size bytes however large the writes are.
+    """
+
+    def __init__(self, path: str, compression: str, chunk_size: int = COMPRESSED_OUTPUT_BUFFER_SIZE):
+        self._thread = None
+        self._chunk_size = chunk_size
+        self._file = open(path, "wb")
+        try:
+            self._compressor = open_compressor(self._file, compression)
+        except ValueError:
+            self._file.close()
+            os.remove(path)
+            raise
+        self._queue = queue.Queue(maxsize=COMPRESSION_QUEUE_SIZE)
+        self._error = None
+        self._thread = threading.Thread(target=self._compress, name=f"compress-{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self._error is not None:
+            raise OSError(f"Compressing the output failed: {self._error}") from self._error
+        # The caller may reuse its buffer, so the worker gets a copy
+        view = memoryview(data).cast("B")
+        for start in range(0, len(view), self._chunk_size):
+            self._queue.put(bytes(view[start:start + self._chunk_size]))
+        return len(view)
+
+    def _compress(self) -> None:
+        while (chunk := self._queue.get()) is not None:
+            if self._error is None:
+                try:
+                    self._compressor.write(chunk)
+                except Exception as e:
+                    # Keep draining the queue, so the writer is not blocked; write() or close() raise the error
+                    self._error = e
+
+    def close(self) -> None:
+        if self._thread is None:
+            # __init__ failed
+            super().close()
+            return
+        if self.closed:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self._compressor.close()
+        finally:
+            self._file.close()
+            super().close()
+        if self._error is not None:
+            raise OSError(f"Compressing the output failed: {self._error}") from self._error
+
+
+def open_compressed_output(path: str, compression: str, buffer_size: int = COMPRESSED_OUTPUT_BUFFER_SIZE):
+    """Open path for writing data compressed with compression ("gzip" or "zstd") in a worker thread.
+
+    Args:
+        buffer_size (int): Size of the write buffer and of the chunks queued for the compression thread.
+
+    Returns:
+        A buffered binary file object.
+
+    Raises:
+        ValueError: The compression is unknown or its module is not installed.
+    """
+    return io.BufferedWriter(ThreadedCompressedWriter(path, compression, buffer_size), buffer_size=buffer_size)
@@ -0,0 +1,333 @@
+import hashlib
+import io
+import json
+import logging # debug level is set in main.py
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from RunStats import RunStats
+
+# Bytes of the beginning of a remote file hashed to tell append-only growth from a rotated or rewritten file
+CACHE_HEAD_BYTES = 4096
+# Size of a single SFTP read request (paramiko's maximum)
+CACHE_REQUEST_SIZE = 32768
+# Buffer of the seekable view of a cached file. A probe of the binary search reads at least this much,
+# so it's also the smallest range fetched and cached for it
+CACHE_READ_BUFFER_SIZE = 64 * 1024
+# Bytes of pipelined SFTP reads in flight while fetching, they are buffered until they're written to the cache
+CACHE_FETCH_BATCH_SIZE = 8 * 1024 * 1024
+CACHE_VERSION = 1
+
+
+class DownloadCache():
+    """Persistent cache of the bytes downloaded from remote log files, bounded by an LRU byte budget.
+
+    Every remote file (host, port, path) has a sparse data file and a JSON entry with its size, mtime,
+    a hash of its head and the byte ranges downloaded so far. A repeated cut reads the cached ranges
+    from the disk and fetches only the missing ones, e.g. the edges of a wider window or the new tail
+    of a log that has grown. If the size and mtime of the remote file are unchanged, the entry is used as is;
+    if the file has grown and its head is the same, it's append-only growth and the cached ranges stay valid;
+    otherwise (rotated, truncated, rewritten) the entry is dropped.
+    The least recently used entries are evicted when the cached ranges exceed max_bytes (see `evict`).
+
+    Several readers (of one or several jobs, each with its own DownloadCache over the same directory) may open
+    the same entry at once: they share its ranges, and it's neither evicted nor dropped until the last one closes it.
+    """
+
+    _lock = threading.Lock()
+    # Entries open in this process, by data file: {"count" of readers, "entry" shared by them, "lock" of the entry}
+    _open_entries = {}
+
+    def __init__(self, cache_dir: str | Path, max_bytes: int):
+        """
+        Args:
+            cache_dir (str | Path): Directory of the cache, created if missing.
+            max_bytes (int): Budget of the cached bytes of all entries.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger("DownloadCache")
+
+    def open(self, remote_file, file_attr, hostname: str, port: int, path: str, stats: RunStats | None = None,
+             batch_size: int = CACHE_FETCH_BATCH_SIZE) -> "CachedRemoteFile":
+        """Open the cache entry of a remote file, validated against its current size and mtime.
+
+        Args:
+            remote_file (paramiko.SFTPFile): The remote file opened for reading.
+            file_attr (paramiko.SFTPAttributes): Its stat.
+            batch_size (int): Bytes of SFTP reads in flight while fetching.
+
+        Returns:
+            CachedRemoteFile: Seekable reader of the remote file that reads through the cache.
+        """
+        key = hashlib.sha1(f"{hostname}:{port}:{path}".encode()).hexdigest()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        data_path = self._data_path(key)
+        with self._lock:
+            shared = self._open_entries.setdefault(str(data_path), {"count": 0, "entry": None, "lock": threading.Lock()})
+            shared["count"] += 1
+        try:
+            with shared["lock"]:
+                entry = shared["entry"] if shared["entry"] is not None else self._load_entry(key)
+                if entry is not None and self._is_valid(entry, remote_file, file_attr):
+                    entry.update(size=file_attr.st_size, mtime=file_attr.st_mtime, last_used=time.time())
+                    shared["entry"] = entry
+                    data_file = open(data_path, "r+b")
+                elif shared["entry"] is None:
+                    # Drop the stale data, it's rewritten from scratch
+                    shared["entry"] = self._new_entry(remote_file, file_attr, hostname, port, path)
+                    open(data_path, "wb").close()
+                    data_file = open(data_path, "r+b")
+                else:
+                    data_file = None
+            if data_file is None:
+                # Rotated or rewritten while another reader still caches the old file: this one is cached in a private file
+                self.logger.debug(f"Cache entry of {path} is open for an older version of the file, not keeping this read")
+                private = {"count": 1, "entry": self._new_entry(remote_file, file_attr, hostname, port, path), "lock": threading.Lock()}
+                private_reader = _CachedRangeReader(self, None, private, tempfile.TemporaryFile(), remote_file, file_attr, stats, batch_size)
+        except BaseException:
+            self._release(key)
+            raise
+        if data_file is None:
+            self._release(key)
+            return CachedRemoteFile(private_reader)
+        return CachedRemoteFile(_CachedRangeReader(self, key, shared, data_file, remote_file, file_attr, stats, batch_size))
+
+    def _new_entry(self, remote_file, file_attr, hostname: str, port: int, path: str) -> dict:
+        return {"version": CACHE_VERSION, "host": hostname, "port": port, "path": path,
+                "head_hash": self._head_hash(remote_file, file_attr.st_size), "ranges": [],
+                "size": file_attr.st_size, "mtime": file_attr.st_mtime, "last_used": time.time()}
+
+    def _is_valid(self, entry: dict, remote_file, file_attr) -> bool:
+        """Whether the cached ranges of an entry are still the bytes of the remote file."""
+        if entry.get("version") != CACHE_VERSION:
+            return False
+        if entry["size"] == file_attr.st_size and entry["mtime"] == file_attr.st_mtime:
+            return True
+        # Append-only growth keeps the head, a rotated or rewritten file doesn't
+        if file_attr.st_size > entry["size"] and self._head_hash(remote_file, entry["size"]) == entry["head_hash"]:
+            self.logger.debug(f"Remote file {entry['path']} grew from {entry['size']} to {file_attr.st_size} bytes, keeping its cache")
+            return True
+        self.logger.debug(f"Remote file {entry['path']} was rotated or rewritten, dropping its cache")
+        return False
+
+    @staticmethod
+    def _head_hash(remote_file, size: int) -> str:
+        remote_file.seek(0)
+        return hashlib.sha1(remote_file.read(min(CACHE_HEAD_BYTES, size))).hexdigest()
+
+    def _data_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.data"
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _load_entry(self, key: str) -> dict | None:
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as entry_file:
+                return json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+
+    def _save_entry(self, key: str, entry: dict) -> None:
+        """Write the entry atomically."""
+        entry_path = self._entry_path(key)
+        tmp_path = entry_path.with_name(f"{entry_path.name}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as entry_file:
+                json.dump(entry, entry_file)
+            os.replace(tmp_path, entry_path)
+        except OSError as e:
+            self.logger.error(f"Error saving the cache entry of {entry['path']}: {e}")
+
+    def _release(self, key: str, shared: dict | None = None) -> None:
+        """Close a reader of an entry: save the shared entry (if given) while it's still open, so it can't be evicted
+        under the write, then release it for eviction once no reader has it open."""
+        if shared is not None:
+            with shared["lock"]:
+                self._save_entry(key, shared["entry"])
+        with self._lock:
+            open_entry = self._open_entries[str(self._data_path(key))]
+            open_entry["count"] -= 1
+            if open_entry["count"] == 0:
+                del self._open_entries[str(self._data_path(key))]
+
+    def evict(self) -> int:
+        """Remove the least recently used entries until the cached bytes fit into max_bytes. Open entries are kept.
+
+        Returns:
+            int: Cached bytes left.
+        """
+        entries = []
+        for entry_path in self.cache_dir.glob("*.json"):
+            entry = self._load_entry(entry_path.stem)
+            if entry is not None:
+                entries.append((entry.get("last_used", 0), entry_path.stem, sum(end - start for start, end in entry.get("ranges", []))))
+        total = sum(cached for _, _, cached in entries)
+        for _, key, cached in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with self._lock:
+                if str(self._data_path(key)) in self._open_entries:
+                    continue
+                for path in (self._entry_path(key), self._data_path(key)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        self.logger.error(f"Error evicting cache file {path}: {e}")
+            total -= cached
+            self.logger.debug(f"Evicted cache entry {key} ({cached} bytes)")
+        return total
+
+
+class _CachedRangeReader(io.RawIOBase):
+    """Raw seekable reader of a remote file: cached ranges come from the data file, missing ones are fetched and cached."""
+
+    def __init__(self, cache: DownloadCache, key: str | None, shared: dict, data_file, remote_file, file_attr, stats: RunStats | None,
+                 batch_size: int = CACHE_FETCH_BATCH_SIZE):
+        """
+        Args:
+            key (str): Key of the cache entry, None for a private reader that isn't kept in the cache.
+            shared (dict): The open entry shared with the other readers of the same file (see DownloadCache._open_entries).
+        """
+        self.cache = cache
+        self.key = key
+        self.shared = shared
+        self.data_file = data_file
+        self.remote_file = remote_file
+        self.file_attr = file_attr
+        self.stats = stats
+        self.size = file_attr.st_size
+        self.batch_size = batch_size
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(offset, 0)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        end = min(self.position + len(buffer), self.size)
+        if end <= self.position:
+            return 0
+        self.fetch([(self.position, end)])
+        self.data_file.seek(self.position)
+        read = self.data_file.readinto(memoryview(buffer)[:end - self.position])
+        self.position += read
+        return read
+
+    def missing(self, start: int, end: int) -> list[tuple[int, int]]:
+        """Ranges of [start, end) that are not cached."""
+        gaps = []
+        # Sorted, non-overlapping [start, end) ranges that are cached. The list is replaced, never changed in place
+        for cached_start, cached_end in self.shared["entry"]["ranges"]:
+            if cached_end <= start:
+                continue
+            if cached_start >= end:
+                break
+            if cached_start > start:
+                gaps.append((start, cached_start))
+            start = cached_end
+        if start < end:
+            gaps.append((start, end))
+        return gaps
+
+    def _add_range(self, start: int, end: int) -> None:
+        """Mark [start, end) as cached, merging it with the ranges it overlaps or touches."""
+        with self.shared["lock"]:
+            ranges = self.shared["entry"]["ranges"]
+            before = [cached_range for cached_range in ranges if cached_range[1] < start]
+            after = [cached_range for cached_range in ranges if cached_range[0] > end]
+            for cached_start, cached_end in ranges[len(before):len(ranges) - len(after)]:
+                start, end = min(start, cached_start), max(end, cached_end)
+            self.shared["entry"]["ranges"] = before + [[start, end]] + after
+
+    def fetch(self, ranges: list[tuple[int, int]]) -> int:
+        """Download the missing parts of the [start, end) ranges into the cache with pipelined SFTP reads, batch_size bytes at a time.
+
+        Returns:
+            int: Number of bytes downloaded.
+        """
+        gaps = [gap for start, end in ranges for gap in self.missing(start, min(end, self.size))]
+        chunks = [(offset, min(CACHE_REQUEST_SIZE, gap_end - offset))
+                  for gap_start, gap_end in gaps for offset in range(gap_start, gap_end, CACHE_REQUEST_SIZE)]
+        fetched = 0
+        if chunks:
+            batch_chunks = max(self.batch_size // CACHE_REQUEST_SIZE, 1)
+            for batch_start in range(0, len(chunks), batch_chunks):
+                batch = chunks[batch_start:batch_start + batch_chunks]
+                written = []
+                for (offset, _), data in zip(batch, self.remote_file.readv(batch)):
+                    self.data_file.seek(offset)
+                    self.data_file.write(data)
+                    written.append((offset, offset + len(data)))
+                    fetched += len(data)
+                # Flushed before the ranges are marked, the other readers of the entry read them through their own handles
+                self.data_file.flush()
+                for start, end in written:
+                    self._add_range(start, end)
+        if self.stats is not None:
+            requested = sum(min(end, self.size) - start for start, end in ranges if start < self.size)
+            self.stats.add(bytes_transferred=fetched, bytes_cached=max(requested - fetched, 0))
+        return fetched
+
+    def close(self) -> None:
+        if not self.closed:
+            self.data_file.close()
+            if self.key is not None:
+                self.cache._release(self.key, self.shared)
+        super().close()
+
+
+class CachedRemoteFile(io.BufferedReader):
+    """Seekable binary file over a remote file that reads through the DownloadCache.
+
+    It can be used instead of the paramiko.SFTPFile by LogCutter (probes, readline) and by RemoteLogCutter (readv, stat).
+    """
+
+    def __init__(self, raw: _CachedRangeReader):
+        super().__init__(raw, buffer_size=CACHE_READ_BUFFER_SIZE)
+
+    @property
+    def data_file(self):
+        """Local file with the cached bytes at their offsets in the remote file."""
+        return self.raw.data_file
+
+    def stat(self):
+        return self.raw.file_attr
+
+    def fetch(self, start: int, end: int) -> int:
+        """Cache bytes [start, end) of the remote file, downloading only what's missing.
+
+        Returns:
+            int: Number of bytes downloaded.
+        """
+        return self.raw.fetch([(start, end)])
+
+    def is_cached(self, start: int, end: int) -> bool:
+        """Whether all bytes of [start, end) are in the cache."""
+        return not self.raw.missing(start, min(end, self.raw.size))
+
+    def readv(self, chunks: list[tuple[int, int]]):
+        """Read (offset, length) chunks like paramiko.SFTPFile.readv: the missing bytes are fetched first, then all are read from the cache."""
+        self.raw.fetch([(offset, offset + length) for offset, length in chunks])
+        for offset, length in chunks:
+            self.raw.data_file.seek(offset)
+            yield self.raw.data_file.read(length)
@@ -0,0 +1,453 @@
+import logging # debug level is set in main.py
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from Compression import OUTPUT_SUFFIXES
+from Config import Config
+from LogCutter import LogCutter, buffer_size_for_memory_limit
+from LogFilter import LogFilter
+from RunStats import RunStats
+from TimestampParser import is_open_date
+
+logger = logging.getLogger("HarvestJob")
+
+# Bars of the preview sparkline, from the smallest to the largest bucket
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+# Width of the longest bar of a preview table
+PREVIEW_BAR_WIDTH = 30
+
+
+def parse_host_list(hosts: str, default_port: int = 22) -> list[tuple[str, int]]:
+    """Parse a comma-separated list of "host[:port]" entries.
+
+    Args:
+        hosts (str): E.g. "web1:2222, web2".
+        default_port (int): Port used when an entry has no port.
+
+    Returns:
+        list[tuple[str, int]]: (hostname, port) pairs.
+    """
+    parsed = []
+    for entry in hosts.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        hostname, _, port = entry.partition(":")
+        try:
+            parsed.append((hostname, int(port) if port else default_port))
+        except ValueError:
+            parsed.append((hostname, default_port))
+    return parsed
+
+
+def run_job(job: dict, configs: dict, stats: RunStats | None = None, on_data=None, stop_event: threading.Event | None = None) -> dict:
+    """Run one harvest job, the same way for the TUI and the headless CLI.
+
+    Job keys:
+        from_date, to_date (str): The date range to cut. to_date "now", "open" or empty leaves it open at the end.
+        windows (list): Several date ranges to cut in one pass instead of from_date/to_date: [from_date, to_date] pairs
+            or {"from_date", "to_date"} dicts. They are padded by the window_padding_seconds setting and merged where they overlap,
+            and the cut logs of every window go to its own subdirectory of dest_path (see LogCutter).
+        dest_path (str): Directory for the cut logs.
+        paths (list[str]): Log files or directories. For a remote job they are used for hosts without their own "paths".
+        hosts (list[dict]): Remote hosts ({"hostname", "port", "username", "password", "paths"}).
+            The job is local if the list is empty.
+        username, password (str): Credentials for hosts that don't have their own.
+        Any key of the settings file (local_workers, server_side_cut, ...) overrides the setting for this job.
+
+    paramiko is imported only for remote jobs, so local jobs start fast.
+    With the download_cache setting, remote bytes are cached under the settings directory (see DownloadCache).
+    The filter_levels, filter_keywords and filter_regexes settings keep only the matching entries of the windows (see LogFilter).
+    The output_compression setting writes every cut log compressed with gzip or zstd.
+    The memory_limit_mb setting sizes the buffers of the files cut at once to fit in it (see buffer_size_for_memory_limit),
+    the undecodable_bytes setting is what timestamp probes do with bytes that aren't UTF-8.
+    With the deadline_seconds setting, files that haven't started when it has passed are left out and listed
+    in the report, and the most relevant files are cut first (see Scheduler).
+    With the merge_output setting, all cut logs are merged by timestamp into one log (see LogMerger).
+    With the output_bundle setting, the cut logs are packed into one archive with a manifest while
+    the others are still being cut (see OutputBundle), then the loose logs are removed.
+    Unless the run_report setting is false, a JSON report of the run (see RunStats) is written into dest_path.
+    With the follow setting, to_date must be open ("now", "open" or empty): after the initial cut, the logs are
+    followed and new data is appended to the cut logs until stop_event is set (see LogFollower), then the job finishes as usual.
+
+    Args:
+        job (dict): The job spec.
+        configs (dict): Loaded settings (Config().configs).
+        stats (RunStats): Collects the counters and the per-file progress of the run, e.g. for the live progress table.
+        on_data: In follow mode, called with (host, path, data) for every chunk appended to a cut log, from a follower thread.
+        stop_event (threading.Event): Stops following. Without it, the job follows the logs forever.
+
+    Returns:
+        dict: {"mode": "local", "files", "cut", "seconds"} or {"mode": "remote", "hosts": per-host summary, "seconds"},
+            with "merged", "bundle" and "report" - the paths of the merged log, the bundle and the JSON report, if they were written,
+            and "expired" - the "host:path" of the files left out by the deadline, if any.
+
+    Raises:
+        ValueError: Unknown output or bundle compression, or its module is not installed, or an invalid filter regex,
+            or an invalid window, or an unknown undecodable_bytes policy, or follow mode with a closed to_date, several windows,
+            a bundle or a deadline, or a deadline that isn't positive.
+    """
+    settings = {**configs, **job}
+    check_job(job, settings)
+    follow = settings.get("follow", False)
+    if follow:
+        stop_event = stop_event if stop_event is not None else threading.Event()
+    stats = stats if stats is not None else RunStats()
+    started = time.monotonic()
+    hosts = job.get("hosts", [])
+    logs_cutter = make_job_cutter(job, settings, stats)
+    bundle = make_job_bundle(job, settings, logs_cutter)
+    if not hosts and follow:
+        from LogFollower import LocalLogFollower
+        follower = LocalLogFollower(logs_cutter, on_data, stop_event, settings.get("follow_poll_seconds", 2.0))
+        try:
+            results = follower.start(job.get("paths", []))
+        except BaseException:
+            follower.close()
+            raise
+        follower.follow()
+        result = {"mode": "local", "files": len(results), "cut": sum(1 for cut_path in results if cut_path),
+                  "seconds": round(time.monotonic() - started, 3)}
+    elif not hosts:
+        results = logs_cutter.cut_logs(
+            job.get("paths", []),
+            workers=settings.get("local_workers"),
+            chunksize=settings.get("local_chunksize", 1),
+        )
+        result = {"mode": "local", "files": len(results), "cut": sum(1 for cut_path in results if cut_path),
+                  "seconds": round(time.monotonic() - started, 3)}
+    else:
+        result = _harvest_hosts(job, settings, stats, logs_cutter, on_data, stop_event if follow else None)
+        result["seconds"] = round(time.monotonic() - started, 3)
+    return finish_job(result, job, settings, logs_cutter, bundle)
+
+
+def check_job(job: dict, settings: dict) -> None:
+    """Check the options of a job that can't be combined (see run_job).
+
+    Raises:
+        ValueError: Follow mode with a closed to_date, several windows, a bundle or a deadline, or a deadline that isn't positive.
+    """
+    deadline_seconds = settings.get("deadline_seconds")
+    if deadline_seconds is not None and deadline_seconds <= 0:
+        raise ValueError(f"The deadline must be a positive number of seconds, not {deadline_seconds}")
+    if settings.get("follow", False):
+        if job.get("windows"):
+            raise ValueError("Follow mode can't cut several windows")
+        if not is_open_date(job.get("to_date")):
+            raise ValueError("Follow mode needs an open to_date: \"now\", \"open\" or empty")
+        if settings.get("output_bundle"):
+            raise ValueError("Follow mode can't pack the cut logs into a bundle while they grow")
+        if deadline_seconds is not None:
+            raise ValueError("Follow mode can't have a deadline")
+
+
+def make_job_cutter(job: dict, settings: dict, stats: RunStats) -> LogCutter:
+    """LogCutter with the windows and the output options of a job (see run_job), reporting into stats.
+
+    Raises:
+        ValueError: Like run_job.
+    """
+    hosts = job.get("hosts", [])
+    windows = job.get("windows")
+    if windows:
+        logger.info(f"Running job: {len(windows)} window(s), {len(hosts) or 'local'} host(s), paths: {job.get('paths', [])}")
+    else:
+        logger.info(f"Running job: {job.get('from_date')} - {job.get('to_date')}, {len(hosts) or 'local'} host(s), paths: {job.get('paths', [])}")
+    # The bundle compresses the logs as a whole
+    output_compression = None if settings.get("output_bundle") else settings.get("output_compression")
+    deadline_seconds = settings.get("deadline_seconds")
+    return LogCutter(
+        from_date=job.get("from_date"),
+        to_date=job.get("to_date"),
+        dest_path=settings["dest_path"],
+        index_dir=Config().get_config_dir() / "index" if settings.get("use_index", False) else None,
+        stats=stats,
+        output_compression=output_compression,
+        log_filter=LogFilter.from_settings(settings),
+        windows=windows,
+        window_padding=settings.get("window_padding_seconds", 0),
+        time_slack=settings.get("time_slack_seconds", 0),
+        buffer_size=_buffer_size(settings),
+        undecodable=settings.get("undecodable_bytes", "replace"),
+        deadline=None if deadline_seconds is None else time.time() + deadline_seconds,
+    )
+
+
+def make_job_bundle(job: dict, settings: dict, log_cutter: LogCutter):
+    """OutputBundle of a job with the output_bundle setting, None without it.
+
+    The cut logs are added to it as soon as they're cut (see RunStats.on_file_cut).
+    """
+    if not settings.get("output_bundle"):
+        return None
+    from OutputBundle import OutputBundle
+    # With several windows, the manifest has the range that spans them
+    windows = job.get("windows")
+    bundle = OutputBundle(settings["dest_path"], job.get("from_date") or str(log_cutter.from_date),
+                          job.get("to_date") if not windows else str(log_cutter.to_date), settings["output_bundle"])
+    log_cutter.stats.on_file_cut = bundle.add_file_entry
+    return bundle
+
+
+def finish_job(result: dict, job: dict, settings: dict, log_cutter: LogCutter, bundle=None) -> dict:
+    """Postprocess the cut logs of a job: merge them, close the bundle and write the report (see run_job).
+
+    Returns:
+        dict: result with "merged", "bundle", "report" and "expired" added.
+    """
+    expired = [f"{entry['host']}:{entry['path']}" for entry in log_cutter.stats.snapshot()["files"] if entry["outcome"] == "expired"]
+    if expired:
+        logger.warning(f"{len(expired)} files were left out because the deadline passed: {', '.join(expired)}")
+        result["expired"] = expired
+    _merge_cut_logs(result, log_cutter, settings)
+    if bundle is not None:
+        for merged_path in _as_list(result.get("merged")):
+            bundle.add(merged_path)
+        try:
+            result["bundle"] = bundle.close()
+        except OSError as e:
+            logger.error(str(e))
+    return _with_report(result, job, settings, log_cutter.stats)
+
+
+def _harvest_hosts(job: dict, settings: dict, stats: RunStats, log_cutter: LogCutter, on_data=None,
+                   follow_stop_event: threading.Event | None = None) -> dict:
+    """Cut the logs of a remote job on all its hosts, with the output options of log_cutter.
+
+    With follow_stop_event, the logs are followed until it's set.
+    """
+    harvester = make_harvester(job, settings, stats, log_cutter)
+    if follow_stop_event is not None:
+        return {"mode": "remote", "hosts": harvester.follow(follow_stop_event, settings.get("follow_poll_seconds", 2.0), on_data)}
+    return {"mode": "remote", "hosts": harvester.harvest()}
+
+
+def make_harvester(job: dict, settings: dict, stats: RunStats, log_cutter: LogCutter):
+    """MultiHostHarvester of the hosts of a remote job, with the output options of log_cutter."""
+    from MultiHostHarvester import MultiHostHarvester
+    download_cache = None
+    if settings.get("download_cache", False):
+        from DownloadCache import DownloadCache
+        download_cache = DownloadCache(Config().get_config_dir() / "cache",
+                                       max_bytes=int(settings.get("download_cache_max_mb", 4096) * 1024 * 1024))
+    host_specs = [
+        {
+            "username": job.get("username", ""),
+            "password": job.get("password", ""),
+            "paths": job.get("paths", []),
+            **host,
+        }
+        for host in job["hosts"]
+    ]
+    return MultiHostHarvester(
+        from_date=job.get("from_date"),
+        to_date=job.get("to_date"),
+        dest_path=settings["dest_path"],
+        hosts=host_specs,
+        max_concurrent_transfers=settings.get("max_concurrent_transfers", 16),
+        max_workers_per_host=settings.get("remote_workers", 4),
+        retries=settings.get("remote_retries", 3),
+        server_side_cut=settings.get("server_side_cut", True),
+        stats=stats,
+        output_compression=log_cutter.output_compression,
+        log_filter=log_cutter.log_filter,
+        download_cache=download_cache,
+        recursive=settings.get("remote_recursive", False),
+        include_globs=settings.get("remote_include_globs"),
+        exclude_globs=settings.get("remote_exclude_globs"),
+        windows=job.get("windows"),
+        window_padding=settings.get("window_padding_seconds", 0),
+        time_slack=log_cutter.time_slack,
+        buffer_size=log_cutter.buffer_size,
+        undecodable=log_cutter.undecodable,
+        deadline=log_cutter.deadline,
+    )
+
+
+def _buffer_size(settings: dict) -> int | None:
+    """buffer_size of the cutters of a job that keeps the data of the files cut at once within the memory_limit_mb setting."""
+    if settings.get("hosts"):
+        files_at_once = min(settings.get("max_concurrent_transfers", 16), len(settings["hosts"]) * settings.get("remote_workers", 4))
+    else:
+        files_at_once = settings.get("local_workers") or os.cpu_count() or 1
+    return buffer_size_for_memory_limit(settings.get("memory_limit_mb"), files_at_once)
+
+
+def preview_job(job: dict, configs: dict, buckets: int | None = None, stats: RunStats | None = None) -> dict:
+    """Estimate how many lines and bytes of the job's logs fall into every time bucket of its date range, without copying them.
+
+    Every log is probed at a few byte offsets per bucket (see LogCutter.preview_histogram), remote logs
+    over SFTP like a server-side cut, so a preview costs about as much as locating the window.
+    With several windows, the buckets span all of them. Compressed rotations are not previewed.
+
+    Args:
+        job (dict): The job spec (see run_job).
+        configs (dict): Loaded settings (Config().configs).
+        buckets (int): Number of time buckets, the preview_buckets setting by default.
+        stats (RunStats): Collects the counters of the probes, cancelling it stops the preview (see JobEngine). A new one if not given.
+
+    Returns:
+        dict: {"mode", "edges": bucket edges in wall clock seconds, "files": preview of every log ({"host", "path", "size", "lines", "bytes"}),
+            "lines", "bytes": totals per bucket, "skipped": number of logs not previewed, "seconds"}, with "hosts" for a remote job.
+
+    Raises:
+        ValueError: An invalid date range or window.
+    """
+    settings = {**configs, **job}
+    stats = stats if stats is not None else RunStats()
+    started = time.monotonic()
+    log_cutter = LogCutter(
+        from_date=job.get("from_date"),
+        to_date=job.get("to_date"),
+        dest_path=settings["dest_path"],
+        stats=stats,
+        windows=job.get("windows"),
+        window_padding=settings.get("window_padding_seconds", 0),
+        time_slack=settings.get("time_slack_seconds", 0),
+        buffer_size=_buffer_size(settings),
+        undecodable=settings.get("undecodable_bytes", "replace"),
+    )
+    edges = log_cutter.preview_bucket_edges(buckets or settings.get("preview_buckets", 24))
+    result = {"mode": "remote" if job.get("hosts") else "local", "edges": edges}
+    if job.get("hosts"):
+        result["hosts"], previews = make_harvester(job, settings, stats, log_cutter).preview(edges)
+        files_found = stats.counters["files_found"]
+    else:
+        previews = log_cutter.preview_logs(job.get("paths", []), edges)
+        files_found = len(previews)
+        previews = [preview for preview in previews if preview is not None]
+    result.update(
+        files=previews,
+        lines=[sum(bucket) for bucket in zip(*(preview["lines"] for preview in previews))] or [0] * (len(edges) - 1),
+        bytes=[sum(bucket) for bucket in zip(*(preview["bytes"] for preview in previews))] or [0] * (len(edges) - 1),
+        skipped=files_found - len(previews),
+        seconds=round(time.monotonic() - started, 3),
+    )
+    return result
+
+
+def sparkline(values: list[int]) -> str:
+    """One bar character per value, scaled to the largest one. Zero values are blank."""
+    largest = max(values, default=0)
+    if not largest:
+        return " " * len(values)
+    return "".join(SPARK_CHARS[round(value * (len(SPARK_CHARS) - 1) / largest)] if value else " " for value in values)
+
+
+def format_wall_time(timestamp: float) -> str:
+    """Wall clock seconds (see TimestampParser.wall_seconds) as a date string the date fields accept."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def preview_rows(preview: dict) -> list[tuple[str, str, str, str, str]]:
+    """Rows of the preview table: (from, to, estimated lines, MB, bar) for every bucket."""
+    largest = max(preview["lines"], default=0)
+    rows = []
+    for bucket, (lines, nbytes) in enumerate(zip(preview["lines"], preview["bytes"])):
+        bar = "█" * round(lines * PREVIEW_BAR_WIDTH / largest) if largest else ""
+        rows.append((format_wall_time(preview["edges"][bucket]), format_wall_time(preview["edges"][bucket + 1]),
+                     f"~{lines:,}", f"{nbytes / (1024 * 1024):.2f}", bar))
+    return rows
+
+
+def format_preview(preview: dict) -> str:
+    """Human-readable preview: the sparkline, a table of the buckets and the totals."""
+    lines = [f"[{sparkline(preview['lines'])}]", f"{'From':<19}  {'To':<19}  {'Lines':>12}  {'MB':>9}"]
+    lines += [f"{start:<19}  {end:<19}  {count:>12}  {mb:>9}  {bar}" for start, end, count, mb, bar in preview_rows(preview)]
+    summary = (f"Total: ~{sum(preview['lines']):,} lines, {sum(preview['bytes']) / (1024 * 1024):.1f} MB "
+               f"in {len(preview['files'])} logs ({preview['seconds']:.1f}s)")
+    if preview["skipped"]:
+        summary += f", {preview['skipped']} compressed or unreadable logs not previewed"
+    lines.append(summary)
+    if preview["mode"] == "remote":
+        lines += [f"{label}: {status['error']}" for label, status in preview["hosts"].items() if status["status"] != "ok"]
+    return "\n".join(lines)
+
+
+def _merge_cut_logs(result: dict, log_cutter: LogCutter, settings: dict) -> None:
+    """Merge the cut logs of a finished job into one log if the merge_output setting is on.
+
+    With several windows, the cut logs of every window are merged into a log in its subdirectory,
+    and "merged" of the result is the list of these logs.
+    The merge_tag setting prefixes every merged line with its source: "host", "file" or nothing (null).
+    """
+    if not settings.get("merge_output", False):
+        return
+    from LogMerger import MERGED_FILE_NAME, LogMerger
+    tag_mode = settings.get("merge_tag")
+    inputs = {window_name: [] for window_name in log_cutter.window_names}
+    for entry in log_cutter.stats.snapshot()["files"]:
+        if not entry["dest"]:
+            continue
+        tag = None
+        if tag_mode == "host":
+            tag = entry["host"]
+        elif tag_mode == "file":
+            file_name = os.path.basename(entry["path"])
+            tag = file_name if result["mode"] == "local" else f"{entry['host']}:{file_name}"
+        for dest in _as_list(entry["dest"]):
+            window_name = os.path.basename(os.path.dirname(dest)) if len(log_cutter.window_names) > 1 else None
+            inputs[window_name].append((dest, tag))
+    merged_paths = []
+    for window_name, window_inputs in inputs.items():
+        if not window_inputs:
+            continue
+        merged_dir = settings["dest_path"] if window_name is None else os.path.join(settings["dest_path"], window_name)
+        merged_path = os.path.join(merged_dir, MERGED_FILE_NAME) + OUTPUT_SUFFIXES.get(log_cutter.output_compression, "")
+        try:
+            # With several hosts, the cut logs of a window are in the host subdirectories only
+            os.makedirs(merged_dir, exist_ok=True)
+            LogMerger(log_cutter).merge(window_inputs, merged_path)
+            merged_paths.append(merged_path)
+        except OSError as e:
+            logger.error(f"Error merging the cut logs into {merged_path}: {e}")
+    if merged_paths:
+        result["merged"] = merged_paths if len(log_cutter.window_names) > 1 else merged_paths[0]
+
+
+def _as_list(paths: str | list[str] | None) -> list[str]:
+    """Paths of a cut result or a merged result, which is a list with several windows."""
+    if paths is None:
+        return []
+    return paths if isinstance(paths, list) else [paths]
+
+
+def _with_report(result: dict, job: dict, settings: dict, stats: RunStats) -> dict:
+    """Write the JSON report of a finished job and add its path to the result. Passwords are left out of the report."""
+    if not settings.get("run_report", True):
+        return result
+    job = {key: value for key, value in job.items() if key != "password"}
+    job["hosts"] = [{key: value for key, value in host.items() if key != "password"} for host in job.get("hosts", [])]
+    try:
+        result["report"] = stats.write_report(settings["dest_path"], {"job": job, "result": dict(result)})
+    except OSError as e:
+        logger.error(f"Error writing the run report into {settings['dest_path']}: {e}")
+    return result
+
+
+def job_succeeded(result: dict) -> bool:
+    """A job failed if any of its hosts failed."""
+    if result["mode"] == "remote":
+        return all(status["status"] == "ok" for status in result["hosts"].values())
+    return True
+
+
+def format_job_summary(result: dict) -> str:
+    """Human-readable summary of a job result."""
+    if result["mode"] == "remote":
+        from MultiHostHarvester import MultiHostHarvester
+        summary = MultiHostHarvester.format_summary(result["hosts"])
+    else:
+        summary = f"localhost: {result['cut']}/{result['files']} files cut in {result['seconds']:.1f}s"
+    if result.get("expired"):
+        summary += f"\n{len(result['expired'])} files left out by the deadline"
+    if result.get("merged") and not result.get("bundle"):
+        summary += "".join(f"\nMerged log: {merged_path}" for merged_path in _as_list(result["merged"]))
+    if result.get("bundle"):
+        summary += f"\nBundle: {result['bundle']}"
+    if result.get("report"):
+        summary += f"\nReport: {result['report']}"
+    return summary
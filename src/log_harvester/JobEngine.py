@@ -0,0 +1,405 @@
+import asyncio
+import heapq
+import itertools
+import logging # debug level is set in main.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+
+from HarvestJob import (check_job, finish_job, format_job_summary, job_succeeded, make_harvester, make_job_bundle, make_job_cutter, preview_job,
+                        run_job)
+from LogCutter import LogCutter
+from RunStats import JobCancelled, RunStats
+from Scheduler import JobSchedule
+
+# Stages of a job, in the order a file goes through them
+STAGES = ("discovery", "locate", "transfer", "copy", "postprocess")
+# Steps of a stage running at once, across all jobs of an engine, where the stage_limits setting doesn't set them.
+# None: max_concurrent_transfers for transfer, local_workers (or the number of CPUs) for copy
+DEFAULT_STAGE_LIMITS = {"discovery": 4, "locate": 8, "transfer": None, "copy": None, "postprocess": 1}
+# Jobs running at once where the max_running_jobs setting doesn't set it, the others are queued
+DEFAULT_MAX_RUNNING_JOBS = 2
+# States of a job, the last three are final
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+
+
+class EngineJob():
+    """A job submitted to a JobEngine: its spec, state and live stats, and its result once it's done."""
+
+    def __init__(self, job_id: int, job: dict, follow: bool, preview: bool = False):
+        self.id = job_id
+        self.job = job
+        self.follow = follow
+        # A preview of the job (see preview_job) instead of a copy, its result is the preview
+        self.preview = preview
+        self.state = "queued"
+        self.stats = RunStats()
+        # The result of run_job (or preview_job), None until the job is done
+        self.result = None
+        self.error = ""
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        # Stops following the logs of a followed job
+        self.stop_event = threading.Event()
+        self.task = None
+
+    @property
+    def done(self) -> bool:
+        return self.state in ("done", "failed", "cancelled")
+
+    def label(self) -> str:
+        """Short description of the job: its date range or its number of windows."""
+        prefix = "preview " if self.preview else ""
+        if self.job.get("windows"):
+            return f"{prefix}{len(self.job['windows'])} windows"
+        return f"{prefix}{self.job.get('from_date') or ''} - {self.job.get('to_date') or 'open'}"
+
+    def summary(self) -> str:
+        """Human-readable outcome of a finished job (see format_job_summary). Empty for a finished preview, its result is the summary."""
+        if self.result is not None:
+            return "" if self.preview else format_job_summary(self.result)
+        return "Cancelled" if self.state == "cancelled" else self.error
+
+
+class JobEngine():
+    """Runs harvest jobs as graphs of asyncio tasks on the running event loop, e.g. the one of the TUI.
+
+    A job discovers its files (on every host of a remote job), then every file goes through its steps:
+    locate and copy for a local log, locate and transfer (and copy from the download cache) for a remote one,
+    a single transfer or copy step for a log cut while it's streamed. The job ends with a postprocess step (see finish_job).
+    A step waits for a slot of its stage: steps of a stage run at once up to its limit across all jobs of the engine,
+    and the steps of a remote host up to remote_workers. Free slots go to the waiting steps in the order of their
+    priority (see JobSchedule): the largest expected work first, balanced across hosts, or the most relevant files first
+    for jobs with a deadline, the earliest deadline first. Blocking work runs on a pool of threads - the SFTP
+    requests (paramiko is synchronous) and the file I/O - and copies that parse every line (filters, compressed rotations)
+    run in worker processes, so the event loop only schedules and the interface doesn't freeze.
+
+    Jobs run at once up to max_running_jobs, the rest wait in the queue. A cancelled job drops its steps waiting for a slot,
+    and its running steps stop at their next progress report (see RunStats.cancel). A followed job runs
+    like run_job on its own thread, outside of the stage limits, and cancelling it stops following.
+    A preview job (see preview_job) runs on its own thread as well, and cancelling it stops its probes at the next file.
+    """
+
+    def __init__(self, configs: dict, stage_limits: dict | None = None, max_running_jobs: int | None = None):
+        """
+        Args:
+            configs (dict): Loaded settings (Config().configs), the defaults of every job.
+            stage_limits (dict): Steps of a stage running at once, by stage (see STAGES). The stage_limits setting by default.
+            max_running_jobs (int): Jobs running at once. The max_running_jobs setting by default.
+
+        Raises:
+            ValueError: An unknown stage.
+        """
+        self.configs = configs
+        limits = dict(DEFAULT_STAGE_LIMITS)
+        for stage, limit in {**(configs.get("stage_limits") or {}), **(stage_limits or {})}.items():
+            if stage not in STAGES:
+                raise ValueError(f"Unknown stage {stage!r}, expected one of {', '.join(STAGES)}")
+            if limit is not None:
+                limits[stage] = limit
+        if limits["transfer"] is None:
+            limits["transfer"] = configs.get("max_concurrent_transfers", 16)
+        if limits["copy"] is None:
+            limits["copy"] = configs.get("local_workers") or os.cpu_count() or 1
+        self.stage_limits = {stage: max(1, int(limit)) for stage, limit in limits.items()}
+        self.max_running_jobs = max(1, max_running_jobs or configs.get("max_running_jobs") or DEFAULT_MAX_RUNNING_JOBS)
+        self.jobs = {}
+        self.logger = logging.getLogger("JobEngine")
+        self._next_id = 1
+        self._stage_slots = {stage: _PrioritySlots(limit) for stage, limit in self.stage_limits.items()}
+        self._job_slots = asyncio.Semaphore(self.max_running_jobs)
+        # A running step holds one thread, so the steps never wait for a thread
+        self._threads = ThreadPoolExecutor(max_workers=sum(self.stage_limits.values()), thread_name_prefix="engine")
+        self._processes = None
+
+    def submit(self, job: dict, on_data=None, preview: bool = False) -> EngineJob:
+        """Queue a job. It must be called from the event loop.
+
+        Args:
+            job (dict): The job spec (see run_job).
+            on_data: For a followed job, called with (host, path, data) for every chunk appended to a cut log, from a follower thread.
+            preview (bool): Preview the job instead of copying its logs, the result of the job is the preview (see preview_job).
+
+        Returns:
+            EngineJob: The queued job, its task finishes with it.
+        """
+        engine_job = EngineJob(self._next_id, job, not preview and {**self.configs, **job}.get("follow", False), preview)
+        self._next_id += 1
+        self.jobs[engine_job.id] = engine_job
+        engine_job.task = asyncio.get_running_loop().create_task(self._run(engine_job, on_data))
+        return engine_job
+
+    async def run(self, job: dict, on_data=None, preview: bool = False) -> EngineJob:
+        """Submit a job and wait until it's finished."""
+        engine_job = self.submit(job, on_data, preview)
+        await engine_job.task
+        return engine_job
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued or running job. A running followed job stops following and finishes like a normal job.
+
+        Returns:
+            bool: False if there's no such job or it has finished already.
+        """
+        engine_job = self.jobs.get(job_id)
+        if engine_job is None or engine_job.done:
+            return False
+        engine_job.stop_event.set()
+        if not engine_job.follow or engine_job.state == "queued":
+            engine_job.stats.cancel()
+            engine_job.task.cancel()
+        return True
+
+    def active_jobs(self) -> list[EngineJob]:
+        """Queued and running jobs, the oldest first."""
+        return [engine_job for engine_job in self.jobs.values() if not engine_job.done]
+
+    async def close(self) -> None:
+        """Cancel the unfinished jobs, wait for them and stop the workers."""
+        for engine_job in self.active_jobs():
+            self.cancel(engine_job.id)
+        await asyncio.gather(*(engine_job.task for engine_job in self.jobs.values()), return_exceptions=True)
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, engine_job: EngineJob, on_data) -> None:
+        try:
+            async with self._job_slots:
+                engine_job.state = "running"
+                engine_job.started = time.time()
+                engine_job.result = await self._harvest(engine_job, on_data)
+            engine_job.state = "done" if job_succeeded(engine_job.result) else "failed"
+        except (asyncio.CancelledError, JobCancelled):
+            engine_job.state = "cancelled"
+            self.logger.info(f"Job {engine_job.id} was cancelled")
+        except ValueError as e:
+            engine_job.state = "failed"
+            engine_job.error = f"Invalid job: {e}"
+            self.logger.error(f"Invalid job {engine_job.id}: {e}")
+        except Exception as e:
+            engine_job.state = "failed"
+            engine_job.error = str(e)
+            self.logger.exception(f"Job {engine_job.id} failed: {e}")
+        finally:
+            engine_job.finished = time.time()
+
+    async def _harvest(self, engine_job: EngineJob, on_data) -> dict:
+        """The task graph of a job. Returns the result of the job, like run_job."""
+        job = engine_job.job
+        if engine_job.preview:
+            preview = await asyncio.to_thread(preview_job, job, self.configs, None, engine_job.stats)
+            # The hosts of a remote preview catch the cancellation like any error
+            engine_job.stats.check_cancelled()
+            return preview
+        settings = {**self.configs, **job}
+        check_job(job, settings)
+        if engine_job.follow:
+            return await asyncio.to_thread(run_job, job, self.configs, engine_job.stats, on_data, engine_job.stop_event)
+        started = time.monotonic()
+        log_cutter = make_job_cutter(job, settings, engine_job.stats)
+        bundle = make_job_bundle(job, settings, log_cutter)
+        schedule = JobSchedule(log_cutter.deadline)
+        if job.get("hosts"):
+            result = await self._harvest_hosts(job, settings, log_cutter, schedule)
+        else:
+            result = await self._harvest_local(job, log_cutter, schedule)
+        result["seconds"] = round(time.monotonic() - started, 3)
+        return await self._step("postprocess", finish_job, result, job, settings, log_cutter, bundle, priority=schedule.priority())
+
+    async def _harvest_local(self, job: dict, log_cutter: LogCutter, schedule: JobSchedule) -> dict:
+        scheduled_files = await self._step("discovery", log_cutter.queue_log_files, job.get("paths", []), priority=schedule.priority())
+        schedule.add("localhost", scheduled_files)
+        results = await asyncio.gather(*(self._cut_local_file(log_cutter, schedule, scheduled_file) for scheduled_file in scheduled_files))
+        return {"mode": "local", "files": len(results), "cut": sum(1 for cut_path in results if cut_path)}
+
+    async def _cut_local_file(self, log_cutter: LogCutter, schedule: JobSchedule, scheduled_file: dict) -> str | list[str] | None:
+        stats = log_cutter.stats
+        log_file = scheduled_file["path"]
+        # The priority is taken when a step is queued, it changes as the job goes on
+        priority = partial(schedule.priority, "localhost", scheduled_file)
+        if scheduled_file["compressed"]:
+            # Decompressing and matching every line is CPU-bound
+            try:
+                result, stats_snapshot = await self._process_step("copy", log_cutter.cut_log_file_in_worker, log_file, priority=priority())
+            finally:
+                schedule.finished("localhost", scheduled_file)
+            await self._in_thread(stats.merge, stats_snapshot)
+            return result
+        steps = _FileSteps(stats, log_file)
+        try:
+            located = await self._step("locate", steps.run, log_cutter.locate_log_file, log_file, priority=priority())
+            if located is None:
+                return None
+            schedule.located("localhost", scheduled_file, located["window_bytes"])
+            if log_cutter.log_filter is None:
+                # The kernel copies the bytes, the thread only waits
+                return await self._step("copy", steps.run, log_cutter.copy_located, located, priority=priority())
+            # The filter matches every entry of the windows
+            result, entry, stats_snapshot = await self._process_step("copy", log_cutter.copy_located_in_worker, located, priority=priority())
+            steps.merge_worker_step(entry, stats_snapshot)
+            return result
+        finally:
+            schedule.finished("localhost", scheduled_file)
+            await self._in_thread(steps.end)
+
+    async def _harvest_hosts(self, job: dict, settings: dict, log_cutter: LogCutter, schedule: JobSchedule) -> dict:
+        harvester = make_harvester(job, settings, log_cutter.stats, log_cutter)
+        statuses = await asyncio.gather(*(self._harvest_host(harvester, host, schedule) for host in harvester.hosts))
+        summary = dict(zip((harvester.host_label(host) for host in harvester.hosts), statuses))
+        self.logger.info(f"Harvest finished:\n{harvester.format_summary(summary)}")
+        return {"mode": "remote", "hosts": summary}
+
+    async def _harvest_host(self, harvester, host: dict, schedule: JobSchedule) -> dict:
+        """Discover and cut the logs of a host. Returns its status, like MultiHostHarvester.harvest."""
+        label = harvester.host_label(host)
+        started = time.monotonic()
+        status = {"status": "failed", "files": 0, "cut": 0, "seconds": 0.0, "error": ""}
+        remote_lc = None
+        try:
+            remote_lc = await self._step("discovery", harvester.make_remote_cutter, host, priority=schedule.priority())
+            # The stage limits cap the transfers instead of the slots of the harvester
+            remote_lc.transfer_slots = None
+            log_cutter = remote_lc.make_log_cutter()
+            scheduled_files = await self._step("discovery", remote_lc.queue_log_files, list(host.get("paths", [])), log_cutter,
+                                               priority=schedule.priority())
+            schedule.add(label, scheduled_files)
+            # Every worker of a host uses its own SFTP channel
+            host_slots = _PrioritySlots(remote_lc.max_workers)
+            results = await asyncio.gather(*(self._cut_remote_file(remote_lc, log_cutter, schedule, label, scheduled_file, host_slots)
+                                             for scheduled_file in scheduled_files))
+            status.update(status="ok", files=len(results), cut=sum(1 for result in results if result))
+        except JobCancelled:
+            raise
+        except Exception as e:
+            self.logger.error(f"Harvesting logs from {label} failed: {e}")
+            status["error"] = str(e)
+        finally:
+            if remote_lc is not None:
+                await self._in_thread(self._close_host, remote_lc)
+        status["seconds"] = round(time.monotonic() - started, 3)
+        return status
+
+    async def _cut_remote_file(self, remote_lc, log_cutter: LogCutter, schedule: JobSchedule, label: str, scheduled_file: dict,
+                               host_slots: "_PrioritySlots") -> str | list[str] | None:
+        log_file = scheduled_file["path"]
+        steps = _FileSteps(log_cutter.stats, log_file, remote_lc.hostname)
+
+        async def host_step(stage: str, function, *args):
+            # The priority is taken when the step is queued, it changes as the job goes on
+            return await self._step(stage, steps.run, remote_lc.retry, function, log_file, *args,
+                                    host_slots=host_slots, priority=schedule.priority(label, scheduled_file))
+
+        try:
+            if remote_lc.streams(log_file):
+                return await host_step("transfer", remote_lc.cut_streaming, log_cutter, log_file)
+            located = await host_step("locate", remote_lc.locate_on_server, log_cutter, log_file)
+            if located is None:
+                return None
+            schedule.located(label, scheduled_file, located["window_bytes"])
+            if remote_lc.download_cache is None:
+                return await host_step("transfer", remote_lc.download_located, log_cutter, located)
+            # The transfer slot is freed before the windows are copied from the cache on the local disk
+            fetched = await host_step("transfer", remote_lc.fetch_located, located)
+            if fetched is None:
+                return None
+            return await host_step("copy", remote_lc.copy_cached, log_cutter, fetched)
+        finally:
+            schedule.finished(label, scheduled_file)
+            await self._in_thread(steps.end)
+
+    @staticmethod
+    def _close_host(remote_lc) -> None:
+        remote_lc.clean_up()
+        remote_lc.close()
+
+    async def _step(self, stage: str, function, *args, host_slots: "_PrioritySlots | None" = None, priority: tuple = ()):
+        """Run function(*args) on the thread pool once a slot of its stage (and of its host) is free for its priority."""
+        if host_slots is None:
+            async with self._stage_slots[stage].slot(priority):
+                return await self._in_thread(function, *args)
+        async with host_slots.slot(priority), self._stage_slots[stage].slot(priority):
+            return await self._in_thread(function, *args)
+
+    async def _process_step(self, stage: str, function, *args, priority: tuple = ()):
+        """Run function(*args) in a worker process once a slot of its stage is free for its priority."""
+        async with self._stage_slots[stage].slot(priority):
+            if self._processes is None:
+                # Imported here: multiprocessing is slow to import and not needed for plain copies
+                from concurrent.futures import ProcessPoolExecutor
+                self._processes = ProcessPoolExecutor(max_workers=self.stage_limits["copy"])
+            return await asyncio.get_running_loop().run_in_executor(self._processes, partial(function, *args))
+
+    async def _in_thread(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._threads, partial(function, *args))
+
+
+class _PrioritySlots():
+    """An asyncio semaphore that gives a free slot to the waiter with the lowest priority key, then to the earliest one."""
+
+    def __init__(self, slots: int):
+        self._free = slots
+        # (priority, arrival, future) of the waiters
+        self._waiters = []
+        self._arrivals = itertools.count()
+
+    @asynccontextmanager
+    async def slot(self, priority: tuple = ()):
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                # A slot handed over right before the cancellation goes to the next waiter
+                if future.done() and not future.cancelled():
+                    self._release()
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        """Hand the slot over to the first waiter that's still waiting, or free it."""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._free += 1
+
+
+class _FileSteps():
+    """The steps of a file, possibly on different threads. The first step that runs begins its entry in the stats."""
+
+    def __init__(self, stats: RunStats, path: str, host: str = "localhost"):
+        self.stats = stats
+        self.path = path
+        self.host = host
+        self.entry = None
+
+    def run(self, function, *args):
+        """Run a step of the file as the current file of the thread."""
+        if self.entry is None:
+            self.entry = self.stats.begin_file(self.path, host=self.host)
+        with self.stats.resume_file(self.entry):
+            return function(*args)
+
+    def merge_worker_step(self, entry: dict, stats_snapshot: dict) -> None:
+        """Take over the outcome and the stats of a step that ran in a worker process (see LogCutter.copy_located_in_worker)."""
+        self.stats.merge(stats_snapshot)
+        self.entry.update(total_bytes=entry["total_bytes"], done_bytes=entry["done_bytes"])
+        with self.stats.resume_file(self.entry):
+            self.stats.file_outcome(entry["outcome"] or "empty", entry["dest"])
+
+    def end(self) -> None:
+        """Count the outcome of the file if any of its steps ran."""
+        if self.entry is not None:
+            self.stats.end_file(self.entry)
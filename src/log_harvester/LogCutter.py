@@ -1,227 +1,1190 @@
+import bisect
 import os
 import re
-from dateutil import parser as date_parser
-from dateutil.parser import ParserError
+import time
 import logging # debug level is set in main.py
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from itertools import chain
+from Compression import (COMPRESSED_OUTPUT_BUFFER_SIZE, COMPRESSION_QUEUE_SIZE, OUTPUT_SUFFIXES, READ_ERRORS, check_output_compression,
+                         compression_of, open_compressed_output, open_decompressed, strip_compression_suffix)
+from LogFilter import LogFilter
+from RunStats import RunStats
+from Scheduler import schedule_files
+from TimestampParser import (DETECTION_SAMPLE_LINES, GenericTimestampParser, check_undecodable_policy, detect_timestamp_parser,
+                             is_open_date, parse_date, posix_to_wall, read_sample_lines, wall_seconds)
 
 
-# Example date strings to parse
-dates = [
-    "2025-10-09 15:30:45",
-    "Oct 9, 2025 3:30 PM",
-    "09/10/2025 15:30:45",
-    "2025-10-09T15:30:45.123Z",
-    "2025-10-09 15:30:45.123Z"
-]
+# Size of the buffer used to copy the cut window when the kernel can't copy it directly
+COPY_CHUNK_SIZE = 4 * 1024 * 1024
+# Bytes copied by a single kernel call, progress is reported after each of them
+KERNEL_COPY_CHUNK_SIZE = 64 * 1024 * 1024
+# Bytes read from a stream at once by cut_stream, whole chunks before or inside the window are handled without parsing their lines
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Size of the block read from the end of a file to find its last timestamp, doubled until a timestamp is found
+TAIL_BLOCK_SIZE = 64 * 1024
+# Bytes read forward and backward of a search probe, doubled until a timestamped line is found on either side
+PROBE_BLOCK_SIZE = 4096
+# Bytes of a sample read from a bucket of a preview to estimate its mean line length
+PREVIEW_SAMPLE_BYTES = 4096
+# Samples spread evenly over a bucket of a preview, lines of varying length average out over more of them
+PREVIEW_SAMPLES_PER_BUCKET = 4
+# Buffers of buffer_size a file being cut can hold at once: the copy buffer, the queue of its compressed output,
+# the pending entry of its filter, the chunk of a stream cut and the incomplete line carried over to the next chunk
+FILE_BUFFERS = 4
+# Smallest buffer_size a memory limit can bring the buffers of a file down to
+MIN_BUFFER_SIZE = 64 * 1024
+
+
+def buffer_size_for_memory_limit(memory_limit_mb: float | None, files_at_once: int) -> int | None:
+    """buffer_size of the LogCutters of a job that keeps the file data buffered by the files cut at once within a memory limit.
+
+    Args:
+        memory_limit_mb (float): Memory for the file data of the whole job, None or 0 for no limit.
+        files_at_once (int): Files cut (or transferred) at the same time, e.g. local_workers.
+
+    Returns:
+        int | None: Bytes per buffer (see LogCutter), None without a limit.
+    """
+    if not memory_limit_mb:
+        return None
+    return max(int(memory_limit_mb * 1024 * 1024) // (max(files_at_once, 1) * FILE_BUFFERS), MIN_BUFFER_SIZE)
+
+
+def resolve_windows(windows: list, padding_seconds: float = 0.0) -> list[tuple[float, float, str]]:
+    """Pad the windows of a job, then merge the overlapping and touching ones.
+
+    Args:
+        windows (list): (from_date, to_date) pairs or {"from_date", "to_date"} dicts. to_date can be open (see is_open_date).
+        padding_seconds (float): Seconds added before and after every window.
+
+    Returns:
+        list[tuple[float, float, str]]: Sorted, disjoint (from_timestamp, to_timestamp, name) windows in wall clock seconds.
+            The name is made of the padded edges, e.g. "20251009_150000-20251009_153000".
+
+    Raises:
+        ValueError: No windows, a window is not a pair of dates or ends before it starts.
+    """
+    padding = timedelta(seconds=padding_seconds)
+    edges = []
+    for window in windows:
+        if isinstance(window, dict):
+            window = (window.get("from_date"), window.get("to_date"))
+        if len(window) != 2 or not window[0]:
+            raise ValueError(f"A window needs a from_date and a to_date: {window}")
+        from_date = parse_date(window[0]) - padding
+        to_date = None if is_open_date(window[1]) else parse_date(window[1]) + padding
+        if to_date is not None and to_date < from_date:
+            raise ValueError(f"Window ends before it starts: {window[0]} - {window[1]}")
+        edges.append((from_date, to_date))
+    if not edges:
+        raise ValueError("No date range to cut")
+    edges.sort(key=lambda edge: edge[0])
+    merged = [list(edges[0])]
+    for from_date, to_date in edges[1:]:
+        last = merged[-1]
+        if last[1] is None or from_date <= last[1]:
+            last[1] = None if last[1] is None or to_date is None else max(last[1], to_date)
+        else:
+            merged.append([from_date, to_date])
+    return [(wall_seconds(from_date), float("inf") if to_date is None else wall_seconds(to_date),
+             f"{from_date:%Y%m%d_%H%M%S}-{'open' if to_date is None else format(to_date, '%Y%m%d_%H%M%S')}")
+            for from_date, to_date in merged]
 
 
 class LogCutter():
     """A class to handle log cutting based on date ranges."""
 
-    def __init__(self, from_date: str, to_date: str, dest_path: str):
-        self.from_date = date_parser.parse(from_date, ignoretz=True)
-        self.to_date = date_parser.parse(to_date, ignoretz=True)
+    # When the searched byte range is smaller than this, binary search switches to linear search.
+    # Tuned with benchmarks/bench_cut.py --scan-bytes: smaller ranges mean more probes, larger ones more parsed lines
+    linear_scan_bytes = 16 * 1024
+
+    def __init__(self, from_date: str | None, to_date: str | None, dest_path: str, index_dir: str | None = None, stats: RunStats | None = None,
+                 output_compression: str | None = None, log_filter: LogFilter | None = None,
+                 windows: list | None = None, window_padding: float = 0.0, time_slack: float = 0.0,
+                 buffer_size: int | None = None, undecodable: str = "replace", deadline: float | None = None):
+        """
+        Args:
+            to_date (str): End of the window (exclusive). "now", "open", "" or None leave it open:
+                the window goes to the end of every file (see LogFollower).
+            windows (list): Several (from_date, to_date) windows to cut instead of from_date/to_date (see resolve_windows).
+                Every window of a log is written to its own cut log, in a subdirectory of dest_path named after the window.
+            window_padding (float): Seconds added before and after every window.
+            index_dir (str): Directory for persistent sparse timestamp indexes of the cut files (see LogIndex).
+                Indexes are not used if it's None.
+            stats (RunStats): Collects counters, phase timings and per-file progress. A new one is created if not given.
+            output_compression (str): "gzip" or "zstd" to write the cut logs compressed (see open_dest_file), None for plain text.
+            log_filter (LogFilter): Write only the entries of the window that match it, in the same pass that copies the window.
+            time_slack (float): Seconds a line's timestamp can be earlier than the lines before it, e.g. in logs written
+                by several threads. The window still starts at the first line at or after from_date and ends at the first
+                line at or after to_date; the search reads at most about two slacks of log more around every edge.
+            buffer_size (int): Largest buffer of file data a cut holds: the copy buffer, the chunks of a stream cut, the pending
+                entry of a filter and the queue of a compressed output are sized after it (see buffer_size_for_memory_limit).
+                Lines longer than the chunks of a stream cut are searched by their head. None for the default sizes.
+            undecodable (str): What timestamp probes do with lines that aren't valid UTF-8 (see UNDECODABLE_BYTES_POLICIES).
+                Only probed lines are checked; the bytes of the logs are copied as they are.
+            deadline (float): time.time() after which the files that haven't started are left out (see is_past_deadline),
+                the most relevant files are cut first then (see schedule_files). None to cut every file.
+        """
+        if output_compression is not None:
+            check_output_compression(output_compression)
+        check_undecodable_policy(undecodable)
+        resolved_windows = resolve_windows(windows or [(from_date, to_date)], window_padding)
+        # Sorted, disjoint (from_timestamp, to_timestamp) windows in wall clock seconds (timezone ignored),
+        # the same scale as timestamps extracted from log lines
+        self.windows = [(from_timestamp, to_timestamp) for from_timestamp, to_timestamp, _ in resolved_windows]
+        # Subdirectory of the cut logs of every window, None for a single window
+        self.window_names = [name for _, _, name in resolved_windows] if len(resolved_windows) > 1 else [None]
+        # from_date/to_date span all windows: files outside of them are skipped before searching
+        self.from_timestamp = self.windows[0][0]
+        self.to_timestamp = self.windows[-1][1]
+        self.open_ended = self.to_timestamp == float("inf")
+        self.from_date = datetime.fromtimestamp(self.from_timestamp, timezone.utc).replace(tzinfo=None)
+        # An open window still needs a date as the reference year of year-less timestamps
+        self.to_date = datetime.now() if self.open_ended else datetime.fromtimestamp(self.to_timestamp, timezone.utc).replace(tzinfo=None)
         self.dest_path = dest_path
+        self.index_dir = index_dir
+        self.stats = stats if stats is not None else RunStats()
+        self.output_compression = output_compression
+        self.log_filter = log_filter
+        self.time_slack = time_slack
+        self.buffer_size = buffer_size
+        if buffer_size is None:
+            self.copy_chunk_size = COPY_CHUNK_SIZE
+            self.stream_chunk_size = STREAM_CHUNK_SIZE
+            self.output_buffer_size = COMPRESSED_OUTPUT_BUFFER_SIZE
+        else:
+            buffer_size = max(buffer_size, MIN_BUFFER_SIZE)
+            self.copy_chunk_size = min(COPY_CHUNK_SIZE, buffer_size)
+            self.stream_chunk_size = min(STREAM_CHUNK_SIZE, buffer_size)
+            # The output buffer and the chunks queued for the compression thread
+            self.output_buffer_size = min(COMPRESSED_OUTPUT_BUFFER_SIZE, buffer_size // (COMPRESSION_QUEUE_SIZE + 1))
+        # Lines are read up to this many bytes by the search, the rest of a longer line is skipped
+        self.max_line_bytes = self.stream_chunk_size
+        self.undecodable = undecodable
+        self.deadline = deadline
         self.logger = logging.getLogger("LogCutter")
         self.logger.debug(f"Initialized LogCutter with from_date: {self.from_date} and to_date: {self.to_date}")
 
-    def cut_log(self, log_file_path:str, lines:list[str]) -> None:
-        start_line_posix = 0.0 # POSIX timestamp of the first line to include
-        end_line_posix = 0.0 # POSIX timestamp of the last line to include
-        start_line_posix = self.find_start_line(lines)
-        end_line_posix = self.find_end_line(lines)
-        self.logger.debug(f"start_line_posix = {start_line_posix}, end_line_posix = {end_line_posix}")
-        if start_line_posix is not None and end_line_posix is not None:
-            self.logger.debug(f"Cutting log file from line {start_line_posix} to {end_line_posix}")
-            if end_line_posix < start_line_posix:
-                self.logger.warning(f"End line {end_line_posix} is before start line {start_line_posix} in file {log_file_path}. Skipping cut.")
-                return
-            elif start_line_posix == end_line_posix:
-                self.logger.warning(f"Start and end lines are the same ({start_line_posix}) in file {log_file_path}. Skipping cut.\n"
-                "It just means no logs found in the specified date range.\n")
-                return
-            elif end_line_posix == 0:
-                self.logger.error(f"End line not found in file {log_file_path}. Skipping cut.")
-                return
-            cut_lines = lines[start_line_posix:end_line_posix]
-            dest_file_path = os.path.join(self.dest_path, os.path.basename(log_file_path))
-            try:
-                if not os.path.exists(self.dest_path):
-                    os.makedirs(self.dest_path, exist_ok=True)
-            except OSError as e:
-                    self.logger.error(f"Error creating destination directory {self.dest_path}: {e}")
-            try:
-                with open(dest_file_path, "w") as dest_file:
-                    dest_file.writelines(cut_lines)
-            except OSError as e:
-                self.logger.error(f"Error writing to destination file {dest_file_path}: {e}")
-            self.logger.info(f"Cut log saved to: {dest_file_path}")
-        elif start_line_posix is None:
-            self.logger.warning(f"No start line found in log file: {log_file_path}")
-        elif end_line_posix is None:
-            self.logger.warning(f"No end line found in log file: {log_file_path}")
+    def discover_log_files(self, log_paths: list[str]) -> list[str]:
+        """Expand the requested paths into the list of log files to cut.
 
-    def extract_date_from_line(self, line: str):
-        """Extract a date from a log line and convert it to a POSIX timestamp.
+        Args:
+            log_paths (list[str]): Log files and/or directories with log files.
 
-        This method searches for common date patterns in a log line using regex patterns
-        and parses the first matching date string into a POSIX timestamp.
+        Returns:
+            list[str]: Paths of the log files.
+        """
+        log_files = []
+        for log in log_paths:
+            if not os.path.exists(log):
+                self.logger.error(f"Log file or directory does not exist: {log}")
+            elif os.path.isdir(log):
+                self.logger.debug(f"Processing log directory: {log}")
+                for logfile in os.listdir(log):
+                    log_path = os.path.join(log, logfile)
+                    if os.path.isfile(log_path):
+                        log_files.append(log_path)
+            elif os.path.isfile(log):
+                log_files.append(log)
+        return log_files
+
+    def cut_logs(self, log_paths: list[str], workers: int | None = None, chunksize: int = 1) -> list[str | None]:
+        """Cut all log files of the requested paths in a pool of processes.
+
+        Timestamp parsing is CPU-bound pure Python, so files are spread over processes instead of threads.
+        The largest expected work is scheduled first, so a huge file doesn't start (and finish) last (see queue_log_files).
 
         Args:
-            line (str): A single line from a log file that may contain a date.
+            log_paths (list[str]): Log files and/or directories with log files.
+            workers (int): Number of worker processes. Defaults to the number of CPUs.
+            chunksize (int): Number of files sent to a worker at once.
 
         Returns:
-            float: POSIX timestamp of the extracted date, or None if no valid date is found.
+            list[str | None]: Path of the cut log for every log file (None if nothing was written).
+        """
+        log_files = [scheduled_file["path"] for scheduled_file in self.queue_log_files(log_paths)]
+        workers = min(workers or os.cpu_count() or 1, len(log_files))
+        self.logger.debug(f"Cutting {len(log_files)} log files with {workers} worker processes")
+        if workers <= 1:
+            return [self.cut_log_file(log_file) for log_file in log_files]
+        # Imported here: multiprocessing is slow to import and not needed for a single file
+        from concurrent.futures import ProcessPoolExecutor
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for result, stats_snapshot in executor.map(self.cut_log_file_in_worker, log_files, chunksize=max(1, chunksize)):
+                self.stats.merge(stats_snapshot)
+                results.append(result)
+        return results
 
-        Supported date formats:
-            - ISO 8601: "2025-10-09 15:30:45", "2025-10-09 15:30:45.123Z"
-            - Human readable: "Oct 9, 2025 3:30 PM"
-            - Date/time: "09/10/2025 15:30:45"
-            - ISO 8601 with T: "2025-10-09T15:30:45.123Z"
+    def queue_log_files(self, log_paths: list[str]) -> list[dict]:
+        """Find the log files of the requested paths, schedule them and queue them in the stats (see cut_logs).
+
+        The expected work of a file is its size, or the bytes of the windows estimated from its stored index
+        with index_dir, and several times its size for a compressed rotation.
+
+        Returns:
+            list[dict]: The scheduled files (see schedule_files), in the order to cut them.
         """
-        # date_patterns may require adding ^ to match at the start of the line only
-        date_patterns = [
-            r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:\.\d+)?Z?",  # 2025-10-09 15:30:45 or with milliseconds and Z
-            r"[A-Za-z]{3} \d{1,2}, \d{4} \d{1,2}:\d{2} [AP]M",   # Oct 9, 2025 3:30 PM
-            r"\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}",              # 09/10/2025 15:30:45
-            r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?Z?"   # 2025-10-09T15:30:45.123Z
-        ]
-        for pattern in date_patterns:
-            match = re.search(pattern, line)
-            if match:
-                date_str = match.group(0)
-                try:
-                    parsed_date = date_parser.parse(date_str, ignoretz=True)
-                    posix_timestamp = parsed_date.timestamp()
-                    logging.debug(f"Extracted date '{date_str}' as POSIX timestamp: {posix_timestamp}")
-                    return posix_timestamp
-                except (ValueError, OverflowError, ParserError) as e:
-                    self.logger.error(f"Error parsing date string '{date_str}': {e}")
-        return None
+        files = []
+        with self.stats.phase("discovery"):
+            for log_file in self.discover_log_files(log_paths):
+                file_stat = os.stat(log_file)
+                compressed = compression_of(log_file) is not None
+                window_bytes = None
+                if self.index_dir is not None and not compressed:
+                    from LogIndex import LogIndex
+                    window_bytes = LogIndex(log_file, self.index_dir).estimate_window_bytes(self.windows, file_stat)
+                files.append({"path": log_file, "size": file_stat.st_size, "mtime": posix_to_wall(file_stat.st_mtime),
+                              "compressed": compressed, "window_bytes": window_bytes})
+        scheduled_files = schedule_files(files, self.windows, relevance_first=self.deadline is not None)
+        for scheduled_file in scheduled_files:
+            self.stats.queue_file(scheduled_file["path"], scheduled_file["size"])
+        return scheduled_files
+
+    def is_past_deadline(self, log_file_path: str) -> bool:
+        """Check the deadline before a file is started. Past it, the file is left out: its outcome is "expired".
+
+        Files that have started are finished, so a job can end after its deadline by the time of its longest running file.
+        """
+        if self.deadline is None or time.time() < self.deadline:
+            return False
+        self.logger.info(f"The deadline passed before log file {log_file_path} was started. Skipping it.")
+        self.stats.file_outcome("expired")
+        return True
+
+    def cut_log_file_in_worker(self, log_file_path: str) -> tuple[str | None, dict]:
+        """Cut a log file in a worker process and return the result with the stats of that file (see RunStats.merge)."""
+        self.stats = RunStats()
+        return self.cut_log_file(log_file_path), self.stats.snapshot()
+
+    def copy_located_in_worker(self, located: dict) -> tuple[str | None, dict, dict]:
+        """`copy_located` in a worker process, for a file whose entry is kept by the parent process (see JobEngine).
+
+        Returns:
+            tuple: The result, the entry of the file with its outcome and progress, and the other stats of the copy to merge.
+        """
+        self.stats = RunStats()
+        entry = RunStats.new_file_entry(located["path"])
+        with self.stats.resume_file(entry):
+            result = self.copy_located(located)
+        return result, entry, self.stats.snapshot()
 
-    def is_line_with_timestamp(self, line: str) -> bool:
-        """Check if a log line contains a valid timestamp.
+    def cut_log_file(self, log_file_path: str) -> str | None:
+        """Cut a log file on disk without loading it into memory.
+
+        The file is opened in binary mode and the window is located with a binary search
+        on byte offsets (see `locate_window`), so only a few probe lines plus the window itself are read.
+        Files whose mtime or first/last timestamps are outside the window are skipped before the search.
+        Compressed rotations (.gz, .bz2, .xz, .zst) are decompressed on the fly (see `cut_stream`).
 
         Args:
-            line (str): A single line from a log file.
+            log_file_path (str): Path to the log file to cut.
+
         Returns:
-            bool: True if the line contains a valid timestamp, False otherwise.
+            str | list[str]: Path of the written cut log, the paths of the cut logs of its windows with several windows
+                (see cut_result), or None if nothing was written.
         """
-        date_in_line = self.extract_date_from_line(line)
-        return date_in_line is not None
+        with self.stats.track_file(log_file_path):
+            return self._cut_log_file(log_file_path)
+
+    def _cut_log_file(self, log_file_path: str) -> str | None:
+        if compression_of(log_file_path) is not None:
+            return self._cut_compressed_file(log_file_path)
+        located = self.locate_log_file(log_file_path)
+        if located is None:
+            return None
+        return self.copy_located(located)
+
+    def _cut_compressed_file(self, log_file_path: str) -> str | None:
+        """Cut a compressed rotation while it's decompressed (see cut_stream)."""
+        if self.is_past_deadline(log_file_path):
+            return None
+        try:
+            file_stat = os.stat(log_file_path)
+            if self.is_modified_before_window(file_stat.st_mtime):
+                self.logger.info(f"Log file {log_file_path} was last modified before the date range. Skipping it.")
+                self.stats.file_outcome("skipped")
+                return None
+            with open(log_file_path, "rb") as raw_file, open_decompressed(raw_file, compression_of(log_file_path)) as log_stream:
+                return self.cut_stream(log_stream, log_file_path, reference_time=file_stat.st_mtime)
+        except READ_ERRORS as e:
+            self.logger.error(f"Error cutting log file {log_file_path}: {e}")
+            self.stats.file_outcome("failed")
+            return None
 
-    def find_line_by_timestamp(self, lines: list[str]) -> int:
-        """Find a line in the log that matches or exceeds the from_date using (partially) binary search.
+    def locate_log_file(self, log_file_path: str) -> dict | None:
+        """First step of cutting an uncompressed log file: find the byte ranges of the windows in it.
 
-        First, it performs binary search for efficiency. Then when the range is small (900), it switches to linear search, because not all lines have timestamps.
-        So, it narrows down the line search range first with binary search, then does linear
         Args:
-            lines (list[str]): List of log lines to search through.
+            log_file_path (str): Path of the log file.
+
         Returns:
-            int: The line number of the line that matches the date criteria, or -1 if no matching line is found.
+            dict | None: {"path", "parser", "ranges", "window_bytes"} for `copy_located`, or None if there is nothing to copy
+                (the outcome of the file is set).
         """
-        leftmost_index = 0
-        rightmost_index = len(lines) - 1
-        # Try binary search first for efficiency, but stop when range is small (900), because not all lines have timestamps
-        while leftmost_index <= rightmost_index:
-            if rightmost_index - leftmost_index > 900:
-                mid = (leftmost_index + rightmost_index) // 2
-                while not self.is_line_with_timestamp(lines[mid]):
-                    mid += 1
-                    if mid > rightmost_index:
-                        return -1
-                date_in_line = self.extract_date_from_line(lines[mid]) # returns POSIX timestamp or None
-                if date_in_line:
-                    if date_in_line == self.from_date.timestamp():
-                        return mid
-                    elif date_in_line < self.from_date.timestamp():
-                        leftmost_index = mid + 1
+        if self.is_past_deadline(log_file_path):
+            return None
+        try:
+            file_stat = os.stat(log_file_path)
+            if self.is_modified_before_window(file_stat.st_mtime):
+                self.logger.info(f"Log file {log_file_path} was last modified before the date range. Skipping it.")
+                self.stats.file_outcome("skipped")
+                return None
+            with open(log_file_path, "rb") as log_file:
+                file_stat = os.fstat(log_file.fileno())
+                file_size = file_stat.st_size
+                with self.stats.phase("locate"):
+                    parser = self.detect_timestamp_parser(log_file, reference_time=file_stat.st_mtime)
+                    if self.is_span_outside_window(*self.read_time_span(log_file, file_size, parser)):
+                        self.logger.info(f"All timestamps of log file {log_file_path} are outside the date range. Skipping it.")
+                        self.stats.file_outcome("skipped")
+                        return None
+                    index = None
+                    if self.index_dir is not None:
+                        from LogIndex import LogIndex
+                        index = LogIndex(log_file_path, self.index_dir)
+                        index.update(log_file, file_stat, parser, self)
+                    ranges = self.locate_windows(log_file, file_size, parser, index)
+        except READ_ERRORS as e:
+            self.logger.error(f"Error cutting log file {log_file_path}: {e}")
+            self.stats.file_outcome("failed")
+            return None
+        self.logger.debug(f"Window offsets {ranges} in file {log_file_path}")
+        window_bytes = sum(max(end_offset - start_offset, 0) for start_offset, end_offset in ranges)
+        if not window_bytes:
+            self.logger.warning(f"No logs found in the specified date range in file {log_file_path}. Skipping cut.")
+            self.stats.file_outcome("empty")
+            return None
+        return {"path": log_file_path, "parser": parser, "ranges": ranges, "window_bytes": window_bytes}
+
+    def copy_located(self, located: dict) -> str | None:
+        """Second step of cutting an uncompressed log file: copy the ranges found by `locate_log_file` into the cut logs.
+
+        Returns:
+            str | list[str]: Like cut_log_file.
+        """
+        log_file_path = located["path"]
+        try:
+            with open(log_file_path, "rb") as log_file:
+                self.stats.set_file_total(located["window_bytes"])
+                with self.stats.phase("copy"):
+                    dest_file_paths, copied, written = self.write_windows(log_file_path, located["parser"], located["ranges"],
+                                                                          partial(self.copy_byte_range, log_file))
+                self.stats.add(bytes_read=copied, bytes_written=written)
+        except READ_ERRORS as e:
+            self.logger.error(f"Error cutting log file {log_file_path}: {e}")
+            self.stats.file_outcome("failed")
+            return None
+        if not written:
+            self.logger.warning(f"No logs in the specified date range of file {log_file_path} match the filter. Skipping cut.")
+            self.stats.file_outcome("empty")
+            return None
+        self.logger.info(f"Cut log saved to: {', '.join(dest_file_paths)}")
+        self.stats.file_outcome("cut", self.cut_result(dest_file_paths))
+        return self.cut_result(dest_file_paths)
+
+    def cut_stream(self, log_stream, log_file_path: str, reference_time: float | None = None) -> str | None:
+        """Cut a log from a sequential (non-seekable) binary stream, e.g. a decompressed rotation or a remote file being downloaded.
+
+        The stream is read in chunks of stream_chunk_size bytes and every chunk is cut as soon as it arrives
+        (see `_cut_block`): chunks before the window are dropped, chunks inside it are written as they are,
+        and reading stops at the first line after the window, so the rest of the stream is never read.
+        Only the chunks with an edge of the window are parsed line by line, of the others just the last timestamped line.
+        With several windows, every window goes to its own cut log in the same pass.
+        A line longer than a chunk is cut like a line with continuation lines: its head decides where it goes.
+
+        Args:
+            log_stream: Binary stream with read().
+            log_file_path (str): Path of the source log; the cut log is named after it without the compression suffix.
+            reference_time (float): POSIX time used to infer the year of year-less timestamps (the file mtime).
+
+        Returns:
+            str | list[str]: Path of the written cut log (see cut_result), or None if nothing was written.
+        """
+        first_chunk = log_stream.read(self.stream_chunk_size)
+        parser = self.parser_from_sample(first_chunk.splitlines(keepends=True)[:DETECTION_SAMPLE_LINES], reference_time)
+        # Open cut logs and the bytes copied to them, by window
+        dest_files = {}
+        copied = {}
+        window = 0
+        in_window = False
+        pending = b""
+        bytes_read = 0
+        self.stats.set_file_total(None)
+        try:
+            with self.stats.phase("scan"):
+                chunks = chain([first_chunk], iter(partial(log_stream.read, self.stream_chunk_size), b""))
+                # None marks the end of the stream, where the last line may have no newline
+                for chunk in chain(chunks, [None]):
+                    if chunk is None:
+                        block, limit = pending, len(pending)
                     else:
-                        rightmost_index = mid - 1
-            else:
-                break
-        # Linear search in the narrowed range
-        self.logger.debug(f"leftmost_index = {leftmost_index}, rightmost_index = {rightmost_index}")
-        for line in lines[leftmost_index:rightmost_index - 1]:
-            date_in_line = self.extract_date_from_line(line) # returns POSIX timestamp or None
-            if date_in_line:
-                if date_in_line >= self.from_date.timestamp():
-                    self.logger.debug(f"Found start line: {line.strip()}")
-                    return lines.index(line)
-        return -1
+                        bytes_read += len(chunk)
+                        block = pending + chunk if pending else chunk
+                        limit = block.rfind(b"\n") + 1
+                        if len(block) - limit >= self.max_line_bytes:
+                            # An overlong line: its head goes on as a line, the rest of it as continuation lines
+                            limit = len(block)
+                    # The incomplete last line waits for the rest of it in the next chunk
+                    pending = block[limit:]
+                    if not limit:
+                        continue
+                    offset = 0
+                    # A block can have the end of a window and the beginning of the next ones
+                    while window < len(self.windows):
+                        start_offset, end_offset, in_window, done = self._cut_block(block, offset, limit, parser, in_window, *self.windows[window])
+                        if start_offset < end_offset:
+                            if window not in dest_files:
+                                dest_files[window] = self.open_dest_file(strip_compression_suffix(log_file_path), parser, window=window)
+                                copied[window] = 0
+                            dest_files[window][1].write(memoryview(block)[start_offset:end_offset])
+                            copied[window] += end_offset - start_offset
+                            self.stats.advance(end_offset - start_offset)
+                        if not done:
+                            break
+                        window += 1
+                        in_window = False
+                        offset = end_offset
+                    if window == len(self.windows):
+                        break
+        finally:
+            written = {}
+            for dest_window, (_, dest_file) in dest_files.items():
+                dest_file.close()
+                written[dest_window] = self.written_bytes(dest_file, copied[dest_window])
+            self.stats.add(bytes_read=bytes_read, bytes_written=sum(written.values()))
+        dest_file_paths = [dest_files[dest_window][0] for dest_window in sorted(written) if written[dest_window]]
+        if not dest_file_paths:
+            self.logger.warning(f"No logs found in the specified date range in file {log_file_path}. Skipping cut.")
+            self.stats.file_outcome("empty")
+            return None
+        self.logger.info(f"Cut log saved to: {', '.join(dest_file_paths)}")
+        self.stats.file_outcome("cut", self.cut_result(dest_file_paths))
+        return self.cut_result(dest_file_paths)
+
+    def _cut_block(self, block: bytes, offset: int, limit: int, parser, in_window: bool,
+                   from_timestamp: float, to_timestamp: float) -> tuple[int, int, bool, bool]:
+        """Find the part of a block of whole lines block[offset:limit] that belongs to the window [from_timestamp, to_timestamp).
+
+        A block whose last timestamp is before the edge being looked for (by more than time_slack) is skipped
+        (before the window) or taken whole (inside it) without parsing its other lines.
+
+        Args:
+            offset (int): Start of the lines not cut yet, e.g. after the end of the previous window.
+            in_window (bool): Whether the window started in one of the previous blocks.
+
+        Returns:
+            tuple[int, int, bool, bool]: (start_offset, end_offset, in_window, done) - bytes [start_offset, end_offset)
+                of the block are in the window; done means that the window ended in this block.
+        """
+        start_offset = offset
+        if not in_window:
+            last_timestamp = self._last_timestamp_in_block(block, offset, limit, parser)
+            if last_timestamp is None or last_timestamp < from_timestamp - self.time_slack:
+                return offset, offset, False, False
+            start_offset = self._find_offset_in_block(block, offset, limit, from_timestamp, parser)
+            if start_offset == limit:
+                # Only lines out of order by less than the slack, the window starts in a later block
+                return offset, offset, False, False
+        last_timestamp = self._last_timestamp_in_block(block, start_offset, limit, parser)
+        if last_timestamp is None or last_timestamp < to_timestamp - self.time_slack:
+            return start_offset, limit, True, False
+        end_offset = self._find_offset_in_block(block, start_offset, limit, to_timestamp, parser)
+        return start_offset, end_offset, True, end_offset < limit
+
+    def _last_timestamp_in_block(self, block: bytes, start: int, limit: int, parser) -> float | None:
+        """Timestamp of the last timestamped line in block[start:limit], reading the lines backwards."""
+        line_end = limit
+        lines_parsed = 0
+        try:
+            while line_end > start:
+                line_start = block.rfind(b"\n", start, line_end - 1) + 1 or start
+                lines_parsed += 1
+                date_in_line = parser.parse(block[line_start:line_end])
+                if date_in_line is not None:
+                    return date_in_line
+                line_end = line_start
+            return None
+        finally:
+            self.stats.add(lines_parsed=lines_parsed)
+
+    def _find_offset_in_block(self, block: bytes, start: int, limit: int, timestamp: float, parser) -> int:
+        """Offset of the first line in block[start:limit] with a timestamp matching or exceeding timestamp, or limit."""
+        offset = start
+        lines_parsed = 0
+        try:
+            while offset < limit:
+                line_end = block.find(b"\n", offset, limit) + 1 or limit
+                lines_parsed += 1
+                date_in_line = parser.parse(block[offset:line_end])
+                if date_in_line is not None and date_in_line >= timestamp:
+                    return offset
+                offset = line_end
+            return limit
+        finally:
+            self.stats.add(lines_parsed=lines_parsed)
+
+    def is_modified_before_window(self, mtime: float, slack: float = 0.0) -> bool:
+        """Check if a file was last written before from_date, so none of its lines can be in the window.
 
-    # find_start_line and find_end_line are practically identical; consider refactoring with optimization
-    def find_start_line(self, lines: list[str]) -> int:
-        """Find the first line in the log that matches or exceeds the from_date.
+        Args:
+            mtime (float): POSIX mtime of the file.
+            slack (float): Seconds added to mtime, e.g. to cover an unknown timezone of a remote server.
+        """
+        return posix_to_wall(mtime) + slack < self.from_timestamp
+
+    def is_span_outside_window(self, first_timestamp: float | None, last_timestamp: float | None) -> bool:
+        """Check if a file with timestamps from first_timestamp to last_timestamp has no lines in the window."""
+        if first_timestamp is None or last_timestamp is None:
+            return True
+        # A line before the last one can be later than it by up to time_slack
+        return last_timestamp + self.time_slack < self.from_timestamp or first_timestamp >= self.to_timestamp
+
+    def read_time_span(self, log_file, file_size: int, parser) -> tuple[float | None, float | None]:
+        """Read the first and the last timestamp of a seekable log file.
 
-        First, it performs binary search for efficiency. Then when the range is small (900), it switches to linear search, because not all lines have timestamps.
-        So, it narrows down the line search range first with binary search, then does linear search in that range.
-        This approach may pose some bugs in some corner cases.
+        Only the head and a block from the end of the file are read.
+
+        Returns:
+            tuple[float | None, float | None]: (first_timestamp, last_timestamp), None if the file has no timestamps.
+        """
+        first = self.next_timestamped_line(log_file, 0, file_size, parser)
+        if first is None:
+            return None, None
+        block_size = TAIL_BLOCK_SIZE
+        while True:
+            block_start = max(first[0], file_size - block_size)
+            last_timestamp = None
+            offset = start = self._snap_to_line_start(log_file, block_start)
+            lines_parsed = 0
+            while offset < file_size:
+                line, line_length = self._read_line(log_file)
+                if not line:
+                    break
+                lines_parsed += 1
+                date_in_line = parser.parse(line)
+                if date_in_line is not None:
+                    last_timestamp = date_in_line
+                offset += line_length
+            self.stats.add(lines_parsed=lines_parsed, bytes_read=offset - start)
+            if last_timestamp is not None:
+                return first[2], last_timestamp
+            block_size *= 2
+
+    def prepare_dest_file_path(self, log_file_path: str, window: int = 0) -> str:
+        """Make sure the destination directory exists and return the destination file path for a log.
 
         Args:
-            lines (list[str]): List of log lines to search through.
+            window (int): Index of the window in windows. With several windows, every window has its own subdirectory.
+        """
+        dest_dir = self.dest_path
+        if self.window_names[window] is not None:
+            dest_dir = os.path.join(dest_dir, self.window_names[window])
+        try:
+            if not os.path.exists(dest_dir):
+                os.makedirs(dest_dir, exist_ok=True)
+        except OSError as e:
+            self.logger.error(f"Error creating destination directory {dest_dir}: {e}")
+        return os.path.join(dest_dir, os.path.basename(log_file_path))
+
+    def open_dest_file(self, log_file_path: str, parser=None, wrap_output=None, window: int = 0) -> tuple[str, object]:
+        """Open the destination file of a log for writing.
+
+        With output_compression the file gets its suffix (.gz, .zst) and is compressed in a worker thread
+        while it's written (see Compression.ThreadedCompressedWriter), the kernel copy is not used then.
+        With log_filter only the matching entries are written (see LogFilter.FilteredWriter), and the file
+        is created with the first of them.
+
+        Args:
+            parser: Timestamp parser of the log, the filter needs it to tell entries apart.
+            wrap_output: Called with the opened destination file, returns the file object to write to instead
+                (e.g. one that also shows what's written, see LogFollower).
+            window (int): Index of the window the file is for (see prepare_dest_file_path).
 
         Returns:
-            int: The line number of the first line that matches the date criteria, or None if no matching line is found.
+            tuple[str, object]: The destination file path and the binary file object.
         """
-        start_line_number = self.find_line_by_timestamp(lines)
-        if start_line_number != -1:
-            self.logger.debug(f"Found start line at index: {start_line_number}")
-            return start_line_number
+        dest_file_path = self.prepare_dest_file_path(log_file_path, window)
+        if self.output_compression is None:
+            open_output = partial(open, dest_file_path, "wb")
         else:
-            self.logger.debug("No start line found.")
-            if len(lines) > 0:
-                first_line_date = self.extract_date_from_line(lines[0])
-                if first_line_date and first_line_date > self.from_date.timestamp():
-                    self.logger.debug("All log lines are after the from_date. Returning line at index 0.")
-                    return 0
-
-    def find_end_line(self, lines: list[str]) -> int:
-        """Find the first line in the log that matches or exceeds the to_date.
-
-        First, it performs binary search for efficiency. Then when the range is small, it switches to linear search, because not all lines have timestamps.
-        So, it narrows down the line search range first with binary search, then does linear search in that range.
-        This approach may pose some bugs in some corner cases.
-
-        Args:
-            lines (list[str]): List of log lines to search through.
-
-        Returns:
-            int: The line number of the first line that matches the date criteria, or None if no matching line is found.
-        """
-        line_number = 0
-
-        leftmost_index = 0
-        rightmost_index = len(lines) - 1
-        # Try binary search first for efficiency, but stop when range is small (900), because not all lines have timestamps
-        while leftmost_index <= rightmost_index:
-            if rightmost_index - leftmost_index > 900:
-                mid = (leftmost_index + rightmost_index) // 2
-                while not self.is_line_with_timestamp(lines[mid]):
-                    mid += 1
-                    if mid > rightmost_index:
-                        return -1
-                date_in_line = self.extract_date_from_line(lines[mid]) # returns POSIX timestamp or None
-                if date_in_line:
-                    if date_in_line == self.to_date.timestamp():
-                        return mid
-                    elif date_in_line < self.to_date.timestamp():
-                        leftmost_index = mid + 1
+            dest_file_path += OUTPUT_SUFFIXES[self.output_compression]
+            open_output = partial(open_compressed_output, dest_file_path, self.output_compression, self.output_buffer_size)
+        if wrap_output is not None:
+            open_raw_output = open_output
+            open_output = lambda: wrap_output(open_raw_output())
+        if self.log_filter is not None:
+            return dest_file_path, self.log_filter.writer(open_output, parser or GenericTimestampParser(self.extract_date_from_line, self.undecodable),
+                                                          self.copy_chunk_size)
+        return dest_file_path, open_output()
+
+    def written_bytes(self, dest_file, copied: int) -> int:
+        """Bytes written to a closed destination file of open_dest_file, that copied bytes of the window were written to."""
+        return copied if self.log_filter is None else dest_file.bytes_written
+
+    def write_windows(self, log_file_path: str, parser, ranges: list[tuple[int, int]], copy_range) -> tuple[list[str], int, int]:
+        """Write the byte ranges of the windows of a log, each to its own cut log, in one sequential pass over the log.
+
+        Args:
+            log_file_path (str): Path of the source log.
+            parser: Timestamp parser of the log.
+            ranges (list[tuple[int, int]]): [start_offset, end_offset) of every window (see locate_windows), ascending.
+            copy_range: Called with (dest_file, start_offset, end_offset) to copy a range, returns the number of bytes copied.
+
+        Returns:
+            tuple[list[str], int, int]: Paths of the written cut logs, bytes copied, bytes written.
+        """
+        dest_file_paths = []
+        copied = written = 0
+        for window, (start_offset, end_offset) in enumerate(ranges):
+            if start_offset >= end_offset:
+                continue
+            dest_file_path, dest_file = self.open_dest_file(log_file_path, parser, window=window)
+            with dest_file:
+                window_copied = copy_range(dest_file, start_offset, end_offset)
+            window_written = self.written_bytes(dest_file, window_copied)
+            copied += window_copied
+            written += window_written
+            if window_written:
+                dest_file_paths.append(dest_file_path)
+        return dest_file_paths, copied, written
+
+    def cut_result(self, dest_file_paths: list[str]) -> str | list[str]:
+        """Result of a cut log file: the path of its cut log, or the paths of its cut logs with several windows."""
+        return dest_file_paths if len(self.windows) > 1 else dest_file_paths[0]
+
+    def copy_byte_range(self, src_file, dest_file, start_offset: int, end_offset: int) -> int:
+        """Copy bytes [start_offset, end_offset) of src_file to dest_file.
+
+        When both files are real OS files the bytes are copied in the kernel with os.copy_file_range
+        (or os.sendfile), so they never pass through Python. Otherwise, or if the kernel refuses,
+        it falls back to a buffered copy through one reusable fixed-size buffer.
+
+        Args:
+            src_file: Seekable binary file object to copy from.
+            dest_file: Binary file object to write to.
+            start_offset (int): First byte to copy.
+            end_offset (int): Byte offset to stop at (exclusive).
+
+        Returns:
+            int: Number of bytes copied.
+        """
+        copied = 0
+        try:
+            src_fd = src_file.fileno()
+            dest_fd = dest_file.fileno()
+        except (AttributeError, OSError, ValueError):
+            src_fd = dest_fd = None
+        if src_fd is not None and dest_fd is not None:
+            dest_file.flush()
+            copied = self._copy_range_in_kernel(src_fd, dest_fd, start_offset, end_offset - start_offset)
+            # Keep Python's view of the source position in sync with the bytes copied by the kernel
+            src_file.seek(start_offset + copied)
+        if start_offset + copied < end_offset:
+            copied += self._copy_range_buffered(src_file, dest_file, start_offset + copied, end_offset)
+        return copied
+
+    def _copy_range_in_kernel(self, src_fd: int, dest_fd: int, offset: int, count: int) -> int:
+        """Copy count bytes from src_fd at offset to the current position of dest_fd without user-space buffers.
+
+        Returns:
+            int: Number of bytes copied. Can be less than count if the kernel can't copy between these files.
+        """
+        copied = 0
+        for copy_func in (getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)):
+            if copy_func is None:
+                continue
+            try:
+                while copied < count:
+                    chunk_size = min(count - copied, KERNEL_COPY_CHUNK_SIZE)
+                    if copy_func is os.sendfile:
+                        sent = os.sendfile(dest_fd, src_fd, offset + copied, chunk_size)
                     else:
-                        rightmost_index = mid - 1
+                        sent = copy_func(src_fd, dest_fd, chunk_size, offset + copied)
+                    if sent == 0:
+                        return copied
+                    copied += sent
+                    self.stats.advance(sent)
+                return copied
+            except OSError as e:
+                # EXDEV, EINVAL, ENOSYS, etc. - try the next method, the already copied part is kept
+                self.logger.debug(f"{copy_func.__name__} failed after {copied} bytes: {e}")
+        return copied
+
+    def _copy_range_buffered(self, src_file, dest_file, start_offset: int, end_offset: int) -> int:
+        """Copy bytes [start_offset, end_offset) through a single reusable buffer of copy_chunk_size bytes."""
+        src_file.seek(start_offset)
+        buffer = bytearray(min(self.copy_chunk_size, max(end_offset - start_offset, 0)))
+        view = memoryview(buffer)
+        remaining = end_offset - start_offset
+        while remaining > 0:
+            read = src_file.readinto(view[:min(len(buffer), remaining)])
+            if not read:
+                break
+            dest_file.write(view[:read])
+            remaining -= read
+            self.stats.advance(read)
+        return end_offset - start_offset - remaining
+
+    def detect_timestamp_parser(self, log_file, reference_time: float | None = None):
+        """Detect the timestamp format of a file once, from its first lines.
+
+        Args:
+            log_file: Seekable binary file object.
+            reference_time (float): POSIX time used to infer the year of year-less timestamps (the file mtime).
+
+        Returns:
+            TimestampParser: Parser locked to the detected format, or GenericTimestampParser if nothing was detected.
+        """
+        return self.parser_from_sample(read_sample_lines(log_file), reference_time)
+
+    def parser_from_sample(self, sample_lines: list[bytes], reference_time: float | None = None):
+        """Timestamp parser of a log detected from its first lines, with the undecodable bytes policy of the cutter.
+
+        Returns:
+            TimestampParser: Parser locked to the detected format, or GenericTimestampParser if nothing was detected.
+        """
+        parser = detect_timestamp_parser(sample_lines, reference_time, self.undecodable)
+        if parser is None:
+            self.logger.info("No known timestamp format detected, falling back to the generic parser.")
+            return GenericTimestampParser(self.extract_date_from_line, self.undecodable)
+        self.logger.debug(f"Detected timestamp format: {parser.name} (anchored: {parser.anchored})")
+        return parser
+
+    def locate_window(self, log_file, file_size: int, parser=None, index=None) -> tuple[int, int]:
+        """Find the byte offsets of the from_date/to_date window in a seekable binary log file.
+
+        Args:
+            log_file: Seekable binary file object (local file, mmap-like or SFTP file).
+            file_size (int): Size of the file in bytes.
+            parser: Timestamp parser of the file. Detected from the file if not given.
+            index (LogIndex): Sparse index of the file, narrows the searches down to one index stride.
+
+        Returns:
+            tuple[int, int]: (start_offset, end_offset) - the window is the bytes [start_offset, end_offset).
+                Both offsets are line boundaries. start_offset == end_offset means that the window is empty.
+        """
+        if parser is None:
+            parser = self.detect_timestamp_parser(log_file)
+        lo, hi = index.bounds(self.from_timestamp - self.time_slack, file_size) if index else (0, file_size)
+        start_offset = self.find_offset_by_timestamp(log_file, self.from_timestamp, lo, hi, parser)
+        if self.open_ended:
+            return start_offset, file_size
+        lo, hi = index.bounds(self.to_timestamp - self.time_slack, file_size) if index else (start_offset, file_size)
+        end_offset = self.find_offset_by_timestamp(log_file, self.to_timestamp, max(lo, start_offset), hi, parser)
+        return start_offset, end_offset
+
+    def locate_windows(self, log_file, file_size: int, parser=None, index=None) -> list[tuple[int, int]]:
+        """Find the byte offsets of all windows in a seekable binary log file with one batched search.
+
+        The edges of all windows are searched together (see `find_offsets_by_timestamps`), so a probe near the
+        beginning of the file serves every edge, and the probes of the edges close to each other are shared.
+
+        Returns:
+            list[tuple[int, int]]: (start_offset, end_offset) of every window, ascending and line boundaries.
+        """
+        if len(self.windows) == 1:
+            return [self.locate_window(log_file, file_size, parser, index)]
+        if parser is None:
+            parser = self.detect_timestamp_parser(log_file)
+        timestamps = [edge for window in self.windows for edge in window]
+        if self.open_ended:
+            timestamps.pop()
+        if index:
+            # One index stride per edge is cheaper than sharing the probes of a search over the whole file
+            offsets = []
+            for timestamp in timestamps:
+                lo, hi = index.bounds(timestamp - self.time_slack, file_size)
+                offsets.append(self.find_offset_by_timestamp(log_file, timestamp, max(lo, offsets[-1] if offsets else 0), hi, parser))
+        else:
+            offsets = self.find_offsets_by_timestamps(log_file, timestamps, 0, file_size, parser)
+        if self.open_ended:
+            offsets.append(file_size)
+        return list(zip(offsets[0::2], offsets[1::2]))
+
+    def find_offsets_by_timestamps(self, log_file, timestamps: list[float], lo: int, hi: int, parser) -> list[int]:
+        """Batched `find_offset_by_timestamp` for ascending timestamps.
+
+        A probe splits the timestamps into those at or before its line and those after it,
+        and both groups go on searching their halves of the range, so k timestamps cost about
+        log2(size) + k * log2(size / k) probes instead of k * log2(size). The small ranges left
+        are scanned once for all timestamps in them.
+
+        Returns:
+            list[int]: Offset of the first line matching or exceeding every timestamp, hi if no line does
+                (with time_slack, the end of the file).
+        """
+        search_timestamps = [timestamp - self.time_slack for timestamp in timestamps]
+        offsets = [hi] * len(timestamps)
+        probes = 0
+        # (first timestamp, end of timestamps, lo, hi): the answers of timestamps[first:last] are in [lo, hi) or already in offsets
+        ranges = [(0, len(timestamps), lo, hi)]
+        while ranges:
+            first, last, lo, hi = ranges.pop()
+            if first >= last:
+                continue
+            if hi - lo <= self.linear_scan_bytes:
+                self._scan_for_timestamps(log_file, search_timestamps, offsets, first, last, lo, hi, parser)
+                continue
+            probes += 1
+            probe = self.nearest_timestamped_line(log_file, (lo + hi) // 2, lo, hi, parser)
+            if probe is None:
+                # No timestamped line in the range, the offsets found so far are the answers
+                continue
+            line_offset, _, date_in_line, before, after = probe
+            split = bisect.bisect_right(search_timestamps, date_in_line, first, last)
+            for i in range(first, split):
+                offsets[i] = line_offset
+            # Pushed last, searched first: the file is read roughly front to back
+            ranges.append((split, last, after, hi))
+            ranges.append((first, split, lo, before))
+        self.stats.add(probes=probes)
+        if self.time_slack:
+            offsets = [self._skip_out_of_order(log_file, offset, timestamp, parser) for offset, timestamp in zip(offsets, timestamps)]
+        return offsets
+
+    def _scan_for_timestamps(self, log_file, timestamps: list[float], offsets: list[int], first: int, last: int, lo: int, hi: int, parser) -> None:
+        """Linear search of the lines in [lo, hi) for timestamps[first:last], the offsets found replace those in offsets."""
+        offset = start = self._snap_to_line_start(log_file, lo)
+        lines_parsed = 0
+        try:
+            while offset < hi and first < last:
+                line, line_length = self._read_line(log_file)
+                if not line:
+                    break
+                lines_parsed += 1
+                date_in_line = parser.parse(line)
+                while date_in_line is not None and first < last and date_in_line >= timestamps[first]:
+                    offsets[first] = offset
+                    first += 1
+                offset += line_length
+        finally:
+            self.stats.add(lines_parsed=lines_parsed, bytes_read=offset - start)
+
+    def preview_bucket_edges(self, buckets: int) -> list[float]:
+        """Edges of the time buckets of a preview: buckets + 1 wall clock timestamps from from_date to to_date (now if it's open)."""
+        to_timestamp = wall_seconds(self.to_date) if self.open_ended else self.to_timestamp
+        step = max(to_timestamp - self.from_timestamp, 0.0) / max(buckets, 1)
+        return [self.from_timestamp + step * bucket for bucket in range(max(buckets, 1))] + [to_timestamp]
+
+    def preview_logs(self, log_paths: list[str], edges: list[float]) -> list[dict | None]:
+        """Estimate the lines and bytes of every time bucket of the local log files of the requested paths (see preview_histogram).
+
+        Returns:
+            list[dict | None]: Preview of every log file (see preview_log_file).
+        """
+        with self.stats.phase("discovery"):
+            log_files = self.discover_log_files(log_paths)
+        return [self.preview_log_file(log_file, edges) for log_file in log_files]
+
+    def preview_log_file(self, log_file_path: str, edges: list[float]) -> dict | None:
+        """Estimate the lines and bytes of every time bucket of a log file without reading the buckets.
+
+        Returns:
+            dict | None: {"host", "path", "size", "lines", "bytes"} with a count per bucket, or None for a compressed log
+                (it can't be probed without decompressing it) or a log that can't be read.
+        """
+        if compression_of(log_file_path) is not None:
+            self.logger.info(f"Compressed log file {log_file_path} can't be previewed. Skipping it.")
+            return None
+        try:
+            with open(log_file_path, "rb") as log_file:
+                file_stat = os.fstat(log_file.fileno())
+                preview = {"host": "localhost", "path": log_file_path, "size": file_stat.st_size}
+                if self.is_modified_before_window(file_stat.st_mtime):
+                    return {**preview, **self.empty_histogram(edges)}
+                with self.stats.phase("locate"):
+                    parser = self.detect_timestamp_parser(log_file, reference_time=file_stat.st_mtime)
+                    return {**preview, **self.preview_histogram(log_file, file_stat.st_size, parser, edges)}
+        except READ_ERRORS as e:
+            self.logger.error(f"Error previewing log file {log_file_path}: {e}")
+            return None
+
+    @staticmethod
+    def empty_histogram(edges: list[float]) -> dict:
+        """Histogram of a log without lines in the buckets."""
+        return {"lines": [0] * (len(edges) - 1), "bytes": [0] * (len(edges) - 1)}
+
+    def preview_histogram(self, log_file, file_size: int, parser, edges: list[float]) -> dict:
+        """Estimate the lines and bytes of every time bucket [edges[i], edges[i + 1]) of a seekable binary log file.
+
+        The offsets of all edges are found with one batched search (see find_offsets_by_timestamps), so the bytes
+        of a bucket are exact up to its edge lines. Its lines are estimated from the mean line length of a few small
+        samples spread over it (all of its lines if it's smaller than the samples). A few reads per bucket are made
+        whatever the size of the file, so it works the same on SFTP file handles, where the samples are one readv.
+
+        Returns:
+            dict: {"lines": [...], "bytes": [...]} - estimated lines and bytes of every bucket.
+        """
+        if self.is_span_outside_window(*self.read_time_span(log_file, file_size, parser)):
+            return self.empty_histogram(edges)
+        search_edges = edges[:-1] if self.open_ended else edges
+        offsets = self.find_offsets_by_timestamps(log_file, search_edges, 0, file_size, parser)
+        if self.open_ended:
+            offsets.append(file_size)
+        bucket_bytes = [end_offset - start_offset for start_offset, end_offset in zip(offsets, offsets[1:])]
+        bucket_chunks = []
+        for offset, size in zip(offsets, bucket_bytes):
+            if size <= PREVIEW_SAMPLE_BYTES * PREVIEW_SAMPLES_PER_BUCKET:
+                bucket_chunks.append([(offset, size)] if size > 0 else [])
             else:
+                stride = size // PREVIEW_SAMPLES_PER_BUCKET
+                bucket_chunks.append([(offset + stride * sample, PREVIEW_SAMPLE_BYTES) for sample in range(PREVIEW_SAMPLES_PER_BUCKET)])
+        samples = iter(self._read_chunks(log_file, [chunk for chunks in bucket_chunks for chunk in chunks]))
+        bucket_lines = []
+        for size, chunks in zip(bucket_bytes, bucket_chunks):
+            sample = b"".join(next(samples) for _ in chunks)
+            newlines = sample.count(b"\n")
+            if not sample:
+                bucket_lines.append(0)
+            elif len(chunks) == 1 and size <= len(sample):
+                bucket_lines.append(newlines + (not sample.endswith(b"\n")))
+            else:
+                bucket_lines.append(round(size * max(newlines, 1) / len(sample)))
+        return {"lines": bucket_lines, "bytes": bucket_bytes}
+
+    def _read_chunks(self, log_file, chunks: list[tuple[int, int]]) -> list[bytes]:
+        """Read (offset, length) chunks of a file, with one pipelined readv on an SFTP file."""
+        if not chunks:
+            return []
+        if hasattr(log_file, "readv"):
+            data = list(log_file.readv(chunks))
+        else:
+            data = []
+            for offset, length in chunks:
+                log_file.seek(offset)
+                data.append(log_file.read(length))
+        self.stats.add(bytes_read=sum(len(chunk) for chunk in data))
+        return data
+
+    def find_offset_by_timestamp(self, log_file, timestamp: float, lo: int, hi: int, parser) -> int:
+        """Find the offset of the first timestamped line whose date matches or exceeds timestamp.
+
+        Binary search on byte offsets: every probe reads around the middle of the range for the nearest line
+        with a timestamp (see `nearest_timestamped_line`), so lines without timestamps (stack traces, wrapped
+        messages) are skipped, and the lines without timestamps around it are cut off the range too, which
+        halves it at least. When the range is smaller than `linear_scan_bytes`, it switches to a linear scan
+        of that range. That's O(log n) probes plus a scan of at most linear_scan_bytes.
+
+        With time_slack, lines may be out of order by up to that many seconds, so a probe earlier than
+        timestamp doesn't prove that all lines before it are. The search then looks for timestamp - time_slack
+        instead, before which no line can match, and reads on from there to the first matching line.
+
+        Args:
+            log_file: Seekable binary file object.
+            timestamp (float): Wall clock seconds to search for.
+            lo (int): Byte offset (line boundary) to start searching from.
+            hi (int): Byte offset to stop searching at, usually the file size.
+            parser: Timestamp parser of the file (see detect_timestamp_parser).
+
+        Returns:
+            int: Byte offset of the matching line, or hi if no line matches (with time_slack, the end of the file).
+        """
+        search_timestamp = timestamp - self.time_slack
+        result = hi
+        probes = 0
+        # Invariant: the answer is the first matching timestamped line starting in [lo, hi), otherwise it is result
+        while hi - lo > self.linear_scan_bytes:
+            probes += 1
+            probe = self.nearest_timestamped_line(log_file, (lo + hi) // 2, lo, hi, parser)
+            if probe is None:
+                # No timestamped line in [lo, hi)
+                lo = hi
                 break
+            line_offset, _, date_in_line, before, after = probe
+            if date_in_line >= search_timestamp:
+                result = line_offset
+                hi = before
+            else:
+                lo = after
         # Linear search in the narrowed range
-        self.logger.debug(f"leftmost_index = {leftmost_index}, rightmost_index = {rightmost_index}")
-        for line in lines[leftmost_index:rightmost_index - 1]:
-            date_in_line = self.extract_date_from_line(line) # returns POSIX timestamp or None
-            if date_in_line:
-                if date_in_line >= self.to_date.timestamp():
-                    self.logger.debug(f"Found end line: {line.strip()}")
-                    line_number = lines.index(line)
+        self.logger.debug(f"lo = {lo}, hi = {hi}")
+        offset = start = self._snap_to_line_start(log_file, lo)
+        lines_parsed = 0
+        try:
+            while offset < hi:
+                line, line_length = self._read_line(log_file)
+                if not line:
                     break
-        # If no end line found, return the last line number. So, we include all lines till the end.
-        if line_number > 0:
-            return line_number
-        else:
-            return len(lines)
+                lines_parsed += 1
+                date_in_line = parser.parse(line)
+                if date_in_line is not None and date_in_line >= search_timestamp:
+                    result = offset
+                    break
+                offset += line_length
+        finally:
+            self.stats.add(probes=probes, lines_parsed=lines_parsed, bytes_read=offset - start)
+        if self.time_slack:
+            return self._skip_out_of_order(log_file, result, timestamp, parser)
+        return result
+
+    def _skip_out_of_order(self, log_file, offset: int, timestamp: float, parser) -> int:
+        """Offset of the first timestamped line at or after offset that matches or exceeds timestamp, or the end of the file.
+
+        offset is where the search for timestamp - time_slack ended, so the lines read are at most about
+        two slacks of log: the line found there is at most one slack earlier than timestamp, and lines
+        more than one slack later can't be earlier than timestamp anymore.
+        """
+        log_file.seek(offset)
+        start = offset
+        lines_parsed = 0
+        try:
+            while True:
+                line, line_length = self._read_line(log_file)
+                if not line:
+                    return offset
+                lines_parsed += 1
+                date_in_line = parser.parse(line)
+                if date_in_line is not None and date_in_line >= timestamp:
+                    return offset
+                offset += line_length
+        finally:
+            self.stats.add(lines_parsed=lines_parsed, bytes_read=offset - start)
+
+    def nearest_timestamped_line(self, log_file, offset: int, lo: int, hi: int, parser) -> tuple[int, int, float, int, int] | None:
+        """Find the timestamped line nearest to offset in [lo, hi), reading forward and backward of it in turns.
+
+        The blocks read on both sides double until a timestamped line is found, so the bytes read are
+        about four times the distance to the nearest timestamp, however long the stack traces around are,
+        and a probe into a run of lines without timestamps doesn't read to the end of the range.
+
+        Args:
+            offset (int): Byte offset of the probe, snapped to the next line boundary.
+            lo (int): Line boundary where the backward reads stop.
+            hi (int): Line boundary where the forward reads stop.
+
+        Returns:
+            tuple[int, int, float, int, int]: (line_offset, next_line_offset, timestamp, before, after) - lines in
+                [before, line_offset) and [next_line_offset, after) have no timestamps.
+                None if no line in [lo, hi) has a timestamp.
+        """
+        forward = backward = min(self._snap_to_line_start(log_file, offset), hi)
+        block_size = PROBE_BLOCK_SIZE
+        bytes_read = lines_parsed = 0
+        try:
+            # Lines in [backward, forward) have no timestamps
+            while forward < hi or backward > lo:
+                if forward < hi:
+                    log_file.seek(forward)
+                    length = min(block_size, hi - forward)
+                    block = log_file.read(length)
+                    bytes_read += len(block)
+                    # Only whole lines: the last one may go on after the block, unless the block ends at hi or at the end of the file
+                    end = len(block) if len(block) < length or forward + len(block) >= hi else block.rfind(b"\n") + 1
+                    line_start = 0
+                    while line_start < end:
+                        line_end = block.find(b"\n", line_start, end) + 1 or end
+                        lines_parsed += 1
+                        date_in_line = parser.parse(block[line_start:line_end])
+                        if date_in_line is not None:
+                            return forward + line_start, forward + line_end, date_in_line, backward, forward + line_end
+                        line_start = line_end
+                    forward = hi if not block else forward + end
+                if backward > lo:
+                    block_start = max(lo, backward - block_size)
+                    log_file.seek(block_start)
+                    block = log_file.read(backward - block_start)
+                    bytes_read += len(block)
+                    # Only whole lines: the first one may have started before the block, unless the block starts at lo
+                    first = 0 if block_start == lo else block.find(b"\n") + 1 or None
+                    if first is not None:
+                        line_end = len(block)
+                        while line_end > first:
+                            line_start = max(block.rfind(b"\n", first, line_end - 1) + 1, first)
+                            lines_parsed += 1
+                            date_in_line = parser.parse(block[line_start:line_end])
+                            if date_in_line is not None:
+                                return block_start + line_start, block_start + line_end, date_in_line, block_start + line_start, forward
+                            line_end = line_start
+                        backward = block_start + first
+                block_size *= 2
+            return None
+        finally:
+            self.stats.add(lines_parsed=lines_parsed, bytes_read=bytes_read)
+
+    def _snap_to_line_start(self, log_file, offset: int) -> int:
+        """Seek to the first line boundary at or after offset and return it."""
+        if offset <= 0:
+            log_file.seek(0)
+            return 0
+        # Reading from the previous byte handles the case when offset is already a line boundary
+        log_file.seek(offset - 1)
+        return offset - 1 + self._read_line(log_file)[1]
+
+    def _read_line(self, log_file) -> tuple[bytes, int]:
+        """Read the next line of a binary file, keeping at most max_line_bytes of it.
+
+        The rest of a longer line is read in pieces and dropped, so a file without newlines
+        (or with a huge line) is never held in memory. Timestamps are at the beginning of a line.
+
+        Returns:
+            tuple[bytes, int]: (head of the line, length of the whole line) - (b"", 0) at the end of the file.
+        """
+        line = log_file.readline(self.max_line_bytes)
+        line_length = len(line)
+        if line_length == self.max_line_bytes and not line.endswith(b"\n"):
+            while rest := log_file.readline(self.max_line_bytes):
+                line_length += len(rest)
+                if rest.endswith(b"\n"):
+                    break
+        return line, line_length
+
+    def next_timestamped_line(self, log_file, offset: int, end: int, parser) -> tuple[int, int, float] | None:
+        """Find the first line with a timestamp starting in [offset, end).
+
+        Returns:
+            tuple[int, int, float]: (line_offset, next_line_offset, timestamp) or None if there is no such line.
+        """
+        line_offset = start = self._snap_to_line_start(log_file, offset)
+        lines_parsed = 0
+        try:
+            while line_offset < end:
+                line, line_length = self._read_line(log_file)
+                if not line:
+                    return None
+                lines_parsed += 1
+                date_in_line = parser.parse(line)
+                if date_in_line is not None:
+                    return line_offset, line_offset + line_length, date_in_line
+                line_offset += line_length
+            return None
+        finally:
+            self.stats.add(lines_parsed=lines_parsed, bytes_read=line_offset - start)
+
+    def extract_date_from_line(self, line: str):
+        """Extract a date from a log line and convert it to wall clock seconds.
+
+        This method searches for common date patterns in a log line using regex patterns
+        and parses the first matching date string into wall clock seconds (see TimestampParser.wall_seconds).
+        It is slow, so cutting files uses it only when TimestampParser doesn't detect the format of a file.
+
+        Args:
+            line (str): A single line from a log file that may contain a date.
+
+        Returns:
+            float: Wall clock seconds of the extracted date, or None if no valid date is found.
+
+        Supported date formats:
+            - ISO 8601: "2025-10-09 15:30:45", "2025-10-09 15:30:45.123Z"
+            - Human readable: "Oct 9, 2025 3:30 PM"
+            - Date/time: "09/10/2025 15:30:45"
+            - ISO 8601 with T: "2025-10-09T15:30:45.123Z"
+        """
+        # date_patterns may require adding ^ to match at the start of the line only
+        date_patterns = [
+            r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:\.\d+)?Z?",  # 2025-10-09 15:30:45 or with milliseconds and Z
+            r"[A-Za-z]{3} \d{1,2}, \d{4} \d{1,2}:\d{2} [AP]M",   # Oct 9, 2025 3:30 PM
+            r"\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}",              # 09/10/2025 15:30:45
+            r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?Z?"   # 2025-10-09T15:30:45.123Z
+        ]
+        for pattern in date_patterns:
+            match = re.search(pattern, line)
+            if match:
+                date_str = match.group(0)
+                try:
+                    parsed_date = parse_date(date_str)
+                    return wall_seconds(parsed_date)
+                except (ValueError, OverflowError) as e:
+                    self.logger.error(f"Error parsing date string '{date_str}': {e}")
+        return None
@@ -0,0 +1,243 @@
+import re
+
+# Spellings of a log level in the level field of a line, a filter on any of them accepts all of them
+LEVEL_ALIASES = {
+    "TRACE": ("TRACE",),
+    "DEBUG": ("DEBUG", "DBG"),
+    "INFO": ("INFO", "INF"),
+    "NOTICE": ("NOTICE",),
+    "WARN": ("WARN", "WARNING", "WRN"),
+    "WARNING": ("WARN", "WARNING", "WRN"),
+    "ERROR": ("ERROR", "ERR"),
+    "ERR": ("ERROR", "ERR"),
+    "CRITICAL": ("CRITICAL", "CRIT", "FATAL"),
+    "CRIT": ("CRITICAL", "CRIT", "FATAL"),
+    "FATAL": ("CRITICAL", "CRIT", "FATAL"),
+}
+# Name of the regex group of the levels, a level matches only in the first line of an entry
+LEVEL_GROUP = "_level_"
+WORD_BYTES = re.compile(rb"\w")
+
+
+class LogFilter():
+    """Selects the entries of a cut log that contain a log level, a keyword or a regex match.
+
+    An entry is a timestamped line with the continuation lines (stack traces, wrapped messages) that follow it,
+    and it's kept or dropped as a whole. Levels, keywords and regexes are compiled into one bytes regex
+    alternation, so the window is searched match by match without splitting it into lines or decoding it,
+    and only the lines around a match are parsed to find the edges of its entry.
+    Levels match as whole words in the first line of an entry, keywords and regexes anywhere in it.
+    """
+
+    def __init__(self, levels: list[str] | None = None, keywords: list[str] | None = None, regexes: list[str] | None = None):
+        """
+        Args:
+            levels (list[str]): Log levels, e.g. ["ERROR", "WARN"]. Common spellings (WARNING, ERR, FATAL, ...) are included.
+            keywords (list[str]): Literal strings, case-sensitive.
+            regexes (list[str]): Regular expressions, use (?i:...) for case-insensitive parts.
+
+        Raises:
+            ValueError: No levels, keywords nor regexes were given, or a regex is invalid.
+        """
+        alternatives = [b"(?:" + regex.encode("utf-8") + b")" for regex in regexes or []]
+        if keywords:
+            # Longest first, so a keyword isn't shadowed by its own prefix
+            literals = sorted({keyword.encode("utf-8") for keyword in keywords if keyword}, key=len, reverse=True)
+            alternatives.append(b"(?:" + b"|".join(re.escape(literal) for literal in literals) + b")")
+        if levels:
+            names = {alias for level in levels for alias in LEVEL_ALIASES.get(level.upper(), (level.upper(),))}
+            level_names = b"|".join(re.escape(name.encode("utf-8")) for name in sorted(names, key=len, reverse=True))
+            # Last, so another alternative matching at the same position wins over a level outside the first line.
+            # The word boundary before the level is checked after the match (see FilteredWriter), a leading \b
+            # would stop the regex engine from skipping ahead to the literal prefix and make the search ~10x slower
+            alternatives.append(b"(?P<" + LEVEL_GROUP.encode() + b">(?:" + level_names + b")\\b)")
+        if not alternatives:
+            raise ValueError("A log filter needs levels, keywords or regexes")
+        try:
+            self.pattern = re.compile(b"|".join(alternatives))
+        except re.error as e:
+            raise ValueError(f"Invalid filter regex: {e}")
+
+    @classmethod
+    def from_settings(cls, settings: dict):
+        """LogFilter of the filter_levels, filter_keywords and filter_regexes settings, None if they are all empty."""
+        levels = settings.get("filter_levels") or []
+        keywords = settings.get("filter_keywords") or []
+        regexes = settings.get("filter_regexes") or []
+        if not (levels or keywords or regexes):
+            return None
+        return cls(levels, keywords, regexes)
+
+    def writer(self, open_output, parser, max_pending: int | None = None):
+        """Wrap the output of a cut so only the matching entries are written to it (see FilteredWriter)."""
+        return FilteredWriter(open_output, self, parser, max_pending)
+
+
+class FilteredWriter():
+    """Write-only stream that passes only the entries matching a LogFilter to the output.
+
+    Data can be written in chunks of any size: complete entries are filtered as soon as they are written,
+    the last entry waits for the next write because its continuation lines may still follow.
+    The output is opened with the first matching entry, so nothing is created if no entry matches.
+    An entry longer than max_pending is decided by its first max_pending bytes, and the rest of it
+    is passed through or dropped as it's written, so the memory used doesn't depend on the entries.
+    """
+
+    def __init__(self, open_output, log_filter: LogFilter, parser, max_pending: int | None = None):
+        """
+        Args:
+            open_output: Called without arguments to open the binary output file.
+            log_filter (LogFilter): Filter of the entries.
+            parser: Timestamp parser of the log, it tells entries apart.
+            max_pending (int): Bytes of the last entry kept until its end is known, None for no limit.
+        """
+        self._open_output = open_output
+        self._pattern = log_filter.pattern
+        self._parser = parser
+        self._dest_file = None
+        # The last entry written so far; lines of it after _checked are not known to be continuation lines yet
+        self._pending = b""
+        self._checked = 0
+        self._max_pending = max_pending
+        # Whether the rest of an oversized entry is written (True) or dropped (False), None outside of one
+        self._oversized = None
+        # Whether the pending bytes of an oversized entry start a line
+        self._at_line_start = True
+        self.bytes_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, data) -> int:
+        size = len(data)
+        block = self._pending + bytes(data) if self._pending else bytes(data)
+        self._pending = b""
+        if self._oversized is not None:
+            block = self._continue_oversized(block)
+            if not block:
+                return size
+            self._checked = 0
+        limit = block.rfind(b"\n") + 1
+        if not limit:
+            self._pending = block
+        else:
+            last_line_start = block.rfind(b"\n", 0, limit - 1) + 1
+            entry_start = self._entry_start(block, last_line_start, self._checked, 0)
+            self._write_matching(block, entry_start)
+            self._pending = block[entry_start:]
+            self._checked = limit - entry_start
+        if self._max_pending is not None and len(self._pending) > self._max_pending:
+            self._decide_oversized()
+        return size
+
+    def _decide_oversized(self) -> None:
+        """Decide the pending entry by its complete lines so far (or its only, incomplete line) and write it if it matches."""
+        block = self._pending
+        end = self._checked or len(block)
+        written = self.bytes_written
+        self._write_matching(block, end)
+        self._oversized = self.bytes_written > written
+        self._at_line_start = end == self._checked
+        self._pending = block[end:]
+        self._checked = 0
+
+    def _continue_oversized(self, block: bytes) -> bytes:
+        """Write or drop the continuation lines of an oversized entry at the start of block.
+
+        Returns:
+            bytes: The rest of block from the next timestamped line (the next entry) on, empty if the entry goes on.
+        """
+        offset = 0
+        if not self._at_line_start:
+            offset = block.find(b"\n") + 1 or len(block)
+        while offset < len(block):
+            line_end = block.find(b"\n", offset) + 1
+            if not line_end:
+                if len(block) - offset < self._max_pending:
+                    # The head of the line is needed to tell if it starts the next entry
+                    self._pass_oversized(block[:offset])
+                    self._pending = block[offset:]
+                    self._at_line_start = True
+                    return b""
+                line_end = len(block)
+            if self._parser.parse(block[offset:line_end]) is not None:
+                self._pass_oversized(block[:offset])
+                self._oversized = None
+                return block[offset:]
+            offset = line_end
+        self._pass_oversized(block)
+        self._at_line_start = block.endswith(b"\n")
+        return b""
+
+    def _pass_oversized(self, data: bytes) -> None:
+        if data and self._oversized:
+            if self._dest_file is None:
+                self._dest_file = self._open_output()
+            self._dest_file.write(data)
+            self.bytes_written += len(data)
+
+    def flush(self) -> None:
+        """Flush the entries written to the output so far. The last entry is still pending."""
+        if self._dest_file is not None:
+            self._dest_file.flush()
+
+    def close(self) -> None:
+        try:
+            if self._pending:
+                if self._oversized is not None and (not self._at_line_start or self._parser.parse(self._pending) is None):
+                    self._pass_oversized(self._pending)
+                else:
+                    self._write_matching(self._pending, len(self._pending))
+                self._pending = b""
+        finally:
+            if self._dest_file is not None:
+                self._dest_file.close()
+
+    def _write_matching(self, block: bytes, end: int) -> None:
+        """Write the matching entries of block[:end], which starts and ends at entry edges."""
+        entries_start = search_from = 0
+        level_group = self._pattern.groupindex.get(LEVEL_GROUP)
+        while search_from < end:
+            match = self._pattern.search(block, search_from, end)
+            if match is None:
+                return
+            line_start = block.rfind(b"\n", 0, match.start()) + 1
+            entry_start = self._entry_start(block, line_start, entries_start, entries_start)
+            if level_group is not None and match.start(level_group) != -1 and (
+                    entry_start != line_start or WORD_BYTES.match(block, match.start() - 1, match.start())):
+                # A level word in a continuation line (e.g. in a stack trace) or the end of a longer word
+                search_from = match.start() + 1
+                continue
+            match_end = max(match.end() - 1, match.start())
+            next_line_start = block.find(b"\n", match_end, end) + 1 or end
+            entry_end = self._entry_end(block, next_line_start, end)
+            if self._dest_file is None:
+                self._dest_file = self._open_output()
+            self._dest_file.write(memoryview(block)[entry_start:entry_end])
+            self.bytes_written += entry_end - entry_start
+            entries_start = search_from = entry_end
+
+    def _entry_start(self, block: bytes, line_start: int, lower: int, fallback: int) -> int:
+        """Start of the entry with the line at line_start: the nearest timestamped line from it back to the line at lower.
+
+        Returns fallback if none of these lines has a timestamp.
+        """
+        while True:
+            line_end = block.find(b"\n", line_start) + 1 or len(block)
+            if self._parser.parse(block[line_start:line_end]) is not None:
+                return line_start
+            if line_start <= lower:
+                return fallback
+            line_start = block.rfind(b"\n", lower, line_start - 1) + 1 or lower
+
+    def _entry_end(self, block: bytes, line_start: int, end: int) -> int:
+        """End of an entry whose lines continue at line_start: the next timestamped line, or end."""
+        while line_start < end:
+            line_end = block.find(b"\n", line_start, end) + 1 or end
+            if self._parser.parse(block[line_start:line_end]) is not None:
+                return line_start
+            line_start = line_end
+        return end
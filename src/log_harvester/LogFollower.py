@@ -0,0 +1,403 @@
+import ctypes
+import ctypes.util
+import logging # debug level is set in main.py
+import os
+import select
+import struct
+import threading
+
+from Compression import READ_ERRORS, compression_of
+from LogCutter import LogCutter
+
+# Bytes read from a followed log at once
+FOLLOW_READ_SIZE = 1024 * 1024
+# Bytes of the beginning of a followed log kept to tell a rotated log from a truncated one where there are no inode numbers (SFTP)
+FOLLOW_HEAD_BYTES = 256
+# Default interval between two polls of logs that can't be watched (remote logs, no inotify), in seconds
+FOLLOW_POLL_SECONDS = 2.0
+# Local logs are checked this often even without inotify events, e.g. on network filesystems that don't send them
+LOCAL_RESCAN_SECONDS = 30.0
+
+# inotify(7) events of a watched directory that can mean new data in, or a rotation of, one of its files
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+INOTIFY_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+# struct inotify_event without the name: wd, mask, cookie, len
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class Inotify():
+    """Minimal inotify(7) binding over ctypes: watches directories and reports which of their entries changed."""
+
+    def __init__(self):
+        """
+        Raises:
+            OSError: inotify is not available (not Linux, or out of inotify instances).
+        """
+        libc_name = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(libc_name, use_errno=True) if libc_name else None
+        if libc is None or not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_init1: {os.strerror(error)}")
+        self.directories = {}
+
+    def watch_directory(self, directory: str) -> None:
+        watch = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_WATCH_MASK)
+        if watch < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_add_watch {directory}: {os.strerror(error)}")
+        self.directories[watch] = directory
+
+    def read_events(self) -> set[tuple[str, str]] | None:
+        """Read the pending events.
+
+        Returns:
+            set[tuple[str, str]]: (directory, name) of every changed entry, or None if the kernel dropped events
+                (queue overflow) and any entry may have changed.
+        """
+        changed = set()
+        overflow = False
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return None if overflow else changed
+            offset = 0
+            while offset < len(buffer):
+                watch, mask, _, name_length = INOTIFY_EVENT.unpack_from(buffer, offset)
+                offset += INOTIFY_EVENT.size
+                name = buffer[offset:offset + name_length].rstrip(b"\0")
+                offset += name_length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                elif watch in self.directories:
+                    changed.add((self.directories[watch], os.fsdecode(name)))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class _FollowedLog():
+    """A followed log: its open source file, how far it has been read and its open cut log."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.source = None
+        # (st_dev, st_ino) of the open source, None where it's not known (SFTP)
+        self.identity = None
+        self.offset = 0
+        self.head = b""
+        self.dest_file_path = None
+        self.dest_file = None
+        # Bytes written to the cut log, and whether new ones are handed to on_data (not during the initial cut)
+        self.written = 0
+        self.live = False
+        # Last seen attributes of the remote path, an unchanged log is not checked further
+        self.path_attr = None
+
+
+class _LiveOutput():
+    """Cut log of a followed log. It counts the bytes written to it and, once the log is live,
+    hands them to on_write in one chunk per flush (a filter writes entry by entry).
+
+    fileno() is the one of the cut log, so the initial cut is still copied in the kernel (and not shown).
+    """
+
+    def __init__(self, dest_file, followed: _FollowedLog, on_write):
+        self._dest_file = dest_file
+        self._followed = followed
+        self._on_write = on_write
+        self._live_chunks = []
+
+    def write(self, data) -> int:
+        written = self._dest_file.write(data)
+        self._followed.written += len(data)
+        if self._followed.live and self._on_write is not None:
+            self._live_chunks.append(bytes(data))
+        return written
+
+    def fileno(self) -> int:
+        return self._dest_file.fileno()
+
+    def flush(self) -> None:
+        self._dest_file.flush()
+        if self._live_chunks:
+            data = b"".join(self._live_chunks)
+            self._live_chunks = []
+            self._on_write(self._followed, data)
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._dest_file.close()
+
+
+class LogFollower():
+    """Follows logs after the initial cut of an open-ended window, like `tail -F`.
+
+    The initial cut copies every log from from_date to its current end (to_date must be open, see LogCutter),
+    then the follower keeps the source logs open and appends only the bytes written to them since,
+    so nothing is searched or copied twice. A truncated log (copytruncate) is read again from its beginning,
+    a rotated log (renamed and recreated) is read to its end, then the new log at the same path is followed.
+    Subclasses wait for changes without busy polling: LocalLogFollower with inotify, RemoteLogFollower
+    with periodic stats over the pooled SFTP session. They implement `start`, `follow`, `_copy` and `_read`,
+    and name the phase of the initial copy in copy_phase.
+    """
+
+    copy_phase = "copy"
+
+    def __init__(self, log_cutter: LogCutter, host: str = "localhost", on_data=None, stop_event: threading.Event | None = None):
+        """
+        Args:
+            log_cutter (LogCutter): Cutter with the open-ended window and the output options, it collects the stats.
+            host (str): Host of the followed logs, for the stats and on_data.
+            on_data: Called with (host, path, data) for every chunk appended to a cut log after the initial cut,
+                from the following thread (e.g. to show the live streams in the TUI).
+            stop_event (threading.Event): Set to stop following. A new one is created if not given (see `stop`).
+        """
+        self.log_cutter = log_cutter
+        self.stats = log_cutter.stats
+        self.host = host
+        self.on_data = on_data
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+        self.followed = []
+        self.logger = logging.getLogger("LogFollower")
+
+    def stop(self) -> None:
+        """Stop following, `follow` returns soon after."""
+        self.stop_event.set()
+
+    def _start_log(self, followed: _FollowedLog, size: int, mtime: float) -> str:
+        """Cut the open-ended window of a log whose source is open, and start following it at its current end."""
+        source = followed.source
+        with self.stats.phase("locate"):
+            parser = self.log_cutter.detect_timestamp_parser(source, reference_time=mtime)
+            start_offset, end_offset = self.log_cutter.locate_window(source, size, parser)
+        followed.head = self._read(source, 0, min(FOLLOW_HEAD_BYTES, size))
+        self.stats.set_file_total(end_offset - start_offset)
+        followed.dest_file_path, followed.dest_file = self.log_cutter.open_dest_file(
+            followed.path, parser, wrap_output=lambda dest_file: _LiveOutput(dest_file, followed, self._on_write))
+        try:
+            with self.stats.phase(self.copy_phase):
+                copied = self._copy(source, followed.dest_file, start_offset, end_offset)
+            followed.dest_file.flush()
+        except BaseException:
+            followed.dest_file.close()
+            raise
+        followed.offset = end_offset
+        followed.live = True
+        # The kernel copy of a plain cut log doesn't pass through _LiveOutput.write
+        followed.written = self.log_cutter.written_bytes(followed.dest_file, copied)
+        self.stats.add(bytes_read=copied, bytes_written=followed.written)
+        self.followed.append(followed)
+        self.logger.info(f"Following {self.host}:{followed.path} from byte {end_offset}, cut log: {followed.dest_file_path}")
+        self.stats.file_outcome("cut", followed.dest_file_path)
+        return followed.dest_file_path
+
+    def _on_write(self, followed: _FollowedLog, data: bytes) -> None:
+        if self.on_data is not None:
+            self.on_data(self.host, followed.path, data)
+
+    def _append_new(self, followed: _FollowedLog, size: int) -> int:
+        """Append bytes [offset, size) of the source to the cut log.
+
+        Returns:
+            int: Number of bytes read.
+        """
+        read = 0
+        written = followed.written
+        while followed.offset < size:
+            data = self._read(followed.source, followed.offset, min(FOLLOW_READ_SIZE, size - followed.offset))
+            if not data:
+                break
+            if len(followed.head) < FOLLOW_HEAD_BYTES and followed.offset == len(followed.head):
+                followed.head += data[:FOLLOW_HEAD_BYTES - len(followed.head)]
+            followed.dest_file.write(data)
+            # Every read is handed on at once, so a log that grew a lot since the last poll isn't held in memory
+            followed.dest_file.flush()
+            followed.offset += len(data)
+            read += len(data)
+        if read:
+            self.stats.add(bytes_read=read, bytes_written=followed.written - written)
+            self.stats.file_appended(followed.path, followed.written - written, self.host)
+        return read
+
+    def _truncated(self, followed: _FollowedLog) -> None:
+        self.logger.info(f"Log {self.host}:{followed.path} was truncated, following it from its beginning")
+        followed.offset = 0
+        followed.head = b""
+
+    def _reopened(self, followed: _FollowedLog, source, identity=None) -> None:
+        """Replace the source of a rotated log with the new log at its path, which is followed from its beginning."""
+        self.logger.info(f"Log {self.host}:{followed.path} was rotated, following the new one")
+        self._close_source(followed)
+        followed.source = source
+        followed.identity = identity
+        followed.offset = 0
+        followed.head = b""
+
+    @staticmethod
+    def _close_source(followed: _FollowedLog) -> None:
+        try:
+            followed.source.close()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        """Close the followed logs and their cut logs (a filter writes its last pending entry then)."""
+        for followed in self.followed:
+            self._close_source(followed)
+            written = followed.written
+            try:
+                followed.dest_file.close()
+            except OSError as e:
+                self.logger.error(f"Error closing cut log {followed.dest_file_path}: {e}")
+            self.stats.add(bytes_written=followed.written - written)
+            self.stats.follow_stopped(followed.path, self.host)
+        self.followed = []
+
+
+class LocalLogFollower(LogFollower):
+    """Follows local logs. It sleeps in select() on an inotify descriptor watching their directories,
+    so an idle follower uses no CPU; without inotify (not Linux) it polls every poll_seconds.
+    Rotations are told apart from appends by the inode of the path.
+    """
+
+    def __init__(self, log_cutter: LogCutter, on_data=None, stop_event: threading.Event | None = None, poll_seconds: float = FOLLOW_POLL_SECONDS):
+        super().__init__(log_cutter, "localhost", on_data, stop_event)
+        self.poll_seconds = poll_seconds
+        self._wake_write = None
+
+    def start(self, log_paths: list[str]) -> list[str | None]:
+        """Cut the open-ended window of all logs of the requested paths and start following them.
+
+        Compressed rotations don't grow, they are only cut.
+
+        Returns:
+            list[str | None]: Path of the cut log for every log file (None if nothing was written).
+        """
+        with self.stats.phase("discovery"):
+            log_files = self.log_cutter.discover_log_files(log_paths)
+        for log_file in log_files:
+            self.stats.queue_file(log_file, os.path.getsize(log_file))
+        results = []
+        for log_file in log_files:
+            if compression_of(log_file) is not None:
+                results.append(self.log_cutter.cut_log_file(log_file))
+                continue
+            with self.stats.track_file(log_file):
+                result = self._start_local(log_file)
+            if result is not None:
+                self.stats.file_appended(log_file, 0)
+            results.append(result)
+        return results
+
+    def _start_local(self, log_file: str) -> str | None:
+        followed = _FollowedLog(log_file)
+        try:
+            followed.source = open(log_file, "rb")
+            file_stat = os.fstat(followed.source.fileno())
+            if self.log_cutter.is_modified_before_window(file_stat.st_mtime):
+                self.logger.info(f"Log file {log_file} was last modified before the date range. Skipping it.")
+                self.stats.file_outcome("skipped")
+                followed.source.close()
+                return None
+            followed.identity = (file_stat.st_dev, file_stat.st_ino)
+            return self._start_log(followed, file_stat.st_size, file_stat.st_mtime)
+        except READ_ERRORS as e:
+            self.logger.error(f"Error following log file {log_file}: {e}")
+            self.stats.file_outcome("failed")
+            if followed.source is not None:
+                followed.source.close()
+            return None
+
+    def _copy(self, source, dest_file, start_offset: int, end_offset: int) -> int:
+        return self.log_cutter.copy_byte_range(source, dest_file, start_offset, end_offset)
+
+    @staticmethod
+    def _read(source, offset: int, length: int) -> bytes:
+        source.seek(offset)
+        return source.read(length)
+
+    def stop(self) -> None:
+        super().stop()
+        self._wake()
+
+    def _wake(self) -> None:
+        """Wake the select() of `follow` up, e.g. after stop_event was set."""
+        if self._wake_write is not None:
+            try:
+                os.write(self._wake_write, b"\0")
+            except OSError:
+                pass
+
+    def follow(self) -> None:
+        """Append new data of the followed logs until stop_event is set, then close them."""
+        inotify = None
+        if self.followed:
+            try:
+                inotify = Inotify()
+                for directory in {os.path.dirname(followed.path) or "." for followed in self.followed}:
+                    inotify.watch_directory(directory)
+            except OSError as e:
+                self.logger.info(f"inotify is not available ({e}), polling the followed logs every {self.poll_seconds}s")
+                if inotify is not None:
+                    inotify.close()
+                inotify = None
+        wake_read = None
+        if inotify is not None:
+            wake_read, self._wake_write = os.pipe()
+            # stop_event may be set by someone who doesn't know the pipe
+            threading.Thread(target=lambda: (self.stop_event.wait(), self._wake()), name="follow-wake", daemon=True).start()
+        try:
+            while not self.stop_event.is_set():
+                if inotify is None:
+                    if self.stop_event.wait(self.poll_seconds):
+                        break
+                    changed = None
+                else:
+                    ready, _, _ = select.select([inotify.fd, wake_read], [], [], LOCAL_RESCAN_SECONDS)
+                    if wake_read in ready:
+                        break
+                    changed = inotify.read_events() if ready else None
+                for followed in self.followed:
+                    if changed is None or (os.path.dirname(followed.path) or ".", os.path.basename(followed.path)) in changed:
+                        self._check(followed)
+        finally:
+            self.close()
+            if inotify is not None:
+                inotify.close()
+                wake_write, self._wake_write = self._wake_write, None
+                os.close(wake_read)
+                os.close(wake_write)
+
+    def _check(self, followed: _FollowedLog) -> None:
+        """Append the new data of a log, and switch to the new log at its path if it was rotated."""
+        try:
+            source_stat = os.fstat(followed.source.fileno())
+            if source_stat.st_size < followed.offset:
+                self._truncated(followed)
+            # A rotated log is read to its end first
+            self._append_new(followed, source_stat.st_size)
+            try:
+                path_stat = os.stat(followed.path)
+            except FileNotFoundError:
+                # Rotated away and not recreated yet
+                return
+            if (path_stat.st_dev, path_stat.st_ino) != followed.identity:
+                source = open(followed.path, "rb")
+                file_stat = os.fstat(source.fileno())
+                self._reopened(followed, source, (file_stat.st_dev, file_stat.st_ino))
+                self._append_new(followed, file_stat.st_size)
+        except OSError as e:
+            self.logger.error(f"Error following log file {followed.path}: {e}")
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import logging # debug level is set in main.py
+import os
+from bisect import bisect_left
+from pathlib import Path
+
+# Distance in bytes between two index entries
+INDEX_STRIDE_BYTES = 1024 * 1024
+# Bytes from the beginning of the file hashed to detect that it was rotated or rewritten
+HEAD_HASH_BYTES = 4096
+INDEX_VERSION = 1
+
+
+class LogIndex():
+    """Persistent sparse timestamp index of one log file.
+
+    Every INDEX_STRIDE_BYTES bytes it stores the offset and timestamp of the first timestamped line,
+    so a later search only has to scan the stride between two entries. The index is stored as JSON
+    under index_dir and is keyed by the inode, size and mtime of the file. When an append-only log grows,
+    the index is extended from the last indexed stride; when the file is rotated or truncated it is rebuilt.
+    """
+
+    def __init__(self, log_file_path: str, index_dir: str | Path, stride: int = INDEX_STRIDE_BYTES):
+        self.log_file_path = os.path.abspath(log_file_path)
+        self.index_dir = Path(index_dir)
+        self.stride = stride
+        self.index_path = self.index_dir / f"{hashlib.sha1(self.log_file_path.encode()).hexdigest()}.json"
+        self.logger = logging.getLogger("LogIndex")
+        self.data = None
+        self._timestamps = []
+
+    def update(self, log_file, file_stat: os.stat_result, parser, log_cutter) -> None:
+        """Load the stored index, then extend or rebuild it so it covers the current file.
+
+        Args:
+            log_file: The log file opened in binary mode.
+            file_stat (os.stat_result): Stat of the open file.
+            parser: Timestamp parser of the file.
+            log_cutter (LogCutter): Cutter used to probe timestamps.
+        """
+        data = self._load()
+        if data is not None and not self._is_valid_for(data, log_file, file_stat, parser):
+            self.logger.debug(f"Index of {self.log_file_path} is outdated (rotation or truncation), rebuilding it.")
+            data = None
+        if data is None:
+            data = {
+                "version": INDEX_VERSION,
+                "path": self.log_file_path,
+                "device": file_stat.st_dev,
+                "inode": file_stat.st_ino,
+                "format": parser.name,
+                "stride": self.stride,
+                "head_length": 0,
+                "head_hash": "",
+                "indexed_until": 0,
+                "entries": [],
+            }
+        if data.get("size") != file_stat.st_size or data.get("mtime") != file_stat.st_mtime:
+            self._extend(data, log_file, file_stat.st_size, parser, log_cutter)
+            data["size"] = file_stat.st_size
+            data["mtime"] = file_stat.st_mtime
+            self._save(data)
+        self.data = data
+        self._timestamps = [timestamp for _, timestamp in data["entries"]]
+
+    def bounds(self, timestamp: float, file_size: int) -> tuple[int, int]:
+        """Narrow the search for timestamp down to the bytes between two index entries.
+
+        Returns:
+            tuple[int, int]: (lo, hi) to pass to LogCutter.find_offset_by_timestamp.
+                The first line matching timestamp starts in [lo, hi), or it is hi itself.
+        """
+        entries = self.data["entries"] if self.data else []
+        i = bisect_left(self._timestamps, timestamp)
+        lo = entries[i - 1][0] if i > 0 else 0
+        hi = entries[i][0] if i < len(entries) else file_size
+        return lo, hi
+
+    def estimate_window_bytes(self, windows: list[tuple[float, float]], file_stat: os.stat_result) -> int | None:
+        """Estimate the bytes of the windows in the file from the stored index, without opening the file (see Scheduler).
+
+        Every window is taken from the entry before its start to the entry after its end,
+        so an estimate is too large by at most a stride per edge.
+
+        Returns:
+            int | None: The estimated bytes, or None if there's no stored index of this file (or it has no entries).
+        """
+        data = self._load()
+        if (data is None or not data.get("entries") or data.get("version") != INDEX_VERSION or data.get("inode") != file_stat.st_ino
+                or data.get("size", 0) > file_stat.st_size):
+            return None
+        self.data = data
+        self._timestamps = [timestamp for _, timestamp in data["entries"]]
+        window_bytes = 0
+        for from_timestamp, to_timestamp in windows:
+            start_offset, _ = self.bounds(from_timestamp, file_stat.st_size)
+            _, end_offset = self.bounds(to_timestamp, file_stat.st_size)
+            window_bytes += max(end_offset - start_offset, 0)
+        return window_bytes
+
+    def _is_valid_for(self, data: dict, log_file, file_stat: os.stat_result, parser) -> bool:
+        """The stored index may be reused (and extended) if it's the same file that only grew."""
+        if (data.get("version") != INDEX_VERSION or data.get("stride") != self.stride or data.get("format") != parser.name
+                or data.get("device") != file_stat.st_dev or data.get("inode") != file_stat.st_ino
+                or data.get("size", 0) > file_stat.st_size):
+            return False
+        return self._head_hash(log_file, data["head_length"]) == data["head_hash"]
+
+    def _extend(self, data: dict, log_file, file_size: int, parser, log_cutter) -> None:
+        """Probe every complete stride after indexed_until (the last, incomplete one may still be written)."""
+        entries = data["entries"]
+        offset = data["indexed_until"]
+        while offset + self.stride <= file_size:
+            probe = log_cutter.next_timestamped_line(log_file, offset, offset + self.stride, parser)
+            if probe is not None:
+                line_offset, _, timestamp = probe
+                # Keep the index sorted even if the log has lines slightly out of order
+                if not entries or timestamp >= entries[-1][1]:
+                    entries.append([line_offset, timestamp])
+            offset += self.stride
+        data["indexed_until"] = offset
+        data["head_length"] = min(HEAD_HASH_BYTES, file_size)
+        data["head_hash"] = self._head_hash(log_file, data["head_length"])
+
+    def _head_hash(self, log_file, length: int) -> str:
+        log_file.seek(0)
+        return hashlib.sha1(log_file.read(length)).hexdigest()
+
+    def _load(self) -> dict | None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as index_file:
+                return json.load(index_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Error reading index {self.index_path}: {e}")
+            return None
+
+    def _save(self, data: dict) -> None:
+        # Write to a temporary file and rename it, so concurrent cuts never read a half-written index
+        tmp_path = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as index_file:
+                json.dump(data, index_file)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            self.logger.error(f"Error saving index {self.index_path}: {e}")
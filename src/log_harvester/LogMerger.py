@@ -0,0 +1,116 @@
+import heapq
+import logging # debug level is set in main.py
+from contextlib import ExitStack
+from functools import partial
+from itertools import chain, islice
+from operator import itemgetter
+
+from Compression import compression_of, open_compressed_output, open_decompressed
+from LogCutter import LogCutter
+from TimestampParser import DETECTION_SAMPLE_LINES
+
+MERGED_FILE_NAME = "merged.log"
+# Write buffer of the merged log, entries are small so they are batched into large writes
+MERGE_WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class LogMerger():
+    """Merges cut logs into one log ordered by timestamp.
+
+    It's a streaming k-way merge (heapq.merge): every input is read entry by entry, where an entry is
+    a timestamped line with the continuation lines (stack traces, wrapped messages) that follow it,
+    so the memory used depends on the number of inputs, not on their size.
+    Entries with equal timestamps keep the order of the inputs. An entry longer than the stream chunks of
+    the cutter is handed to the merge in pieces with the same timestamp, which stay together for that reason,
+    and lines are read in pieces of that size too.
+    """
+
+    def __init__(self, log_cutter: LogCutter):
+        """
+        Args:
+            log_cutter (LogCutter): Cutter of the merged logs. It detects their timestamp formats and collects the stats.
+        """
+        self.log_cutter = log_cutter
+        self.logger = logging.getLogger("LogMerger")
+
+    def merge(self, inputs: list[tuple[str, str | None]], dest_file_path: str) -> int:
+        """Merge the inputs into dest_file_path.
+
+        Args:
+            inputs (list[tuple[str, str | None]]): (path, tag) of every cut log, plain or compressed.
+                Every line of an input with a tag is prefixed with "[tag] ".
+            dest_file_path (str): Path of the merged log. It's compressed if it ends with .gz or .zst.
+
+        Returns:
+            int: Number of entries written.
+        """
+        entries = 0
+        with self.log_cutter.stats.phase("merge"), ExitStack() as stack:
+            entry_streams = [self._read_entries(stack.enter_context(self._open_input(path)), tag) for path, tag in inputs]
+            compression = compression_of(dest_file_path)
+            if compression is not None:
+                dest_file = open_compressed_output(dest_file_path, compression, self.log_cutter.output_buffer_size)
+            else:
+                dest_file = open(dest_file_path, "wb", buffering=MERGE_WRITE_BUFFER_SIZE)
+            with dest_file:
+                for _, entry in heapq.merge(*entry_streams, key=itemgetter(0)):
+                    dest_file.writelines(entry)
+                    entries += 1
+        self.logger.info(f"Merged {len(inputs)} cut logs into {dest_file_path} ({entries} entries)")
+        return entries
+
+    @staticmethod
+    def _open_input(path: str):
+        """Open a cut log for reading, decompressing it on the fly if it's compressed."""
+        compression = compression_of(path)
+        if compression is None:
+            return open(path, "rb")
+        raw_file = open(path, "rb")
+        try:
+            return open_decompressed(raw_file, compression)
+        except ValueError:
+            raw_file.close()
+            raise
+
+    def _read_entries(self, log_file, tag: str | None):
+        """Yield (timestamp, lines) of every entry of a log.
+
+        Lines before the first timestamp form an entry that goes before everything else.
+        """
+        max_bytes = self.log_cutter.stream_chunk_size
+        pieces = iter(partial(log_file.readline, max_bytes), b"")
+        sample_lines = list(islice(pieces, DETECTION_SAMPLE_LINES))
+        # Every line of a cut log is before to_date, so it's the best reference for year-less timestamps
+        parser = self.log_cutter.parser_from_sample(sample_lines, reference_time=self.log_cutter.to_date.timestamp())
+        prefix = f"[{tag}] ".encode() if tag else b""
+        timestamp = float("-inf")
+        entry = []
+        entry_bytes = 0
+        lines_parsed = 0
+        # Whether the next piece starts a line, the rest of a line longer than max_bytes is neither parsed nor prefixed
+        line_start = True
+        piece = b""
+        for piece in chain(sample_lines, pieces):
+            if line_start:
+                lines_parsed += 1
+                date_in_line = parser.parse(piece)
+                if date_in_line is not None:
+                    if entry:
+                        yield timestamp, entry
+                        entry, entry_bytes = [], 0
+                    timestamp = date_in_line
+                if prefix:
+                    piece = prefix + piece
+            if entry_bytes >= max_bytes:
+                # A long entry goes on in the next piece with the same timestamp
+                yield timestamp, entry
+                entry, entry_bytes = [], 0
+            entry.append(piece)
+            entry_bytes += len(piece)
+            line_start = piece.endswith(b"\n")
+        if not line_start and piece:
+            # The last line of the input, the next entry of the merged log must not continue it
+            entry.append(b"\n")
+        if entry:
+            yield timestamp, entry
+        self.log_cutter.stats.add(lines_parsed=lines_parsed)
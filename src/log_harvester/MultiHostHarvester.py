@@ -0,0 +1,185 @@
+import logging # debug level is set in main.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from DownloadCache import DownloadCache
+from LogFilter import LogFilter
+from RemoteLogCutter import RemoteLogCutter
+from RunStats import RunStats
+
+
+class MultiHostHarvester():
+    """Fetches the same time window from several hosts in one job.
+
+    Every host gets its own RemoteLogCutter (one SSH connection with max_workers_per_host transfers),
+    all hosts run at once, and a global semaphore caps the number of transfers across all hosts.
+    """
+
+    def __init__(self, from_date: str, to_date: str, dest_path: str, hosts: list[dict], max_concurrent_transfers: int = 16,
+                 max_workers_per_host: int = 4, retries: int = 3, server_side_cut: bool = True, stats: RunStats | None = None,
+                 output_compression: str | None = None, log_filter: LogFilter | None = None, download_cache: DownloadCache | None = None,
+                 recursive: bool = False, include_globs: list[str] | None = None, exclude_globs: list[str] | None = None,
+                 windows: list | None = None, window_padding: float = 0.0, time_slack: float = 0.0,
+                 buffer_size: int | None = None, undecodable: str = "replace", deadline: float | None = None):
+        """
+        Args:
+            hosts (list[dict]): Host specs: {"hostname", "port", "username", "password", "paths"}.
+                "paths" is the list of log files or directories to cut on that host.
+            max_concurrent_transfers (int): Global limit of files transferred at once, across all hosts.
+            max_workers_per_host (int): Limit of files transferred at once from a single host.
+            stats (RunStats): Counters and per-file progress shared by all hosts.
+            output_compression (str): "gzip" or "zstd" to write the cut logs compressed, None for plain text.
+            log_filter (LogFilter): Write only the entries of the windows that match it.
+            download_cache (DownloadCache): Persistent cache of downloaded bytes shared by all hosts.
+            recursive, include_globs, exclude_globs: How log files are found in remote directories (see RemoteLogCutter.get_log_list).
+            windows, window_padding: Several windows to cut at once instead of from_date/to_date (see LogCutter).
+            time_slack (float): Seconds log lines can be out of order (see LogCutter).
+            buffer_size, undecodable: Memory and decoding options of the transfers (see RemoteLogCutter).
+            deadline (float): time.time() after which the files that haven't started are left out (see LogCutter).
+        """
+        self.from_date = from_date
+        self.to_date = to_date
+        self.dest_path = dest_path
+        self.hosts = hosts
+        self.max_workers_per_host = max_workers_per_host
+        self.retries = retries
+        self.server_side_cut = server_side_cut
+        self.transfer_slots = threading.BoundedSemaphore(max(1, max_concurrent_transfers))
+        self.stats = stats if stats is not None else RunStats()
+        self.output_compression = output_compression
+        self.log_filter = log_filter
+        self.download_cache = download_cache
+        self.recursive = recursive
+        self.include_globs = include_globs
+        self.exclude_globs = exclude_globs
+        self.windows = windows
+        self.window_padding = window_padding
+        self.time_slack = time_slack
+        self.buffer_size = buffer_size
+        self.undecodable = undecodable
+        self.deadline = deadline
+        self.logger = logging.getLogger("MultiHostHarvester")
+
+    def host_label(self, host: dict) -> str:
+        """Name of the host's subdirectory in dest_path and in the summary."""
+        port = host.get("port", 22)
+        duplicates = [h for h in self.hosts if h.get("hostname") == host.get("hostname")]
+        return host["hostname"] if len(duplicates) == 1 else f"{host['hostname']}_{port}"
+
+    def harvest(self) -> dict[str, dict]:
+        """Cut the logs on all hosts concurrently.
+
+        With more than one host, cut logs land in per-host subdirectories of dest_path.
+
+        Returns:
+            dict[str, dict]: Status per host label: {"status", "files", "cut", "seconds", "error"}.
+        """
+        return self._run_hosts(RemoteLogCutter.cut_logs)
+
+    def follow(self, stop_event: threading.Event, poll_seconds: float, on_data=None) -> dict[str, dict]:
+        """Cut the open-ended window on all hosts, then follow their logs until stop_event is set (see RemoteLogFollower).
+
+        Args:
+            stop_event (threading.Event): Set to stop following.
+            poll_seconds (float): Interval between two polls of the logs of a host.
+            on_data: Called with (host, path, data) for every chunk appended to a cut log.
+
+        Returns:
+            dict[str, dict]: Status per host label, like `harvest`.
+        """
+        def follow_host_logs(remote_lc: RemoteLogCutter, log_paths: list[str]) -> list[str | None]:
+            from RemoteLogFollower import RemoteLogFollower
+            follower = RemoteLogFollower(remote_lc, on_data, stop_event, poll_seconds)
+            try:
+                results = follower.start(log_paths)
+            except BaseException:
+                follower.close()
+                raise
+            follower.follow()
+            return results
+
+        return self._run_hosts(follow_host_logs)
+
+    def preview(self, edges: list[float]) -> tuple[dict[str, dict], list[dict]]:
+        """Estimate the lines and bytes of every time bucket of the logs on all hosts (see RemoteLogCutter.preview_logs).
+
+        Returns:
+            tuple[dict[str, dict], list[dict]]: Status per host label like `harvest`, and the previews of all logs.
+        """
+        previews = []
+
+        def preview_host_logs(remote_lc: RemoteLogCutter, log_paths: list[str]) -> list[dict | None]:
+            results = remote_lc.preview_logs(log_paths, edges)
+            previews.extend(result for result in results if result is not None)
+            return results
+
+        return self._run_hosts(preview_host_logs), previews
+
+    def _run_hosts(self, cut_host_logs) -> dict[str, dict]:
+        """Run cut_host_logs(remote_log_cutter, paths) for all hosts concurrently and summarize the results."""
+        with ThreadPoolExecutor(max_workers=max(1, len(self.hosts)), thread_name_prefix="host") as executor:
+            results = list(executor.map(lambda host: self._harvest_host(host, cut_host_logs), self.hosts))
+        summary = dict(zip((self.host_label(host) for host in self.hosts), results))
+        self.logger.info(f"Harvest finished:\n{self.format_summary(summary)}")
+        return summary
+
+    def make_remote_cutter(self, host: dict) -> RemoteLogCutter:
+        """Connect to a host: its RemoteLogCutter with the options of the job, cutting into its subdirectory with more than one host."""
+        label = self.host_label(host)
+        return RemoteLogCutter(
+            from_date=self.from_date,
+            to_date=self.to_date,
+            dest_path=os.path.join(self.dest_path, label) if len(self.hosts) > 1 else self.dest_path,
+            hostname=host["hostname"],
+            username=host.get("username", ""),
+            password=host.get("password", ""),
+            port=host.get("port", 22),
+            server_side_cut=self.server_side_cut,
+            max_workers=self.max_workers_per_host,
+            retries=self.retries,
+            transfer_slots=self.transfer_slots,
+            stats=self.stats,
+            output_compression=self.output_compression,
+            log_filter=self.log_filter,
+            download_cache=self.download_cache,
+            recursive=self.recursive,
+            include_globs=self.include_globs,
+            exclude_globs=self.exclude_globs,
+            windows=self.windows,
+            window_padding=self.window_padding,
+            time_slack=self.time_slack,
+            buffer_size=self.buffer_size,
+            undecodable=self.undecodable,
+            deadline=self.deadline,
+        )
+
+    def _harvest_host(self, host: dict, cut_host_logs) -> dict:
+        label = self.host_label(host)
+        started = time.monotonic()
+        status = {"status": "failed", "files": 0, "cut": 0, "seconds": 0.0, "error": ""}
+        remote_lc = None
+        try:
+            remote_lc = self.make_remote_cutter(host)
+            results = cut_host_logs(remote_lc, list(host.get("paths", [])))
+            status.update(status="ok", files=len(results), cut=sum(1 for result in results if result))
+        except Exception as e:
+            self.logger.error(f"Harvesting logs from {label} failed: {e}")
+            status["error"] = str(e)
+        finally:
+            if remote_lc is not None:
+                remote_lc.close()
+        status["seconds"] = round(time.monotonic() - started, 3)
+        return status
+
+    @staticmethod
+    def format_summary(summary: dict[str, dict]) -> str:
+        """Human-readable per-host status summary, one host per line."""
+        lines = []
+        for label, status in summary.items():
+            line = f"{label}: {status['status']}, {status['cut']}/{status['files']} files cut in {status['seconds']:.1f}s"
+            if status["error"]:
+                line += f" ({status['error']})"
+            lines.append(line)
+        return "\n".join(lines)
@@ -0,0 +1,162 @@
+import io
+import json
+import logging # debug level is set in main.py
+import os
+import queue
+import tarfile
+import threading
+import time
+
+from Compression import check_output_compression, open_compressor
+
+BUNDLE_FILE_NAME = "harvest_bundle.tar"
+MANIFEST_FILE_NAME = "manifest.json"
+BUNDLE_SUFFIXES = {
+    "zstd": ".zst",
+    "gzip": ".gz",
+}
+# Bytes read from a cut log at once while it's added to the bundle
+BUNDLE_READ_SIZE = 1024 * 1024
+
+
+class _LineCountingReader():
+    """Reader of a file that counts the lines passing through it, so adding a file to the bundle reads it only once."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.lines = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.lines += data.count(b"\n")
+        return data
+
+
+class OutputBundle():
+    """Packs the cut logs of a run into one compressed tar archive (.tar.zst or .tar.gz) with a manifest.
+
+    Cut logs are added by a worker thread as soon as they are cut (see `add`), so compressing the bundle
+    overlaps with cutting the other files instead of being a serial step at the end.
+    The manifest (manifest.json, the last member) lists the source host and path, the date range,
+    the size and the line count of every packed log.
+    """
+
+    def __init__(self, dest_path: str, from_date: str, to_date: str, compression: str = "zstd"):
+        """
+        Args:
+            dest_path (str): Directory of the cut logs, the bundle is created in it.
+            compression (str): "zstd" or "gzip".
+
+        Raises:
+            ValueError: The compression is unknown or its module is not installed.
+        """
+        if compression not in BUNDLE_SUFFIXES:
+            raise ValueError(f"Unknown bundle compression: {compression}")
+        check_output_compression(compression)
+        self.dest_path = dest_path
+        self.bundle_path = os.path.join(dest_path, BUNDLE_FILE_NAME + BUNDLE_SUFFIXES[compression])
+        self.manifest = {"from_date": from_date, "to_date": to_date, "created": time.time(), "files": []}
+        self.packed_paths = []
+        self.logger = logging.getLogger("OutputBundle")
+        os.makedirs(dest_path, exist_ok=True)
+        self._file = open(self.bundle_path, "wb")
+        self._compressor = open_compressor(self._file, compression)
+        self._tar = tarfile.open(fileobj=self._compressor, mode="w|")
+        self._tar.copybufsize = BUNDLE_READ_SIZE
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._pack, name="bundle", daemon=True)
+        self._thread.start()
+
+    def add(self, path: str, host: str | None = None, source_path: str | None = None) -> None:
+        """Queue a log to be packed. The name in the bundle is its path relative to dest_path.
+
+        Args:
+            host (str): Host of the source log, None for logs made of several sources (the merged log).
+            source_path (str): Path of the source log on the host.
+        """
+        self._queue.put((path, host, source_path))
+
+    def add_file_entry(self, entry: dict) -> None:
+        """Queue the cut log of a RunStats file entry, it's meant to be RunStats.on_file_cut.
+
+        With several windows, the entry has a cut log for every window.
+        """
+        for dest in entry["dest"] if isinstance(entry["dest"], list) else [entry["dest"]]:
+            self.add(dest, entry["host"], entry["path"])
+
+    def _pack(self) -> None:
+        while (item := self._queue.get()) is not None:
+            if self._error is not None:
+                continue
+            path, host, source_path = item
+            try:
+                self._pack_file(path, host, source_path)
+            except (OSError, tarfile.TarError) as e:
+                # Keep draining the queue, close() raises the error
+                self._error = e
+
+    def _pack_file(self, path: str, host: str | None, source_path: str | None) -> None:
+        arcname = os.path.relpath(path, self.dest_path)
+        with open(path, "rb") as cut_file:
+            tar_info = self._tar.gettarinfo(fileobj=cut_file, arcname=arcname)
+            reader = _LineCountingReader(cut_file)
+            self._tar.addfile(tar_info, reader)
+        self.manifest["files"].append({
+            "name": arcname,
+            "host": host,
+            "source_path": source_path,
+            "bytes": tar_info.size,
+            "lines": reader.lines,
+        })
+        self.packed_paths.append(path)
+
+    def close(self, remove_packed: bool = True) -> str:
+        """Pack the queued logs and the manifest and finish the bundle.
+
+        Args:
+            remove_packed (bool): Remove the packed cut logs, the bundle replaces them.
+
+        Returns:
+            str: Path of the bundle.
+
+        Raises:
+            OSError: Packing a file or writing the bundle failed.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            if self._error is None:
+                manifest = json.dumps(self.manifest, indent=4).encode("utf-8")
+                tar_info = tarfile.TarInfo(MANIFEST_FILE_NAME)
+                tar_info.size = len(manifest)
+                tar_info.mtime = int(time.time())
+                self._tar.addfile(tar_info, io.BytesIO(manifest))
+            self._tar.close()
+            self._compressor.close()
+        finally:
+            self._file.close()
+        if self._error is not None:
+            raise OSError(f"Packing the bundle {self.bundle_path} failed: {self._error}") from self._error
+        if remove_packed:
+            self._remove_packed()
+        self.logger.info(f"Bundle saved to: {self.bundle_path} ({len(self.packed_paths)} logs)")
+        return self.bundle_path
+
+    def _remove_packed(self) -> None:
+        """Remove the packed cut logs and the per-host and per-window directories left empty."""
+        directories = set()
+        for path in self.packed_paths:
+            try:
+                os.remove(path)
+            except OSError as e:
+                self.logger.error(f"Error removing packed log {path}: {e}")
+            directories.add(os.path.dirname(path))
+        # Deepest first, so a per-host directory is empty once its window subdirectories are removed
+        for directory in sorted(directories, key=lambda directory: os.path.abspath(directory).count(os.sep), reverse=True):
+            while os.path.abspath(directory) != os.path.abspath(self.dest_path):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
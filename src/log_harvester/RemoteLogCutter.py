@@ -1,15 +1,118 @@
+from Compression import READ_ERRORS, compression_of, is_log_file_name, open_decompressed
+from DownloadCache import CachedRemoteFile, DownloadCache
 from LogCutter import LogCutter
+from LogFilter import LogFilter
+from RunStats import RunStats
+from Scheduler import schedule_files
+from TimestampParser import posix_to_wall
+import fnmatch
+import io
 import paramiko
+import socket
 import stat
 import logging # debug level is set in main.py
-import os
-import subprocess
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
+
+# Size of a single SFTP read request (paramiko's maximum)
+SFTP_REQUEST_SIZE = 32768
+# Bytes requested at once while streaming a window, it bounds the memory used for pipelined reads
+SFTP_RANGE_BATCH_SIZE = 8 * 1024 * 1024
+# First batch of SFTPStreamReader. Batches double up to SFTP_RANGE_BATCH_SIZE, so a stream stopped early doesn't waste a whole batch
+SFTP_STREAM_FIRST_BATCH_SIZE = 1024 * 1024
+# First delay before retrying a failed transfer, doubled after every attempt
+RETRY_BACKOFF_SECONDS = 1.0
+# Errors of the SSH connection or of a channel. Other errors (e.g. a missing file) are not retried.
+RETRYABLE_ERRORS = (paramiko.SSHException, EOFError, ConnectionError, socket.timeout)
+# READDIR requests sent ahead while listing a remote directory
+LISTDIR_READ_AHEADS = 50
+# The timezone of a remote server is unknown, so its file mtimes are trusted only with this margin
+REMOTE_MTIME_SLACK_SECONDS = 26 * 3600
+
+
+class SFTPStreamReader(io.RawIOBase):
+    """Sequential reader of a byte range of a remote file.
+
+    It keeps up to max_batch_size bytes of pipelined SFTP requests in flight and hands out
+    the data as it arrives, so streaming consumers (decompressors, line readers) don't wait for a round trip per read.
+    Consumers may stop reading early (e.g. after the cut window), so batches start small and grow.
+    """
+
+    def __init__(self, remote_file, start_offset: int, end_offset: int, stats: RunStats | None = None,
+                 max_batch_size: int = SFTP_RANGE_BATCH_SIZE):
+        self.remote_file = remote_file
+        self.offset = start_offset
+        self.end_offset = end_offset
+        self.stats = stats
+        self._max_batch_size = max_batch_size
+        self._batch_size = min(SFTP_STREAM_FIRST_BATCH_SIZE, max_batch_size)
+        self._chunks = iter(())
+        self._leftover = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._leftover:
+            chunk = next(self._chunks, None)
+            if chunk is not None:
+                self._leftover = memoryview(chunk)
+                continue
+            if self.offset >= self.end_offset:
+                return 0
+            batch_end = min(self.offset + self._batch_size, self.end_offset)
+            self._batch_size = min(self._batch_size * 2, self._max_batch_size)
+            self._chunks = self.remote_file.readv([(chunk_offset, min(SFTP_REQUEST_SIZE, batch_end - chunk_offset))
+                                                   for chunk_offset in range(self.offset, batch_end, SFTP_REQUEST_SIZE)])
+            if self.stats is not None:
+                self.stats.add(bytes_transferred=batch_end - self.offset)
+            self.offset = batch_end
+        size = min(len(buffer), len(self._leftover))
+        buffer[:size] = self._leftover[:size]
+        self._leftover = self._leftover[size:]
+        return size
 
 class RemoteLogCutter():
-    """A LogCutter subclass that fetches logs from a remote server via SSH before cutting them."""
+    """Cuts the logs of a remote host over one SSH connection, with up to max_workers SFTP channels at once.
+
+    By default the window is found on the server with random-access SFTP reads (see LogCutter.locate_windows)
+    and only its bytes are downloaded. Without server_side_cut, and for compressed rotations, a file is streamed
+    from its beginning and cut while it arrives (see `cut_streaming`). Nothing is downloaded to a temporary file.
+    """
 
-    def __init__(self, from_date: str, to_date: str, dest_path: str, hostname: str, username: str, password: str, port:int=22):
+    def __init__(self, from_date: str, to_date: str, dest_path: str, hostname: str, username: str, password: str, port:int=22, server_side_cut: bool=True,
+                 max_workers: int=4, retries: int=3, transfer_slots: threading.Semaphore | None=None, stats: RunStats | None=None,
+                 output_compression: str | None=None, log_filter: LogFilter | None=None, download_cache: DownloadCache | None=None,
+                 recursive: bool=False, include_globs: list[str] | None=None, exclude_globs: list[str] | None=None,
+                 windows: list | None=None, window_padding: float=0.0, time_slack: float=0.0,
+                 buffer_size: int | None=None, undecodable: str="replace", deadline: float | None=None):
+        """
+        Args:
+            server_side_cut (bool): Find the window in the remote file with random-access SFTP reads and
+                download only the window. If False, files are streamed from their beginning and cut while
+                they are downloaded (see `cut_streaming`); it's what compressed rotations always use.
+            max_workers (int): Number of files transferred at once. All of them share one SSH connection,
+                each worker uses its own SFTP channel. The rest of the files wait in the queue.
+            retries (int): How many times a transfer is retried (with exponential backoff) after a connection or channel failure.
+            transfer_slots (threading.Semaphore): Optional semaphore shared with other hosts to cap the total number of transfers.
+            stats (RunStats): Collects counters, phase timings and per-file progress, can be shared with other hosts.
+            output_compression (str): "gzip" or "zstd" to write the cut logs compressed, None for plain text.
+            log_filter (LogFilter): Write only the entries of the window that match it.
+            download_cache (DownloadCache): Persistent cache of downloaded bytes, only the bytes missing in it are transferred.
+                It can be shared with other hosts.
+            recursive (bool): Take log files from the subdirectories of the requested directories too.
+            include_globs (list[str]): Glob patterns of the files taken from directories, e.g. ["*.log", "nginx/access.log*"].
+                By default files named like logs and their rotations are taken.
+            exclude_globs (list[str]): Glob patterns of the files and subdirectories left out.
+            windows (list), window_padding (float): Several windows to cut at once instead of from_date/to_date (see LogCutter).
+            time_slack (float): Seconds log lines can be out of order (see LogCutter).
+            buffer_size (int): Largest buffer of file data of a transfer: the pipelined SFTP reads in flight are capped at it too.
+            undecodable (str): What timestamp probes do with lines that aren't valid UTF-8 (see LogCutter).
+            deadline (float): time.time() after which the files that haven't started are left out (see LogCutter).
+        """
         self.hostname = hostname
         self.username = username
         self.password = password
@@ -17,138 +120,518 @@ class RemoteLogCutter():
         self.from_date = from_date
         self.to_date = to_date
         self.dest_path = dest_path
+        self.server_side_cut = server_side_cut
+        self.max_workers = max(1, max_workers)
+        self.retries = max(0, retries)
+        self.transfer_slots = transfer_slots
+        self.stats = stats if stats is not None else RunStats()
+        self.output_compression = output_compression
+        self.log_filter = log_filter
+        self.download_cache = download_cache
+        self.recursive = recursive
+        self.include_globs = include_globs or []
+        self.exclude_globs = exclude_globs or []
+        self.windows = windows
+        self.window_padding = window_padding
+        self.time_slack = time_slack
+        self.buffer_size = buffer_size
+        self.undecodable = undecodable
+        self.deadline = deadline
+        # Bytes of pipelined SFTP reads in flight per transfer, they are buffered until they're written
+        self.batch_size = SFTP_RANGE_BATCH_SIZE if buffer_size is None else max(min(SFTP_RANGE_BATCH_SIZE, buffer_size), SFTP_REQUEST_SIZE)
+
+        self.logger = logging.getLogger("RemoteLogCutter")
+        self._connection_lock = threading.Lock()
+        # Incremented on every reconnect, so SFTP channels of the previous connection are reopened
+        self._connection_generation = 0
+        self._thread_local = threading.local()
+        self._sftp_clients = []
+        self.ssh_client = None
+        self.connect()
+
+    def connect(self) -> None:
+        """Open the single authenticated SSH connection to the host, shared by all transfers."""
         ssh_client = paramiko.SSHClient()
         ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh_client.connect(hostname=hostname, username=username, password=password, port=port)
+        ssh_client.connect(hostname=self.hostname, username=self.username, password=self.password, port=self.port)
+        ssh_client.get_transport().set_keepalive(30)
         self.ssh_client = ssh_client
-        self.tmp_dir = "./tmp"
+        self._connection_generation += 1
 
-        self.logger = logging.getLogger("RemoteLogCutter")
-        self.trans = paramiko.Transport((hostname, port), default_window_size=2147483647)
+    def _reconnect_if_needed(self, generation: int) -> None:
+        """Reconnect if the connection of the given generation is dead and no other worker reconnected already."""
+        with self._connection_lock:
+            transport = self.ssh_client.get_transport()
+            if generation == self._connection_generation and (transport is None or not transport.is_active()):
+                self.logger.warning(f"SSH connection to {self.hostname} is lost, reconnecting.")
+                self.ssh_client.close()
+                self.connect()
+
+    def get_sftp_client(self) -> paramiko.SFTPClient:
+        """Return the SFTP channel of the current thread, opening it on the shared connection if needed."""
+        sftp_client = getattr(self._thread_local, "sftp_client", None)
+        if sftp_client is None or self._thread_local.generation != self._connection_generation:
+            with self._connection_lock:
+                generation = self._connection_generation
+                sftp_client = self.ssh_client.open_sftp()
+                self._sftp_clients.append(sftp_client)
+            self._thread_local.sftp_client = sftp_client
+            self._thread_local.generation = generation
+        return sftp_client
+
+    def _drop_sftp_client(self) -> None:
+        """Close the SFTP channel of the current thread after a failure, the next call opens a new one."""
+        sftp_client = getattr(self._thread_local, "sftp_client", None)
+        self._thread_local.sftp_client = None
+        if sftp_client is not None:
+            try:
+                sftp_client.close()
+            except Exception:
+                pass
 
-    def get_log_list(self, requested_log_file_paths: list[str]):
+    def close_sftp_clients(self) -> None:
+        """Close the SFTP channels opened by the workers."""
+        with self._connection_lock:
+            for sftp_client in self._sftp_clients:
+                try:
+                    sftp_client.close()
+                except Exception:
+                    pass
+            self._sftp_clients = []
+        self._thread_local = threading.local()
+
+    def close(self) -> None:
+        """Close all SFTP channels and the SSH connection."""
+        self.close_sftp_clients()
+        if self.ssh_client is not None:
+            self.ssh_client.close()
+
+    def _with_retries(self, cut_function, log_cutter: LogCutter, log_file: str):
+        """Run cut_function(log_cutter, log_file) as the current file of the thread, with retries (see `retry`).
+
+        Returns:
+            The result of cut_function, or None if it failed.
         """
-        Fetch list of log files from the remote server via SFTP.
+        with self.stats.track_file(log_file, host=self.hostname):
+            return self.retry(cut_function, log_file, log_cutter, log_file)
+
+    def retry(self, function, log_file: str, *args):
+        """Run function(*args), a step of cutting log_file, retrying with exponential backoff on connection/channel failures.
+
+        A transfer slot (see transfer_slots) is held during every attempt.
+
+        Returns:
+            The result of function, or None if it failed (the outcome of the current file is set to "failed").
+        """
+        for attempt in range(self.retries + 1):
+            generation = self._connection_generation
+            try:
+                with self.transfer_slots or nullcontext():
+                    return function(*args)
+            except RETRYABLE_ERRORS as e:
+                self._drop_sftp_client()
+                if attempt == self.retries:
+                    self.logger.error(f"Giving up on remote log file {log_file} after {attempt + 1} attempts: {e}")
+                    self.stats.file_outcome("failed")
+                    return None
+                delay = RETRY_BACKOFF_SECONDS * 2 ** attempt
+                self.logger.warning(f"Transfer of {log_file} failed ({e!r}), retrying in {delay:.0f}s.")
+                time.sleep(delay)
+                # A cancelled job closes its connection, it's not reopened
+                self.stats.check_cancelled()
+                self._reconnect_if_needed(generation)
+            except READ_ERRORS as e:
+                self.logger.error(f"Error cutting remote log file {log_file}: {e}")
+                self.stats.file_outcome("failed")
+                return None
+
+    def get_log_list(self, requested_log_file_paths: list[str], log_cutter: LogCutter | None = None) -> list[tuple[str, paramiko.SFTPAttributes]]:
+        """List the remote log files of the requested paths, without transferring any of their bytes.
+
+        Every directory is listed once with pipelined READDIR requests (listdir_iter), which return the names together
+        with their attributes, so the listing costs a few round trips per directory instead of one per file.
+        Subdirectories are listed too if recursive is set. Files of a directory are taken if their name
+        looks like a log (or matches one of include_globs) and they don't match exclude_globs;
+        the globs are matched against the name and the path relative to the requested directory.
+        Paths of files are always taken.
+
         Args:
             requested_log_file_paths (list[str]): List of log file paths or directories on the remote server.
+            log_cutter (LogCutter): Cutter with the requested window. If given, files last modified before
+                the window are left out. They are only counted as skipped, so thousands of old rotations don't flood the progress table.
+
         Returns:
-            list[str]: List of log file paths to download.
+            list[tuple[str, paramiko.SFTPAttributes]]: Path and attributes of every log file to cut.
         """
-
         if type(requested_log_file_paths) is not list:
             self.logger.error(f"{requested_log_file_paths} (requested_log_file_paths) must be a list of strings.")
             raise TypeError("requested_log_file_paths must be a list of strings.")
-        sftp_client = self.ssh_client.open_sftp()
-
-        is_dir_to_fetch = False
+        sftp_client = self.get_sftp_client()
         files_to_fetch = []
-
-        if not os.path.isdir(self.tmp_dir):
-            os.makedirs(self.tmp_dir)
-
-        # Remove "/" at the end of the path provided by user
-        if requested_log_file_paths[-1] == "/":
-            requested_log_file_paths = requested_log_file_paths[:-1]
-            is_dir_to_fetch = True
-
-        # Get list of files to fetch
-        for log_file_path in requested_log_file_paths:
-            # Check if user chooses directory with files to cut
+        for requested_path in requested_log_file_paths:
+            # A trailing "/" means a directory
+            log_file_path = requested_path.rstrip("/") or "/"
             try:
                 file_attr = sftp_client.stat(log_file_path)
             except FileNotFoundError as e:
                 self.logger.error(f"Error stating file {log_file_path}: {e}")
                 continue
-            if is_dir_to_fetch or stat.S_ISDIR(file_attr.st_mode):
-                for log_file in sftp_client.listdir(log_file_path):
-                    # We take only .log files when directory is chosen
-                    if log_file.endswith(".log"):
-                        full_path = f"{log_file_path}/{log_file}"
-                        # We take only files
-                        if not stat.S_ISDIR(sftp_client.stat(full_path).st_mode):
-                            files_to_fetch.append(full_path)
-                            sftp_client.get(remotepath=full_path, localpath=f"{self.tmp_dir}/{log_file}", max_concurrent_prefetch_requests=64)
-            # If user chooses a file to cut
+            if stat.S_ISDIR(file_attr.st_mode):
+                files_to_fetch.extend(self._list_log_dir(sftp_client, log_file_path))
             else:
-                files_to_fetch.append(log_file_path)
-        return files_to_fetch
+                files_to_fetch.append((log_file_path, file_attr))
+        if log_cutter is None:
+            return files_to_fetch
+        recent_files = [(log_file, file_attr) for log_file, file_attr in files_to_fetch
+                        if not log_cutter.is_modified_before_window(file_attr.st_mtime, slack=REMOTE_MTIME_SLACK_SECONDS)]
+        skipped = len(files_to_fetch) - len(recent_files)
+        if skipped:
+            self.logger.info(f"{skipped} remote log files on {self.hostname} were last modified before the date range. Skipping them.")
+            self.stats.add(files_found=skipped, files_skipped=skipped)
+        return recent_files
+
+    def _list_log_dir(self, sftp_client: paramiko.SFTPClient, root: str) -> list[tuple[str, paramiko.SFTPAttributes]]:
+        """List the log files of a remote directory, and of its subdirectories if recursive is set."""
+        log_files = []
+        directories = [(root, "")]
+        while directories:
+            directory, relative_dir = directories.pop()
+            try:
+                # Pipelined READDIR requests: a directory of thousands of files takes a few round trips, not one per batch
+                entries = list(sftp_client.listdir_iter(directory, read_aheads=LISTDIR_READ_AHEADS))
+            except IOError as e:
+                self.logger.error(f"Error listing remote directory {directory}: {e}")
+                continue
+            for entry in sorted(entries, key=lambda entry: entry.filename):
+                full_path = f"{directory.rstrip('/')}/{entry.filename}"
+                relative_path = f"{relative_dir}{entry.filename}"
+                if self._matches_globs(entry.filename, relative_path, self.exclude_globs):
+                    continue
+                file_attr = entry
+                if stat.S_ISLNK(entry.st_mode):
+                    # listdir_attr doesn't follow links, only they cost an extra round trip
+                    try:
+                        file_attr = sftp_client.stat(full_path)
+                    except IOError:
+                        continue
+                if stat.S_ISDIR(file_attr.st_mode):
+                    if self.recursive and not stat.S_ISLNK(entry.st_mode):
+                        directories.append((full_path, f"{relative_path}/"))
+                elif stat.S_ISREG(file_attr.st_mode):
+                    if self.include_globs:
+                        wanted = self._matches_globs(entry.filename, relative_path, self.include_globs)
+                    else:
+                        # Only logs and their rotations (app.log.1, app.log.2.gz, ...) are taken from directories
+                        wanted = is_log_file_name(entry.filename)
+                    if wanted:
+                        log_files.append((full_path, file_attr))
+        return log_files
+
+    @staticmethod
+    def _matches_globs(name: str, relative_path: str, globs: list[str]) -> bool:
+        return any(fnmatch.fnmatchcase(name, glob) or fnmatch.fnmatchcase(relative_path, glob) for glob in globs)
+
+    def cut_logs(self, requested_log_file_paths: list[str]) -> list[str | None]:
+        """Fetch log files from remote server and cut them based on date range.
 
-    def copy_log_files(self, file_path: str):
-        """ Download log file from the remote server via rsync.
+        Files are processed by at most max_workers workers over the single SSH connection, the rest wait in the queue.
         Args:
-            file_paths (list[str]): List of log file paths on the remote server.
+            requested_log_file_paths (list[str]): List of log file paths or directories on the remote server.
         Returns:
-            bool: True if rsync succeeded, False otherwise.
+            list[str | None]: Path of the cut log for every fetched file (None if nothing was written).
         """
-        cmd = [
-        "sshpass", "-p", self.password,
-        "rsync", "-az",
-        "-e", "ssh -o StrictHostKeyChecking=no"
-        ]
-        # Add remote file paths
-        cmd.append(f"{self.username}@{self.hostname}:{file_path}")
-
-        # Destination directory (local)
-        cmd.append(self.tmp_dir)
-        try:
-            result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            self.logger.debug(f"rsync succeeded: {result.stdout}")
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"rsync failed (rc={e.returncode}): {e.stderr}")
-            return False
-        except FileNotFoundError as e:
-            self.logger.error(f"rsync/sshpass not found: {e}")
-            return False
-        except Exception as e:
-            self.logger.error(f"Unexpected error running rsync: {e}")
-            return False
-        return True
+        log_cutter = self.make_log_cutter()
+        # The whole file set is decided before any transfer starts
+        files_to_fetch = [scheduled_file["path"] for scheduled_file in self.queue_log_files(requested_log_file_paths, log_cutter)]
+
+        cut_function = self._cut_on_server if self.server_side_cut else self.cut_streaming
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"sftp-{self.hostname}") as executor:
+            results = list(executor.map(lambda log_file: self._with_retries(cut_function, log_cutter, log_file), files_to_fetch))
+
+        self.clean_up()
+        return results
+
+    def queue_log_files(self, requested_log_file_paths: list[str], log_cutter: LogCutter) -> list[dict]:
+        """List the remote log files of the requested paths (see get_log_list), schedule them and queue them in the stats.
+
+        The listing gives the size and the mtime of every file, so scheduling costs no extra round trip. The windows
+        of a remote file are not known before it's located, so its expected work is its size (see schedule_files).
+
+        Returns:
+            list[dict]: The scheduled files, in the order to cut them.
+        """
+        with self.stats.phase("discovery"):
+            listed_files = self.get_log_list(requested_log_file_paths, log_cutter)
+        files = [{"path": log_file, "size": file_attr.st_size, "mtime": posix_to_wall(file_attr.st_mtime),
+                  "compressed": compression_of(log_file) is not None, "window_bytes": None} for log_file, file_attr in listed_files]
+        scheduled_files = schedule_files(files, log_cutter.windows, relevance_first=log_cutter.deadline is not None)
+        self.logger.info(f"{len(scheduled_files)} files to fetch from {self.hostname}")
+        self.logger.debug(f"Files to fetch: {[scheduled_file['path'] for scheduled_file in scheduled_files]}")
+        for scheduled_file in scheduled_files:
+            self.stats.queue_file(scheduled_file["path"], scheduled_file["size"], host=self.hostname)
+        return scheduled_files
+
+    def clean_up(self) -> None:
+        """Close the SFTP channels of the workers and trim the download cache after the files of a job."""
+        self.close_sftp_clients()
+        if self.download_cache is not None:
+            self.download_cache.evict()
+
+    def make_log_cutter(self) -> LogCutter:
+        """LogCutter with the window and the output options of this host, it cuts the downloaded data into dest_path."""
+        return LogCutter(from_date=self.from_date, to_date=self.to_date, dest_path=self.dest_path, stats=self.stats,
+                         output_compression=self.output_compression, log_filter=self.log_filter,
+                         windows=self.windows, window_padding=self.window_padding, time_slack=self.time_slack,
+                         buffer_size=self.buffer_size, undecodable=self.undecodable, deadline=self.deadline)
+
+    def preview_logs(self, requested_log_file_paths: list[str], edges: list[float]) -> list[dict | None]:
+        """Estimate the lines and bytes of every time bucket of the remote log files (see LogCutter.preview_histogram).
+
+        The probes run on the SFTP file handles like the search of a server-side cut, so only a few small
+        reads per bucket are transferred. Compressed rotations are not previewed.
 
-    def cut_logs(self, requested_log_file_paths: list[str]):
-        """Fetch log files from remote server and cut them based on date range.
         Args:
             requested_log_file_paths (list[str]): List of log file paths or directories on the remote server.
+            edges (list[float]): Edges of the buckets (see LogCutter.preview_bucket_edges).
+
+        Returns:
+            list[dict | None]: Preview of every remote log file, None for compressed or failed ones.
         """
-        # Get list of log files to fetch
-        files_to_fetch = self.get_log_list(requested_log_file_paths)
-        self.logger.error(f"Files to fetch: {files_to_fetch}")
+        log_cutter = LogCutter(from_date=self.from_date, to_date=self.to_date, dest_path=self.dest_path, stats=self.stats,
+                               windows=self.windows, window_padding=self.window_padding, time_slack=self.time_slack,
+                               buffer_size=self.buffer_size, undecodable=self.undecodable)
+        with self.stats.phase("discovery"):
+            listed_files = self.get_log_list(requested_log_file_paths, log_cutter)
+        preview_function = partial(self._preview_on_server, edges=edges)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"sftp-{self.hostname}") as executor:
+            results = list(executor.map(lambda log_file: self._with_retries(preview_function, log_cutter, log_file),
+                                        [log_file for log_file, _ in listed_files]))
+        self.close_sftp_clients()
+        return results
 
-        # Use LogCutter to cut the fetched log files
-        log_cutter = LogCutter(from_date=self.from_date, to_date=self.to_date, dest_path=self.dest_path)
+    def _preview_on_server(self, log_cutter: LogCutter, log_file: str, edges: list[float]) -> dict | None:
+        """Probe an open remote log for its histogram (see preview_logs)."""
+        if compression_of(log_file) is not None:
+            self.logger.info(f"Compressed remote log file {log_file} can't be previewed. Skipping it.")
+            return None
+        # Not through the download cache: it would fetch a whole read buffer for every probe
+        with self.get_sftp_client().open(log_file, "rb") as remote_file:
+            file_attr = remote_file.stat()
+            preview = {"host": self.hostname, "path": log_file, "size": file_attr.st_size}
+            if log_cutter.is_modified_before_window(file_attr.st_mtime, slack=REMOTE_MTIME_SLACK_SECONDS):
+                return {**preview, **log_cutter.empty_histogram(edges)}
+            with self.stats.phase("locate"):
+                parser = log_cutter.detect_timestamp_parser(remote_file, reference_time=file_attr.st_mtime)
+                return {**preview, **log_cutter.preview_histogram(remote_file, file_attr.st_size, parser, edges)}
 
-        treads = []
+    def streams(self, log_file: str) -> bool:
+        """Whether a remote log is cut while it's streamed (see `cut_streaming`) rather than located on the server first."""
+        return not self.server_side_cut or compression_of(log_file) is not None
 
-        for log_file in files_to_fetch:
-            thread = threading.Thread(target=self._cut_async, args=(log_cutter, log_file))
-            treads.append(thread)
-            thread.start()
+    def cut_streaming(self, log_cutter: LogCutter, log_file: str) -> str | None:
+        """Stream the log file from its beginning and cut it while it's downloaded, without a temporary file.
 
-        for thread in treads:
-            thread.join()
+        Pipelined SFTP reads feed the chunk-based LogCutter.cut_stream, so cutting overlaps the transfer,
+        the window is written as soon as it arrives and the transfer stops after the end of the window.
+        """
+        if log_cutter.is_past_deadline(log_file):
+            return None
+        with self._open_remote_file(log_file) as (remote_file, file_attr):
+            outside_window, _ = self._check_window(log_cutter, remote_file, log_file, file_attr)
+            if outside_window:
+                return None
+            return self._cut_remote_stream(log_cutter, remote_file, log_file, file_attr)
 
-        self.remove_temp_files()
+    @contextmanager
+    def _open_remote_file(self, log_file: str):
+        """Open a remote file for reading, through the download cache if there is one.
 
-    def _cut_async(self, log_cutter, log_file) -> None:
-            # Download log file via rsync
-            self.copy_log_files(log_file)
-            local_log_path = os.path.join("./tmp", os.path.basename(log_file))
-            try:
-                with open(local_log_path, "r") as log_file_handle:
-                    log_lines = log_file_handle.readlines()
-                    log_cutter.cut_log(local_log_path, log_lines)
-            except OSError as e:
-                self.logger.error(f"Error opening local log file {local_log_path}: {e}")
-
-    def remove_temp_files(self):
-        """Remove temporary files and directory used for storing fetched logs."""
-        if os.path.exists(self.tmp_dir):
-            for temp_file in os.listdir(self.tmp_dir):
-                temp_file_path = os.path.join(self.tmp_dir, temp_file)
-                try:
-                    os.remove(temp_file_path)
-                except OSError as e:
-                    self.logger.error(f"Error removing temporary file {temp_file_path}: {e}")
-            try:
-                os.rmdir(self.tmp_dir)
-            except OSError as e:
-                self.logger.error(f"Error removing temporary directory {self.tmp_dir}: {e}")
+        Yields:
+            tuple: (file, file_attr) - the paramiko.SFTPFile or its CachedRemoteFile, and its stat.
+        """
+        with self.get_sftp_client().open(log_file, "rb") as remote_file:
+            file_attr = remote_file.stat()
+            if self.download_cache is None:
+                yield remote_file, file_attr
+                return
+            with self.download_cache.open(remote_file, file_attr, self.hostname, self.port, log_file, self.stats,
+                                          batch_size=self.batch_size) as cached_file:
+                yield cached_file, file_attr
+
+    def _cut_remote_stream(self, log_cutter: LogCutter, remote_file, log_file: str, file_attr) -> str | None:
+        """Cut an open remote file with LogCutter.cut_stream, decompressing it on the fly if it's a compressed rotation."""
+        # The cache counts the bytes it transfers itself
+        stats = None if isinstance(remote_file, CachedRemoteFile) else self.stats
+        stream = io.BufferedReader(SFTPStreamReader(remote_file, 0, file_attr.st_size, stats, self.batch_size))
+        compression = compression_of(log_file)
+        if compression is not None:
+            stream = open_decompressed(stream, compression)
+        return log_cutter.cut_stream(stream, log_file, reference_time=file_attr.st_mtime)
+
+    def _cut_on_server(self, log_cutter: LogCutter, log_file: str) -> str | None:
+        """Find the window in the remote file and download only that byte range.
+
+        The binary search of LogCutter runs directly on the SFTP file handle, so locating the window
+        costs a few small random-access reads, and the transfer size depends on the window, not the file.
+
+        Args:
+            log_cutter (LogCutter): Cutter with the requested date range.
+            log_file (str): Path of the log file on the remote server.
+
+        Returns:
+            str: Path of the written cut log, or None if nothing was written.
+        """
+        if log_cutter.is_past_deadline(log_file):
+            return None
+        with self._open_remote_file(log_file) as (remote_file, file_attr):
+            outside_window, parser = self._check_window(log_cutter, remote_file, log_file, file_attr)
+            if outside_window:
+                return None
+            if compression_of(log_file) is not None:
+                # Compressed rotations can't be searched: decompress while streaming and stop after the window
+                return self._cut_remote_stream(log_cutter, remote_file, log_file, file_attr)
+            located = self._locate_open_file(log_cutter, remote_file, log_file, file_attr, parser)
+            if located is None:
+                return None
+            if isinstance(remote_file, CachedRemoteFile):
+                # Fetch what's missing in the cache, then copy the windows from the cached data on the local disk
+                self._fetch_located(remote_file, located)
+                return self._copy_cached(log_cutter, remote_file, located)
+            return self._download_located(log_cutter, remote_file, located)
+
+    def locate_on_server(self, log_cutter: LogCutter, log_file: str) -> dict | None:
+        """First step of a server-side cut run step by step (see JobEngine): find the byte ranges of the windows in the remote file.
+
+        The next step is `download_located`, or `fetch_located` and then `copy_cached` with the download cache.
+        Compressed rotations are cut with `cut_streaming` instead.
+
+        Returns:
+            dict | None: {"path", "parser", "ranges", "window_bytes", "size"}, or None if there is nothing to transfer
+                (the outcome of the file is set).
+        """
+        if log_cutter.is_past_deadline(log_file):
+            return None
+        with self._open_remote_file(log_file) as (remote_file, file_attr):
+            outside_window, parser = self._check_window(log_cutter, remote_file, log_file, file_attr)
+            if outside_window:
+                return None
+            return self._locate_open_file(log_cutter, remote_file, log_file, file_attr, parser)
+
+    def download_located(self, log_cutter: LogCutter, located: dict) -> str | None:
+        """Download the ranges found by `locate_on_server` into the cut logs."""
+        with self._open_remote_file(located["path"]) as (remote_file, _):
+            return self._download_located(log_cutter, remote_file, located)
+
+    def fetch_located(self, located: dict) -> dict:
+        """Download the bytes of the ranges found by `locate_on_server` that are missing in the download cache.
+
+        Returns:
+            dict: located, for `copy_cached`.
+        """
+        with self._open_remote_file(located["path"]) as (remote_file, _):
+            self._fetch_located(remote_file, located)
+        return located
+
+    def copy_cached(self, log_cutter: LogCutter, located: dict) -> str | None:
+        """Copy the ranges fetched by `fetch_located` from the download cache into the cut logs."""
+        with self._open_remote_file(located["path"]) as (remote_file, _):
+            # The cache entry is dropped if the file was rotated since the fetch
+            if not all(remote_file.is_cached(start_offset, end_offset) for start_offset, end_offset in located["ranges"]):
+                self._fetch_located(remote_file, located)
+            return self._copy_cached(log_cutter, remote_file, located)
+
+    def _locate_open_file(self, log_cutter: LogCutter, remote_file, log_file: str, file_attr, parser=None) -> dict | None:
+        """Find the windows in an open remote file, with the parser detected by `_check_window` if it's given."""
+        with self.stats.phase("locate"):
+            if parser is None:
+                parser = log_cutter.detect_timestamp_parser(remote_file, reference_time=file_attr.st_mtime)
+            ranges = log_cutter.locate_windows(remote_file, file_attr.st_size, parser)
+        self.logger.debug(f"Window offsets {ranges} in remote file {log_file}")
+        window_bytes = sum(max(end_offset - start_offset, 0) for start_offset, end_offset in ranges)
+        if not window_bytes:
+            self.logger.warning(f"No logs found in the specified date range in remote file {log_file}. Skipping cut.")
+            self.stats.file_outcome("empty")
+            return None
+        return {"path": log_file, "parser": parser, "ranges": ranges, "window_bytes": window_bytes, "size": file_attr.st_size}
+
+    def _download_located(self, log_cutter: LogCutter, remote_file, located: dict) -> str | None:
+        self.stats.set_file_total(located["window_bytes"])
+        with self.stats.phase("transfer"):
+            dest_file_paths, transferred, written = log_cutter.write_windows(
+                located["path"], located["parser"], located["ranges"], partial(self.download_range, remote_file))
+        return self._finish_located(log_cutter, located, dest_file_paths, transferred, written)
+
+    def _fetch_located(self, remote_file: CachedRemoteFile, located: dict) -> None:
+        self.stats.set_file_total(located["window_bytes"])
+        with self.stats.phase("transfer"):
+            for start_offset, end_offset in located["ranges"]:
+                if start_offset < end_offset:
+                    remote_file.fetch(start_offset, end_offset)
+
+    def _copy_cached(self, log_cutter: LogCutter, remote_file: CachedRemoteFile, located: dict) -> str | None:
+        self.stats.set_file_total(located["window_bytes"])
+        with self.stats.phase("copy"):
+            dest_file_paths, transferred, written = log_cutter.write_windows(
+                located["path"], located["parser"], located["ranges"], partial(log_cutter.copy_byte_range, remote_file.data_file))
+        return self._finish_located(log_cutter, located, dest_file_paths, transferred, written)
+
+    def _finish_located(self, log_cutter: LogCutter, located: dict, dest_file_paths: list[str], transferred: int, written: int) -> str | None:
+        """Count the bytes of a server-side cut and set the outcome of the file."""
+        self.stats.add(bytes_read=transferred, bytes_written=written)
+        if not written:
+            self.logger.warning(f"No logs in the specified date range of remote file {located['path']} match the filter. Skipping cut.")
+            self.stats.file_outcome("empty")
+            return None
+        self.logger.info(f"Cut log saved to: {', '.join(dest_file_paths)} ({transferred} of {located['size']} bytes transferred)")
+        self.stats.file_outcome("cut", log_cutter.cut_result(dest_file_paths))
+        return log_cutter.cut_result(dest_file_paths)
+
+    def _check_window(self, log_cutter: LogCutter, remote_file, log_file: str, file_attr=None) -> tuple[bool, object]:
+        """Cheaply check if a remote log can be skipped: by its mtime, then (if not compressed) by its first and last timestamps.
+
+        Returns:
+            tuple[bool, object]: Whether the log is outside the window (its outcome is set then), and the timestamp parser
+                detected for the check, to locate the window with (see `_locate_open_file`). None if it wasn't detected.
+        """
+        if file_attr is None:
+            file_attr = remote_file.stat()
+        if log_cutter.is_modified_before_window(file_attr.st_mtime, slack=REMOTE_MTIME_SLACK_SECONDS):
+            self.logger.info(f"Remote log file {log_file} was last modified before the date range. Skipping it.")
+            self.stats.file_outcome("skipped")
+            return True, None
+        if compression_of(log_file) is not None:
+            return False, None
+        with self.stats.phase("locate"):
+            parser = log_cutter.detect_timestamp_parser(remote_file, reference_time=file_attr.st_mtime)
+            time_span = log_cutter.read_time_span(remote_file, file_attr.st_size, parser)
+        if log_cutter.is_span_outside_window(*time_span):
+            self.logger.info(f"All timestamps of remote log file {log_file} are outside the date range. Skipping it.")
+            self.stats.file_outcome("skipped")
+            return True, parser
+        return False, parser
+
+    def download_range(self, remote_file, dest_file, start_offset: int, end_offset: int) -> int:
+        """Download bytes [start_offset, end_offset) of an open SFTP file with pipelined reads, batch_size bytes in flight at most.
+
+        Args:
+            remote_file (paramiko.SFTPFile): Remote file opened for reading.
+            dest_file: Local binary file object to write to.
+            start_offset (int): First byte to download.
+            end_offset (int): Byte offset to stop at (exclusive).
+
+        Returns:
+            int: Number of bytes downloaded.
+        """
+        downloaded = 0
+        offset = start_offset
+        while offset < end_offset:
+            batch_end = min(offset + self.batch_size, end_offset)
+            chunks = [(chunk_offset, min(SFTP_REQUEST_SIZE, batch_end - chunk_offset))
+                      for chunk_offset in range(offset, batch_end, SFTP_REQUEST_SIZE)]
+            for data in remote_file.readv(chunks):
+                dest_file.write(data)
+                downloaded += len(data)
+                self.stats.advance(len(data))
+            self.stats.add(bytes_transferred=batch_end - offset)
+            offset = batch_end
+        return downloaded
@@ -0,0 +1,180 @@
+import posixpath
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from Compression import READ_ERRORS, compression_of
+from LogCutter import LogCutter
+from LogFollower import FOLLOW_POLL_SECONDS, LogFollower, _FollowedLog
+from RemoteLogCutter import LISTDIR_READ_AHEADS, RETRYABLE_ERRORS, SFTP_REQUEST_SIZE, RemoteLogCutter
+
+# A remote directory with this many followed logs is polled with one listing instead of a stat per log
+REMOTE_LISTDIR_MIN_FILES = 4
+
+
+class RemoteLogFollower(LogFollower):
+    """Follows the logs of a remote host over the SSH connection and SFTP channels of its RemoteLogCutter.
+
+    Every poll_seconds it stats the followed logs (one pipelined listing for directories with many of them)
+    and reads only the logs whose size or mtime changed, with pipelined reads of the new bytes.
+    SFTP has no inode numbers, so a rotation is detected by comparing the open log with the log at its path:
+    the path is stat-ed first, so the same log can't be larger there; if it's smaller, the saved head tells
+    a truncation from a new log. After a connection failure the logs are reopened over a new connection
+    on the next poll and read on from the same offsets.
+    """
+
+    copy_phase = "transfer"
+
+    def __init__(self, remote_log_cutter: RemoteLogCutter, on_data=None, stop_event: threading.Event | None = None,
+                 poll_seconds: float = FOLLOW_POLL_SECONDS):
+        """
+        Args:
+            remote_log_cutter (RemoteLogCutter): Connection, discovery options and output options of the host.
+        """
+        log_cutter = LogCutter(from_date=remote_log_cutter.from_date, to_date=remote_log_cutter.to_date,
+                               dest_path=remote_log_cutter.dest_path, stats=remote_log_cutter.stats,
+                               output_compression=remote_log_cutter.output_compression, log_filter=remote_log_cutter.log_filter,
+                               time_slack=remote_log_cutter.time_slack, buffer_size=remote_log_cutter.buffer_size,
+                               undecodable=remote_log_cutter.undecodable)
+        super().__init__(log_cutter, remote_log_cutter.hostname, on_data, stop_event)
+        self.remote_log_cutter = remote_log_cutter
+        self.poll_seconds = poll_seconds
+        # Set after a connection failure, the logs are reopened on the next poll
+        self._broken = False
+
+    def start(self, log_paths: list[str]) -> list[str | None]:
+        """Cut the open-ended window of all remote logs of the requested paths and start following them.
+
+        Logs are started by the workers of the RemoteLogCutter. Compressed rotations don't grow, they are only cut.
+
+        Returns:
+            list[str | None]: Path of the cut log for every fetched file (None if nothing was written).
+        """
+        remote_lc = self.remote_log_cutter
+        with self.stats.phase("discovery"):
+            listed_files = remote_lc.get_log_list(log_paths, self.log_cutter)
+        for log_file, file_attr in listed_files:
+            self.stats.queue_file(log_file, file_attr.st_size, host=self.host)
+        cut_compressed = remote_lc._cut_on_server if remote_lc.server_side_cut else remote_lc.cut_streaming
+
+        def start_log(log_file: str) -> str | None:
+            if compression_of(log_file) is not None:
+                return remote_lc._with_retries(cut_compressed, self.log_cutter, log_file)
+            result = remote_lc._with_retries(self._start_remote, self.log_cutter, log_file)
+            if result is not None:
+                self.stats.file_appended(log_file, 0, self.host)
+            return result
+
+        with ThreadPoolExecutor(max_workers=remote_lc.max_workers, thread_name_prefix=f"sftp-{self.host}") as executor:
+            return list(executor.map(start_log, [log_file for log_file, _ in listed_files]))
+
+    def _start_remote(self, log_cutter: LogCutter, log_file: str) -> str:
+        followed = _FollowedLog(log_file)
+        followed.source = self.remote_log_cutter.get_sftp_client().open(log_file, "rb")
+        try:
+            file_attr = followed.source.stat()
+            followed.path_attr = file_attr
+            return self._start_log(followed, file_attr.st_size, file_attr.st_mtime)
+        except BaseException:
+            followed.source.close()
+            raise
+
+    def _copy(self, source, dest_file, start_offset: int, end_offset: int) -> int:
+        return self.remote_log_cutter.download_range(source, dest_file, start_offset, end_offset)
+
+    def _read(self, source, offset: int, length: int) -> bytes:
+        chunks = [(chunk_offset, min(SFTP_REQUEST_SIZE, offset + length - chunk_offset))
+                  for chunk_offset in range(offset, offset + length, SFTP_REQUEST_SIZE)]
+        data = b"".join(source.readv(chunks)) if chunks else b""
+        self.stats.add(bytes_transferred=len(data))
+        return data
+
+    def follow(self) -> None:
+        """Poll the followed logs and append their new data until stop_event is set, then close them."""
+        try:
+            while self.followed and not self.stop_event.wait(self.poll_seconds):
+                try:
+                    if self._broken:
+                        self._reopen_all()
+                    self._poll()
+                except RETRYABLE_ERRORS as e:
+                    self.logger.warning(f"Following logs on {self.host} failed ({e!r}), reconnecting on the next poll.")
+                    self._broken = True
+        finally:
+            self.close()
+
+    def _poll(self) -> None:
+        sftp_client = self.remote_log_cutter.get_sftp_client()
+        path_attrs = self._stat_paths(sftp_client)
+        for followed in self.followed:
+            path_attr = path_attrs[followed.path]
+            if (path_attr is not None and followed.path_attr is not None
+                    and (path_attr.st_size, path_attr.st_mtime) == (followed.path_attr.st_size, followed.path_attr.st_mtime)):
+                continue
+            try:
+                self._check(followed, sftp_client, path_attr)
+            except RETRYABLE_ERRORS:
+                raise
+            except READ_ERRORS as e:
+                self.logger.error(f"Error following remote log file {followed.path}: {e}")
+            followed.path_attr = path_attr
+
+    def _stat_paths(self, sftp_client) -> dict:
+        """Current attributes of the followed paths, None for missing ones."""
+        by_directory = {}
+        for followed in self.followed:
+            by_directory.setdefault(posixpath.dirname(followed.path), []).append(followed.path)
+        path_attrs = {}
+        for directory, paths in by_directory.items():
+            listing = None
+            if len(paths) >= REMOTE_LISTDIR_MIN_FILES:
+                listing = {attr.filename: attr for attr in sftp_client.listdir_iter(directory or ".", read_aheads=LISTDIR_READ_AHEADS)}
+            for path in paths:
+                path_attr = listing.get(posixpath.basename(path)) if listing is not None else None
+                if listing is None or (path_attr is not None and stat.S_ISLNK(path_attr.st_mode)):
+                    try:
+                        path_attr = sftp_client.stat(path)
+                    except FileNotFoundError:
+                        path_attr = None
+                path_attrs[path] = path_attr
+        return path_attrs
+
+    def _check(self, followed: _FollowedLog, sftp_client, path_attr) -> None:
+        """Append the new data of a log, and switch to the new log at its path if it was rotated."""
+        source_attr = followed.source.stat()
+        if source_attr.st_size < followed.offset:
+            self._truncated(followed)
+        # A rotated log is read to its end first
+        self._append_new(followed, source_attr.st_size)
+        if path_attr is None or path_attr.st_size == source_attr.st_size:
+            return
+        if path_attr.st_size < source_attr.st_size:
+            # Truncated after the stat of the path, or replaced by a smaller log
+            with sftp_client.open(followed.path, "rb") as path_file:
+                if path_file.read(len(followed.head)) == followed.head:
+                    return
+        source = sftp_client.open(followed.path, "rb")
+        self._reopened(followed, source)
+        self._append_new(followed, source.stat().st_size)
+
+    def _reopen_all(self) -> None:
+        """Reopen the followed logs over a new connection after a failure."""
+        remote_lc = self.remote_log_cutter
+        generation = remote_lc._connection_generation
+        remote_lc._drop_sftp_client()
+        remote_lc._reconnect_if_needed(generation)
+        sftp_client = remote_lc.get_sftp_client()
+        for followed in self.followed:
+            # Anything may have happened meanwhile, the next poll checks every log
+            followed.path_attr = None
+            try:
+                source = sftp_client.open(followed.path, "rb")
+            except FileNotFoundError:
+                self.logger.warning(f"Remote log file {followed.path} is gone, waiting for it to be recreated")
+                continue
+            if source.read(len(followed.head)) != followed.head:
+                self._reopened(followed, source)
+            else:
+                self._close_source(followed)
+                followed.source = source
+        self._broken = False
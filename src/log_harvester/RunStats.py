@@ -0,0 +1,265 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Counters of a run. bytes_read are bytes of the source logs read for searching and copying,
+# bytes_transferred are bytes downloaded over SFTP, bytes_cached are remote bytes read from the download cache instead,
+# bytes_written are bytes of the cut logs.
+COUNTERS = ("files_found", "files_cut", "files_skipped", "files_empty", "files_failed", "files_expired",
+            "bytes_read", "bytes_transferred", "bytes_cached", "bytes_written", "lines_parsed", "probes")
+# Phases of cutting a file. Their times are summed over all workers.
+PHASES = ("discovery", "locate", "transfer", "scan", "copy", "merge")
+# File outcomes and the counters they increment
+# "expired" files were left out because the deadline of the job passed before they were started (see LogCutter.is_past_deadline)
+OUTCOME_COUNTERS = {"cut": "files_cut", "skipped": "files_skipped", "empty": "files_empty", "failed": "files_failed",
+                    "expired": "files_expired"}
+REPORT_FILE_NAME = "harvest_report.json"
+
+
+class JobCancelled(Exception):
+    """Raised in a worker of a cancelled run at its next progress report (see RunStats.cancel)."""
+
+
+class RunStats():
+    """Thread-safe counters, phase timings and per-file progress of a harvest run.
+
+    Cutters report into it while they work, the TUI polls `progress_rows` for its live table,
+    and `write_report` saves everything as a JSON report at the end of the run.
+    A worker thread works on one file at a time, so the file being cut is tracked per thread (see `track_file`).
+    A file cut in several steps, possibly on different threads, is tracked with `begin_file`, `resume_file` and `end_file` (see JobEngine).
+    Pickling (e.g. into a worker process) gives an empty RunStats, the worker's results are merged back with `merge`.
+    """
+
+    def __init__(self, on_file_cut=None):
+        """
+        Args:
+            on_file_cut: Called with the file entry when a file is cut, from the thread that cut it (see OutputBundle).
+        """
+        self.on_file_cut = on_file_cut
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.phase_seconds = dict.fromkeys(PHASES, 0.0)
+        self.files = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._current = threading.local()
+        self._cancelled = False
+
+    def __getstate__(self) -> dict:
+        return {}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__()
+
+    def add(self, **amounts: int) -> None:
+        """Add to counters, e.g. add(lines_parsed=10, bytes_read=1024)."""
+        with self._lock:
+            for counter, amount in amounts.items():
+                self.counters[counter] += amount
+
+    def queue_file(self, path: str, size: int | None = None, host: str = "localhost") -> None:
+        """Register a file that is going to be cut, so it's shown before a worker picks it up."""
+        with self._lock:
+            self.files[f"{host}:{path}"] = self.new_file_entry(path, size, host)
+            self.counters["files_found"] += 1
+
+    @staticmethod
+    def new_file_entry(path: str, size: int | None = None, host: str = "localhost") -> dict:
+        """Progress entry of a file, not registered in a RunStats (e.g. to collect the outcome of a step in a worker process)."""
+        return {"host": host, "path": path, "size": size, "status": "queued", "phase": None, "outcome": None,
+                "done_bytes": 0, "total_bytes": size, "started": None, "finished": None, "dest": None}
+
+    @contextmanager
+    def track_file(self, path: str, size: int | None = None, host: str = "localhost"):
+        """Make path the current file of this thread while the block runs.
+
+        Nested calls (e.g. a downloaded copy of a remote file cut locally) are counted as the outer file.
+        The outcome set with `file_outcome` is counted when the block exits: "failed" on an exception,
+        "empty" if no outcome was set.
+        """
+        if getattr(self._current, "entry", None) is not None:
+            yield self._current.entry
+            return
+        entry = self.begin_file(path, size, host)
+        try:
+            with self.resume_file(entry):
+                yield entry
+        finally:
+            self.end_file(entry)
+
+    def begin_file(self, path: str, size: int | None = None, host: str = "localhost") -> dict:
+        """Mark a file as running and return its entry, for the steps of the file (see `resume_file`) until `end_file`."""
+        key = f"{host}:{path}"
+        with self._lock:
+            entry = self.files.get(key)
+            if entry is None:
+                entry = self.files[key] = self.new_file_entry(path, size, host)
+                self.counters["files_found"] += 1
+            if size is not None:
+                entry["size"] = entry["total_bytes"] = size
+            entry.update(status="running", started=time.time())
+        return entry
+
+    @contextmanager
+    def resume_file(self, entry: dict):
+        """Make entry the current file of this thread while a step of it runs. An exception sets its outcome to "failed"."""
+        previous = getattr(self._current, "entry", None)
+        self._current.entry = entry
+        try:
+            yield entry
+        except BaseException:
+            entry["outcome"] = "failed"
+            raise
+        finally:
+            self._current.entry = previous
+
+    def end_file(self, entry: dict) -> None:
+        """Count the outcome of a file begun with `begin_file`, "empty" if no outcome was set."""
+        with self._lock:
+            outcome = entry["outcome"] or "empty"
+            entry.update(status=outcome, outcome=outcome, phase=None, finished=time.time())
+            self.counters[OUTCOME_COUNTERS[outcome]] += 1
+        if outcome == "cut" and self.on_file_cut is not None:
+            self.on_file_cut(dict(entry))
+
+    def cancel(self) -> None:
+        """Make the workers of the run stop: the next `advance` or `phase` of any of them raises JobCancelled.
+
+        Workers in other processes are not reached, their current file is finished.
+        """
+        self._cancelled = True
+
+    def check_cancelled(self) -> None:
+        """Raise JobCancelled if the run was cancelled."""
+        if self._cancelled:
+            raise JobCancelled("The run was cancelled")
+
+    def file_outcome(self, outcome: str, dest: str | list[str] | None = None) -> None:
+        """Set the outcome ("cut", "skipped", "empty", "failed" or "expired") of the current file.
+
+        dest is the path of its cut log, or the list of the cut logs of its windows with several windows.
+        """
+        entry = getattr(self._current, "entry", None)
+        if entry is not None:
+            entry["outcome"] = outcome
+            entry["dest"] = dest
+
+    def set_file_total(self, total_bytes: int | None) -> None:
+        """Set the number of bytes the current file is expected to copy or transfer (known after locating the window).
+
+        None means that it's unknown, e.g. for a file cut while it's decompressed.
+        """
+        entry = getattr(self._current, "entry", None)
+        if entry is not None:
+            entry["total_bytes"] = total_bytes
+            entry["done_bytes"] = 0
+
+    def advance(self, nbytes: int) -> None:
+        """Add copied or transferred bytes to the progress of the current file."""
+        self.check_cancelled()
+        entry = getattr(self._current, "entry", None)
+        if entry is not None:
+            entry["done_bytes"] += nbytes
+
+    def file_appended(self, path: str, nbytes: int, host: str = "localhost") -> None:
+        """Add bytes appended to the cut log of a followed file (see LogFollower), its status becomes "following"."""
+        with self._lock:
+            entry = self.files.get(f"{host}:{path}")
+            if entry is not None:
+                entry.update(status="following", total_bytes=None, finished=None)
+                entry["done_bytes"] += nbytes
+
+    def follow_stopped(self, path: str, host: str = "localhost") -> None:
+        """Show the outcome of a followed file again once it's not followed anymore."""
+        with self._lock:
+            entry = self.files.get(f"{host}:{path}")
+            if entry is not None and entry["status"] == "following":
+                entry.update(status=entry["outcome"], finished=time.time())
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a phase of the current file (or of the run, outside of a file)."""
+        self.check_cancelled()
+        entry = getattr(self._current, "entry", None)
+        previous = entry["phase"] if entry is not None else None
+        if entry is not None:
+            entry["phase"] = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.phase_seconds[name] += elapsed
+            if entry is not None:
+                entry["phase"] = previous
+
+    def snapshot(self) -> dict:
+        """Copy of the counters, phase timings and files, safe to serialize while the run goes on."""
+        with self._lock:
+            return {
+                "started": self.started,
+                "seconds": round(time.time() - self.started, 3),
+                "counters": dict(self.counters),
+                "phase_seconds": {name: round(seconds, 4) for name, seconds in self.phase_seconds.items()},
+                "files": [dict(entry) for entry in self.files.values()],
+            }
+
+    def merge(self, snapshot: dict) -> None:
+        """Add the snapshot of another RunStats, e.g. of a worker process, to this one.
+
+        Files already known here are updated, so "files_found" of the snapshot is not added twice for them.
+        """
+        with self._lock:
+            for entry in snapshot["files"]:
+                key = f"{entry['host']}:{entry['path']}"
+                if key in self.files:
+                    self.counters["files_found"] -= 1
+                    # The worker doesn't know the size queued here
+                    entry = {**entry, "size": self.files[key]["size"] if entry["size"] is None else entry["size"]}
+                self.files[key] = dict(entry)
+            for counter, amount in snapshot["counters"].items():
+                self.counters[counter] += amount
+            for name, seconds in snapshot["phase_seconds"].items():
+                self.phase_seconds[name] += seconds
+        if self.on_file_cut is not None:
+            for entry in snapshot["files"]:
+                if entry["outcome"] == "cut":
+                    self.on_file_cut(dict(entry))
+
+    def progress_rows(self) -> list[tuple[str, str, str, str, str, str]]:
+        """Rows of the live progress table: (host, file, status, progress, MB/s, ETA)."""
+        now = time.time()
+        rows = []
+        with self._lock:
+            entries = [dict(entry) for entry in self.files.values()]
+        for entry in entries:
+            status = entry["phase"] if entry["status"] == "running" and entry["phase"] else entry["status"]
+            done_mb = entry["done_bytes"] / (1024 * 1024)
+            progress = f"{done_mb:.1f}/{entry['total_bytes'] / (1024 * 1024):.1f} MB" if entry["total_bytes"] else f"{done_mb:.1f} MB"
+            speed = eta = ""
+            if entry["started"] is not None:
+                elapsed = (entry["finished"] or now) - entry["started"]
+                rate = entry["done_bytes"] / elapsed if elapsed > 0 else 0.0
+                speed = f"{rate / (1024 * 1024):.1f}"
+                if entry["status"] == "running" and rate > 0 and entry["total_bytes"]:
+                    eta = f"{max(entry['total_bytes'] - entry['done_bytes'], 0) / rate:.0f}s"
+            rows.append((entry["host"], os.path.basename(entry["path"]), status, progress, speed, eta))
+        return rows
+
+    def write_report(self, dest_path: str, extra: dict | None = None) -> str:
+        """Write the JSON report of the run into dest_path.
+
+        Args:
+            dest_path (str): Directory of the cut logs.
+            extra (dict): Additional top-level keys of the report (the job, its result).
+
+        Returns:
+            str: Path of the report.
+        """
+        os.makedirs(dest_path, exist_ok=True)
+        report_path = os.path.join(dest_path, REPORT_FILE_NAME)
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            json.dump({**(extra or {}), **self.snapshot()}, report_file, indent=4)
+        return report_path
@@ -0,0 +1,110 @@
+import math
+
+# Expected work of a compressed rotation per byte of its size, compared to a byte of the windows of a plain log:
+# it's decompressed (to several times its size) and every line up to the end of the windows is parsed
+COMPRESSED_WORK_FACTOR = 8
+
+
+def expected_work(size: int, compressed: bool = False, window_bytes: int | None = None) -> int:
+    """Expected work of cutting a file, in bytes of a plain copy.
+
+    Args:
+        size (int): Size of the file.
+        compressed (bool): The file is a compressed rotation, cut while it's decompressed.
+        window_bytes (int): Bytes of the windows in the file, estimated (see LogIndex.estimate_window_bytes)
+            or found by locating them. The whole file is assumed without it.
+    """
+    if compressed:
+        return size * COMPRESSED_WORK_FACTOR
+    return size if window_bytes is None else window_bytes
+
+
+def window_distance(mtime: float, windows: list[tuple[float, float]]) -> float:
+    """Seconds between the last write of a file and the nearest window, 0 if it was last written inside one.
+
+    A file last written right after a window ends with the lines of the window, one written long after it
+    (or before it) is unlikely to hold much of it.
+
+    Args:
+        mtime (float): Last write of the file in wall clock seconds, the scale of the windows (see posix_to_wall).
+        windows (list): Sorted (from_timestamp, to_timestamp) windows (see LogCutter.windows).
+    """
+    return min(max(from_timestamp - mtime, mtime - to_timestamp, 0.0) for from_timestamp, to_timestamp in windows)
+
+
+def file_priority(scheduled_file: dict, relevance_first: bool = False, backlog: float = 0.0) -> tuple:
+    """Sort key of a file scheduled by `schedule_files`, the lowest first.
+
+    Args:
+        scheduled_file (dict): The file, with its "work" and "distance".
+        relevance_first (bool): Order by relevance (under a deadline) instead of by work.
+        backlog (float): Expected work left on the host of the file (see JobSchedule). A host with more work left goes first,
+            so hosts sharing workers finish together.
+    """
+    if relevance_first:
+        return (scheduled_file["distance"], scheduled_file["work"])
+    return (-backlog, -scheduled_file["work"])
+
+
+def schedule_files(files: list[dict], windows: list[tuple[float, float]], relevance_first: bool = False) -> list[dict]:
+    """Order the files of a job.
+
+    By default the largest expected work goes first, so a huge file doesn't start (and finish) last while the other
+    workers are idle. Under a deadline, the most relevant files go first - the closest to the windows, then the smallest -
+    so what's cut in time is what matters most.
+
+    Args:
+        files (list[dict]): {"path", "size", "mtime" (wall clock seconds), "compressed", "window_bytes" (or None)} of every file.
+        windows (list): Sorted (from_timestamp, to_timestamp) windows of the job.
+        relevance_first (bool): Order by relevance, for a job with a deadline.
+
+    Returns:
+        list[dict]: The files with their "work" (see expected_work) and "distance" (see window_distance), in the order to cut them.
+    """
+    scheduled_files = []
+    for scheduled_file in files:
+        work = expected_work(scheduled_file["size"], scheduled_file["compressed"], scheduled_file["window_bytes"])
+        scheduled_files.append({**scheduled_file, "work": work, "distance": window_distance(scheduled_file["mtime"], windows)})
+    return sorted(scheduled_files, key=lambda scheduled_file: file_priority(scheduled_file, relevance_first))
+
+
+class JobSchedule():
+    """Priorities of the steps of a job's files while they wait for the workers shared with other jobs and hosts (see JobEngine).
+
+    Without a deadline, a free worker goes to the host with the most expected work left, and on that host to the file with
+    the most work. With a deadline, jobs are served by the earliest deadline first and their files by relevance (see schedule_files).
+    The work of a file is refined once its windows are located.
+    """
+
+    def __init__(self, deadline: float | None = None):
+        """
+        Args:
+            deadline (float): time.time() after which the job's files that haven't started are left out (see LogCutter).
+        """
+        self.deadline = deadline
+        self.relevance_first = deadline is not None
+        self.backlog = {}
+
+    def add(self, host: str, scheduled_files: list[dict]) -> None:
+        """Add the files of a host to its expected work left."""
+        self.backlog[host] = self.backlog.get(host, 0) + sum(scheduled_file["work"] for scheduled_file in scheduled_files)
+
+    def priority(self, host: str | None = None, scheduled_file: dict | None = None) -> tuple:
+        """Sort key of the next step of a file, comparable with the keys of other jobs.
+
+        Without a file, the key of a step of the job itself (discovery, postprocess): it goes before the files of the job.
+        """
+        deadline = math.inf if self.deadline is None else self.deadline
+        if scheduled_file is None:
+            return (deadline,)
+        return (deadline, *file_priority(scheduled_file, self.relevance_first, self.backlog.get(host, 0)))
+
+    def located(self, host: str, scheduled_file: dict, window_bytes: int) -> None:
+        """Replace the expected work of a file by the bytes of its windows, once they are located."""
+        self.backlog[host] += window_bytes - scheduled_file["work"]
+        scheduled_file["work"] = window_bytes
+
+    def finished(self, host: str, scheduled_file: dict) -> None:
+        """Remove the work of a file from the work left of its host."""
+        self.backlog[host] -= scheduled_file["work"]
+        scheduled_file["work"] = 0
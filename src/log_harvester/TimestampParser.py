@@ -0,0 +1,276 @@
+import codecs
+import re
+import time
+from datetime import date, datetime
+from functools import lru_cache
+
+
+# Number of lines from the beginning of a file used to detect its timestamp format
+DETECTION_SAMPLE_LINES = 64
+# Lines longer than this are truncated while sampling, so a file without newlines can't be read whole
+DETECTION_MAX_LINE_BYTES = 64 * 1024
+
+# What a timestamp probe does with a line that isn't valid UTF-8: decode it with U+FFFD for the undecodable bytes,
+# treat it as a line without a timestamp, or fail the file. The bytes of the logs are copied as they are in any case.
+UNDECODABLE_BYTES_POLICIES = ("replace", "skip", "fail")
+
+# Values of to_date that leave the window open at the end, e.g. for follow mode
+OPEN_DATES = ("", "now", "open")
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+MONTHS = {
+    b"Jan": 1, b"Feb": 2, b"Mar": 3, b"Apr": 4, b"May": 5, b"Jun": 6,
+    b"Jul": 7, b"Aug": 8, b"Sep": 9, b"Oct": 10, b"Nov": 11, b"Dec": 12,
+}
+
+
+@lru_cache(maxsize=4096)
+def _days_since_epoch(year: int, month: int, day: int) -> int:
+    return date(year, month, day).toordinal() - EPOCH_ORDINAL
+
+
+@lru_cache(maxsize=4096)
+def _utc_offset(hour: int) -> int:
+    return time.localtime(hour * 3600).tm_gmtoff
+
+
+def wall_seconds(dt: datetime) -> float:
+    """Convert a naive datetime to seconds since the epoch as if it was UTC.
+
+    Log timestamps are compared as "wall clock" values: timezones are ignored (like dateutil's ignoretz=True),
+    so it doesn't matter in which timezone the logs were written.
+    """
+    return (_days_since_epoch(dt.year, dt.month, dt.day) * 86400
+            + dt.hour * 3600 + dt.minute * 60 + dt.second + dt.microsecond / 1_000_000)
+
+
+def parse_date(date_str: str) -> datetime:
+    """Parse a date given by the user (or an unknown log format) into a naive datetime, ignoring its timezone.
+
+    ISO dates are parsed directly, anything else by dateutil, which is imported only then because it is slow to import.
+    """
+    try:
+        return datetime.fromisoformat(date_str.strip()).replace(tzinfo=None)
+    except ValueError:
+        from dateutil import parser as date_parser
+        return date_parser.parse(date_str, ignoretz=True)
+
+
+def is_open_date(date_str: str | None) -> bool:
+    """Check if a to_date leaves the window open at the end (see OPEN_DATES)."""
+    return date_str is None or date_str.strip().lower() in OPEN_DATES
+
+
+def check_undecodable_policy(undecodable: str) -> None:
+    """Check an undecodable bytes policy (see UNDECODABLE_BYTES_POLICIES).
+
+    Raises:
+        ValueError: The policy is unknown.
+    """
+    if undecodable not in UNDECODABLE_BYTES_POLICIES:
+        raise ValueError(f"Unknown undecodable bytes policy: {undecodable} (expected one of {', '.join(UNDECODABLE_BYTES_POLICIES)})")
+
+
+def decode_line(line: bytes, undecodable: str = "replace") -> str | None:
+    """Decode the head of a line for a timestamp probe, up to DETECTION_MAX_LINE_BYTES of it.
+
+    A character cut off at the end of the head is dropped, it isn't an undecodable byte.
+
+    Returns:
+        str: The decoded head, or None if it has undecodable bytes and the policy is "skip".
+
+    Raises:
+        ValueError: The head has undecodable bytes and the policy is "fail".
+    """
+    head = line[:DETECTION_MAX_LINE_BYTES]
+    if undecodable == "replace":
+        return codecs.utf_8_decode(head, "replace", False)[0]
+    try:
+        return codecs.utf_8_decode(head, "strict", False)[0]
+    except UnicodeDecodeError as e:
+        if undecodable == "skip":
+            return None
+        raise ValueError(f"Undecodable bytes in a log line at byte {e.start}: {head[:max(e.end, 80)]!r}") from e
+
+
+def posix_to_wall(posix_timestamp: float) -> float:
+    """Convert a real POSIX timestamp (epoch logs, file mtime) to local wall clock seconds."""
+    return posix_timestamp + _utc_offset(int(posix_timestamp) // 3600)
+
+
+def _fraction(digits: bytes | None) -> float:
+    if not digits:
+        return 0.0
+    return int(digits) / 10 ** len(digits)
+
+
+class TimestampParser():
+    """A parser locked to one timestamp format, detected once per file.
+
+    It matches bytes lines with one precompiled pattern and converts the captured fields by hand,
+    which is much faster than trying several patterns and calling dateutil on every line.
+    """
+
+    # name, pattern, whether the timestamp may appear anywhere in the line (not only at its start)
+    FORMATS = [
+        ("iso", rb"(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:[.,](\d+))?", True),  # 2025-10-09 15:30:45.123Z
+        ("human", rb"([A-Z][a-z]{2}) (\d{1,2}), (\d{4}) (\d{1,2}):(\d{2}) ([AP])M", True),     # Oct 9, 2025 3:30 PM
+        ("slash", rb"(\d{2})/(\d{2})/(\d{4}) (\d{2}):(\d{2}):(\d{2})", True),                  # 09/10/2025 15:30:45
+        ("clf", rb"\[(\d{2})/([A-Z][a-z]{2})/(\d{4}):(\d{2}):(\d{2}):(\d{2}) [+-]\d{4}\]", True),  # [10/Oct/2000:13:55:36 -0700]
+        ("syslog", rb"([A-Z][a-z]{2}) +(\d{1,2}) (\d{2}):(\d{2}):(\d{2})", True),              # Jun 14 15:16:01
+        ("epoch_ms", rb"\[?(\d{13})(?![\d.])", False),                                       # 1760023845123
+        ("epoch", rb"\[?(\d{10})(?:\.(\d{1,9}))?(?!\d)", False),                             # 1760023845.123
+    ]
+
+    def __init__(self, name: str, pattern: bytes, anchored: bool, reference_time: float | None = None, undecodable: str = "replace"):
+        """
+        Args:
+            name (str): Name of the format, one of FORMATS.
+            pattern (bytes): Regex with the fields of the format as groups.
+            anchored (bool): Match only at the beginning of the line (much faster than searching).
+            reference_time (float): POSIX time used to infer the year of year-less (syslog) timestamps,
+                usually the mtime of the file. Defaults to now.
+            undecodable (str): Policy for lines that aren't valid UTF-8 (see UNDECODABLE_BYTES_POLICIES).
+                Lines are matched as bytes, so with "replace" they are never decoded; the other policies
+                validate every parsed line, which makes parsing slower.
+        """
+        self.name = name
+        self.anchored = anchored
+        self.regex = re.compile(pattern)
+        self._find = self.regex.match if anchored else self.regex.search
+        self._convert = getattr(self, f"_convert_{name}")
+        self.undecodable = undecodable
+        if undecodable != "replace":
+            self.parse = self._parse_decodable
+        reference = time.gmtime(posix_to_wall(reference_time if reference_time is not None else time.time()))
+        self.reference_year = reference.tm_year
+        self.reference_month = reference.tm_mon
+
+    def parse(self, line: bytes) -> float | None:
+        """Extract the timestamp of a line.
+
+        Args:
+            line (bytes): A single line from a log file.
+
+        Returns:
+            float: Wall clock seconds (see wall_seconds), or None if the line has no timestamp.
+        """
+        match = self._find(line)
+        if match is None:
+            return None
+        try:
+            return self._convert(match)
+        except (ValueError, KeyError):
+            return None
+
+    def _parse_decodable(self, line: bytes) -> float | None:
+        if decode_line(line, self.undecodable) is None:
+            return None
+        return TimestampParser.parse(self, line)
+
+    def _convert_iso(self, match: re.Match) -> float:
+        year, month, day, hour, minute, second, fraction = match.groups()
+        return (_days_since_epoch(int(year), int(month), int(day)) * 86400
+                + int(hour) * 3600 + int(minute) * 60 + int(second) + _fraction(fraction))
+
+    def _convert_human(self, match: re.Match) -> float:
+        month, day, year, hour, minute, am_pm = match.groups()
+        hour = int(hour) % 12 + (12 if am_pm == b"P" else 0)
+        return _days_since_epoch(int(year), MONTHS[month], int(day)) * 86400 + hour * 3600 + int(minute) * 60
+
+    def _convert_slash(self, match: re.Match) -> float:
+        # Month first, the same way dateutil reads it
+        month, day, year, hour, minute, second = match.groups()
+        return (_days_since_epoch(int(year), int(month), int(day)) * 86400
+                + int(hour) * 3600 + int(minute) * 60 + int(second))
+
+    def _convert_clf(self, match: re.Match) -> float:
+        # The UTC offset is ignored like any other timezone
+        day, month, year, hour, minute, second = match.groups()
+        return (_days_since_epoch(int(year), MONTHS[month], int(day)) * 86400
+                + int(hour) * 3600 + int(minute) * 60 + int(second))
+
+    def _convert_syslog(self, match: re.Match) -> float:
+        month, day, hour, minute, second = match.groups()
+        month = MONTHS[month]
+        # Syslog has no year: lines from months after the reference month were written the year before
+        year = self.reference_year if month <= self.reference_month else self.reference_year - 1
+        return (_days_since_epoch(year, month, int(day)) * 86400
+                + int(hour) * 3600 + int(minute) * 60 + int(second))
+
+    def _convert_epoch_ms(self, match: re.Match) -> float:
+        return posix_to_wall(int(match.group(1)) / 1000)
+
+    def _convert_epoch(self, match: re.Match) -> float:
+        seconds, fraction = match.groups()
+        return posix_to_wall(int(seconds) + _fraction(fraction))
+
+
+class GenericTimestampParser():
+    """Slow fallback for files with no detected format: tries every known pattern on every line."""
+
+    name = "generic"
+
+    def __init__(self, extract_date, undecodable: str = "replace"):
+        """
+        Args:
+            extract_date: Function that extracts wall clock seconds from a str line or returns None.
+            undecodable (str): Policy for lines that aren't valid UTF-8 (see UNDECODABLE_BYTES_POLICIES).
+        """
+        self.extract_date = extract_date
+        self.undecodable = undecodable
+
+    def parse(self, line: bytes) -> float | None:
+        # Only the head of a line is decoded, however long the line is
+        text = decode_line(line, self.undecodable)
+        return None if text is None else self.extract_date(text)
+
+
+def read_sample_lines(log_file, max_lines: int = DETECTION_SAMPLE_LINES) -> list[bytes]:
+    """Read up to max_lines lines from the beginning of a seekable binary file."""
+    log_file.seek(0)
+    lines = []
+    for _ in range(max_lines):
+        line = log_file.readline(DETECTION_MAX_LINE_BYTES)
+        if not line:
+            break
+        lines.append(line)
+    return lines
+
+
+def detect_timestamp_parser(sample_lines: list[bytes], reference_time: float | None = None,
+                            undecodable: str = "replace") -> TimestampParser | None:
+    """Detect the timestamp format of a file from its first lines.
+
+    Every known format is tried on the sample, and the one that matches the most lines wins
+    (ties are resolved by the order of TimestampParser.FORMATS).
+
+    Args:
+        sample_lines (list[bytes]): Lines from the beginning of the file.
+        reference_time (float): POSIX time used to infer the year of year-less timestamps, usually the file mtime.
+        undecodable (str): Policy of the parser for lines that aren't valid UTF-8 (see UNDECODABLE_BYTES_POLICIES).
+
+    Returns:
+        TimestampParser: Parser for the detected format, or None if no format matches.
+    """
+    best_parser = None
+    best_hits = 0
+    for name, pattern, searchable in TimestampParser.FORMATS:
+        parser = TimestampParser(name, pattern, anchored=False, reference_time=reference_time)
+        hits = 0
+        anchored = True
+        for line in sample_lines:
+            match = parser.regex.search(line) if searchable else parser.regex.match(line)
+            if match is None:
+                continue
+            try:
+                parser._convert(match)
+            except (ValueError, KeyError):
+                continue
+            hits += 1
+            anchored = anchored and match.start() == 0
+        if hits > best_hits:
+            best_hits = hits
+            best_parser = TimestampParser(name, pattern, anchored=anchored or not searchable, reference_time=reference_time,
+                                          undecodable=undecodable)
+    return best_parser
@@ -0,0 +1,161 @@
+"""Headless LogHarvester: cut logs from the command line, cron or automation scripts.
+
+Examples:
+    python cli.py --from "2025-10-09 15:00" --to "2025-10-09 16:00" --dest copied_logs/ /var/log/app/
+    python cli.py --job job.json
+    python cli.py --from ... --to ... --host web1 --host web2:2222 -u user /var/log/app/
+    python cli.py --from "2025-10-09 15:00" --follow /var/log/app/
+    python cli.py --from "2025-10-09 00:00" --to "2025-10-10 00:00" --preview --buckets 48 /var/log/app/
+    python cli.py --window "2025-10-09 15:00,2025-10-09 15:10" --window "2025-10-09 17:40,2025-10-09 17:45" --padding 60 /var/log/app/
+    python cli.py --from ... --to ... --memory-limit 64 --undecodable skip /var/log/huge.log
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+
+from Config import Config
+from HarvestJob import format_job_summary, format_preview, job_succeeded, parse_host_list, preview_job, run_job
+from TimestampParser import UNDECODABLE_BYTES_POLICIES
+
+PASSWORD_ENV_VAR = "LOG_HARVESTER_PASSWORD"
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="log_harvester",
+        description="Cut log files by date range from the local machine or remote servers without the UI.",
+    )
+    parser.add_argument("paths", nargs="*", help="Log files or directories with log files.")
+    parser.add_argument("--job", help="JSON job file. Command line options override its values.")
+    parser.add_argument("--from", dest="from_date", help="Start of the date range, e.g. \"2025-10-09 15:30:45\".")
+    parser.add_argument("--to", dest="to_date", help="End of the date range (exclusive), \"now\" or \"open\" to cut to the end of the logs.")
+    parser.add_argument("--window", dest="windows", action="append", metavar="FROM,TO",
+                        help="Date range to cut instead of --from/--to. Can be repeated, all windows are cut in one pass "
+                             "and every window gets its own subdirectory.")
+    parser.add_argument("--padding", dest="window_padding_seconds", type=float, metavar="SECONDS",
+                        help="With --window, widen every window by this many seconds on both sides.")
+    parser.add_argument("--slack", dest="time_slack_seconds", type=float, metavar="SECONDS",
+                        help="Log lines can be out of order by up to this many seconds, e.g. logs written by several threads.")
+    parser.add_argument("--memory-limit", dest="memory_limit_mb", type=float, metavar="MB",
+                        help="Memory for the data of the files being cut, however large the files are.")
+    parser.add_argument("--undecodable", dest="undecodable_bytes", choices=UNDECODABLE_BYTES_POLICIES,
+                        help="What timestamp probes do with lines that aren't valid UTF-8: replace the bytes, skip the line or fail the file.")
+    parser.add_argument("--deadline", dest="deadline_seconds", type=float, metavar="SECONDS",
+                        help="Cut the most relevant logs first and leave out the ones not started within this many seconds.")
+    parser.add_argument("--dest", dest="dest_path", help="Directory for the cut logs.")
+    parser.add_argument("--host", dest="hosts", action="append", metavar="HOST[:PORT]",
+                        help="Remote host to cut the paths on. Can be repeated or comma-separated.")
+    parser.add_argument("-u", "--username", help="SSH username.")
+    parser.add_argument("-p", "--password", help=f"SSH password. Prefer the {PASSWORD_ENV_VAR} environment variable.")
+    parser.add_argument("--workers", dest="local_workers", type=int, help="Processes for local cutting (default: number of CPUs).")
+    parser.add_argument("--use-index", dest="use_index", action="store_true", default=None,
+                        help="Use and update the persistent timestamp indexes of local logs.")
+    parser.add_argument("-r", "--recursive", dest="remote_recursive", action="store_true", default=None,
+                        help="Take log files from subdirectories of remote directories too.")
+    parser.add_argument("--include", dest="remote_include_globs", action="append", metavar="GLOB",
+                        help="Take only files matching this glob from remote directories (default: *.log and rotations). Can be repeated.")
+    parser.add_argument("--exclude", dest="remote_exclude_globs", action="append", metavar="GLOB",
+                        help="Leave out remote files and subdirectories matching this glob. Can be repeated.")
+    parser.add_argument("--cache", dest="download_cache", action="store_true", default=None,
+                        help="Cache remote downloads in the settings directory, repeated cuts transfer only the missing bytes.")
+    parser.add_argument("--merge", dest="merge_output", action="store_true", default=None,
+                        help="Merge all cut logs by timestamp into one log in the destination directory.")
+    parser.add_argument("--tag", dest="merge_tag", choices=["host", "file"],
+                        help="With --merge, prefix every merged line with its source host or file.")
+    parser.add_argument("--level", dest="filter_levels", action="append", metavar="LEVEL",
+                        help="Keep only entries of this log level (ERROR, WARN, ...). Can be repeated.")
+    parser.add_argument("--keyword", dest="filter_keywords", action="append", metavar="TEXT",
+                        help="Keep only entries containing this text, e.g. a request ID. Can be repeated.")
+    parser.add_argument("--regex", dest="filter_regexes", action="append", metavar="REGEX",
+                        help="Keep only entries matching this regular expression. Can be repeated.")
+    parser.add_argument("--compress", dest="output_compression", choices=["gzip", "zstd"],
+                        help="Write the cut logs compressed (zstd needs the zstandard package).")
+    parser.add_argument("--bundle", dest="output_bundle", choices=["zstd", "gzip"],
+                        help="Pack the cut logs and a manifest into one .tar.zst or .tar.gz archive.")
+    parser.add_argument("-f", "--follow", dest="follow", action="store_true", default=None,
+                        help="Keep appending new lines to the cut logs until interrupted (Ctrl+C). --to can be left out.")
+    parser.add_argument("--poll", dest="follow_poll_seconds", type=float, metavar="SECONDS",
+                        help="With --follow, how often remote logs (and local logs without inotify) are checked.")
+    parser.add_argument("--preview", action="store_true",
+                        help="Only estimate the lines and bytes per time bucket of the date range from a few probes per log, copy nothing.")
+    parser.add_argument("--buckets", dest="preview_buckets", type=int, metavar="N", help="Number of time buckets of --preview.")
+    parser.add_argument("--log-level", help="DEBUG, INFO, WARNING, ERROR or CRITICAL (default: debug_level setting).")
+    return parser.parse_args(argv)
+
+
+def build_job(args: argparse.Namespace) -> dict:
+    """Merge the JSON job file and the command line options into a job spec (see HarvestJob.run_job)."""
+    job = {}
+    if args.job:
+        with open(args.job, "r", encoding="utf-8") as job_file:
+            job = json.load(job_file)
+    for key in ("from_date", "to_date", "dest_path", "username", "password", "local_workers", "use_index", "download_cache",
+                "remote_recursive", "remote_include_globs", "remote_exclude_globs",
+                "merge_output", "merge_tag", "filter_levels", "filter_keywords", "filter_regexes",
+                "output_compression", "output_bundle", "follow", "follow_poll_seconds", "window_padding_seconds", "time_slack_seconds",
+                "memory_limit_mb", "undecodable_bytes", "preview_buckets", "deadline_seconds"):
+        value = getattr(args, key)
+        if value is not None:
+            job[key] = value
+    if args.paths:
+        job["paths"] = args.paths
+    if args.windows:
+        job["windows"] = [[date.strip() for date in window.split(",", 1)] for window in args.windows]
+    if args.hosts:
+        job["hosts"] = [
+            {"hostname": hostname, "port": port}
+            for hosts in args.hosts
+            for hostname, port in parse_host_list(hosts)
+        ]
+    if "password" not in job and os.environ.get(PASSWORD_ENV_VAR):
+        job["password"] = os.environ[PASSWORD_ENV_VAR]
+    return job
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    configs = Config().configs
+    logging.basicConfig(
+        level=(args.log_level or configs.get("debug_level", "WARNING")).upper(),
+        stream=sys.stderr,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    try:
+        job = build_job(args)
+    except (OSError, ValueError) as e:
+        print(f"Error reading job file {args.job}: {e}", file=sys.stderr)
+        return 2
+    follow = job.get("follow", configs.get("follow", False))
+    missing = [key for key in ("from_date", "to_date") if not job.get(key) and not (follow and key == "to_date")]
+    if missing and not job.get("windows"):
+        print(f"Missing {', '.join(missing)}: use --from/--to, --window or the job file.", file=sys.stderr)
+        return 2
+    job.setdefault("dest_path", configs.get("dest_path", "copied_logs/"))
+    if args.preview:
+        try:
+            preview = preview_job(job, configs)
+        except ValueError as e:
+            print(f"Invalid job: {e}", file=sys.stderr)
+            return 2
+        print(format_preview(preview))
+        return 0 if preview["mode"] == "local" or job_succeeded(preview) else 1
+    stop_event = threading.Event()
+    if follow:
+        # Stop following and finish the job (merge, report) on Ctrl+C or a kill
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signal_number, lambda *_: stop_event.set())
+    try:
+        result = run_job(job, configs, stop_event=stop_event)
+    except ValueError as e:
+        print(f"Invalid job: {e}", file=sys.stderr)
+        return 2
+    print(format_job_summary(result))
+    return 0 if job_succeeded(result) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
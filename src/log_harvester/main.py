@@ -1,29 +1,39 @@
 import logging
 import os
 import asyncio
+import time
 
 from pathlib import Path
 from Config import Config
 from typing import cast
 from datetime import datetime, timedelta
 from textual.app import App, ComposeResult
-from textual.containers import Grid, Container, VerticalScroll
-from textual.widgets import Footer, Header, Static, Label, Input, Switch, Button, LoadingIndicator
+from textual.containers import Grid, Container, Horizontal, VerticalScroll
+from textual.widgets import Footer, Header, Static, Label, Input, Switch, Button, LoadingIndicator, DataTable, Log
 
-from LogCutter import LogCutter
-from RemoteLogCutter import RemoteLogCutter
+from HarvestJob import format_wall_time, parse_host_list, preview_rows, sparkline
+from JobEngine import JobEngine
+from RunStats import PHASES
+
+# How often the progress table is refreshed while jobs run, in seconds
+PROGRESS_REFRESH_SECONDS = 0.5
+# Lines of the followed logs kept in the live log view
+FOLLOW_LOG_MAX_LINES = 2000
 
 
 class SSHSettings(Static):
-    configs = Config().configs
-    ssh_settings = configs.get("ssh_settings", {})
+    @property
+    def configs(self) -> dict:
+        return self.app.configs
+
     def compose(self) -> ComposeResult:
+        self.ssh_settings = self.configs.get("ssh_settings", {})
         yield Label("Copy from localhost:", id="copy_from_localhost_label")
         yield Switch(id="copy_from_localhost", value=self.configs.get("copy_from_local", True), animate=True)
 
         with Container(id="ssh_inputs_container"):
             yield Label("SSH Settings")
-            yield Input(placeholder="Host:port", id="hostname", value=f"{self.ssh_settings.get('hostname', '')}:{self.ssh_settings.get('port', '')}", valid_empty=False)
+            yield Input(placeholder="Host:port[, host2:port, ...]", id="hostname", value=f"{self.ssh_settings.get('hostname', '')}:{self.ssh_settings.get('port', '')}", valid_empty=False)
             yield Input(placeholder="Username", id="username", value=self.ssh_settings.get("username", ""), valid_empty=False)
             yield Input(placeholder="Password", id="password", password=True, value=self.ssh_settings.get("password", ""), valid_empty=False)
 
@@ -32,7 +42,10 @@ class SSHSettings(Static):
         container.display = not self.configs.get("copy_from_local", True)
 
 class PathField(Static):
-    configs = Config().configs
+    @property
+    def configs(self) -> dict:
+        return self.app.configs
+
     def compose(self) -> ComposeResult:
         if self.id == "dest_path_field":
             yield Input(self.configs.get("dest_path", "/home/user/heap"), id="dest_path")
@@ -46,6 +59,8 @@ class LogsFetcher(App):
 
     BINDINGS = [
         ("a", "add_path", "Add path"),
+        ("s", "stop_follow", "Stop following"),
+        ("c", "cancel_job", "Cancel job"),
         ]
 
     CSS_PATH = Path(__file__).parent / "log_harvester.tcss"
@@ -53,10 +68,19 @@ class LogsFetcher(App):
     from_time = (datetime.now() - timedelta(hours=3)).strftime("%Y-%m-%d %H:%M:%S")
     to_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     configs = None
+    # Runs the copies, several of them can be queued or running at once
+    engine = None
+    # The running follow-mode job, the COPY button stops it
+    follow_job = None
+    # Job of every row of the progress table, to cancel the highlighted one
+    progress_row_jobs = []
+    # Preview shown in the table, its rows narrow the date range when selected
+    preview = None
 
     def compose(self) -> ComposeResult:
         self.logger.info("The app is composing the layout.")
-        self.configs = Config().configs
+        if self.configs is None:
+            self.configs = Config().configs
         logging.debug(f"Loaded configurations: {self.configs}")
         logging.debug(f"Destination path from config: {self.configs.get('dest_path')}")
         yield Header()
@@ -67,6 +91,8 @@ class LogsFetcher(App):
                 yield Input(placeholder=self.from_time, classes="datetime_input", id="from_date", value=self.from_time, valid_empty=False)
                 yield Label("To date:", id="to_date_label")
                 yield Input(placeholder=self.to_time, classes="datetime_input", id="to_date", value=self.to_time, valid_empty=False)
+                yield Label("Follow:", id="follow_label")
+                yield Switch(id="follow", value=self.configs.get("follow", False), animate=True)
                 # Implement if needed in the future
                 # yield Label("Slow mode:", id="slow_mode_label")
                 # yield Switch(id="slow_mode", value=self.configs.get("slow_mode", False), animate=True)
@@ -77,8 +103,12 @@ class LogsFetcher(App):
                 yield Label("Destination:", id="log_destination_label")
                 yield PathField(id="dest_path_field")
             yield SSHSettings(id="ssh_settings", classes="panel")
-            yield Button("COPY", id="copy_btn", variant="primary")
+            with Horizontal(id="actions"):
+                yield Button("COPY", id="copy_btn", variant="primary")
+                yield Button("PREVIEW", id="preview_btn")
             yield LoadingIndicator(id="loading_indicator")
+            yield DataTable(id="progress_table", show_cursor=False)
+            yield Log(id="follow_log", max_lines=FOLLOW_LOG_MAX_LINES)
 
 
     def action_add_path(self) -> None:
@@ -87,102 +117,187 @@ class LogsFetcher(App):
         self.query_one("#path_fields").mount(new_path)
         new_path.scroll_visible()
 
+    def on_mount(self) -> None:
+        self.engine = JobEngine(self.configs)
+        self.set_interval(PROGRESS_REFRESH_SECONDS, self._refresh_progress)
+
     async def action_copy(self) -> None:
-        """An async action to start copying logs without blocking the UI."""
+        """An async action to queue a copy and notify its outcome, the UI and other copies keep running meanwhile."""
+        job = self._job_from_inputs()
+        follow = self.query_one("#follow", Switch).value
+        follow_log = self.query_one("#follow_log", Log)
+        if follow and self.follow_job is not None:
+            self.notify("Logs are followed already, stop following first.", title="Follow", severity="warning")
+            return
+        job["follow"] = follow
+        engine_job = self.engine.submit(job, on_data=self._on_follow_data)
+        if follow:
+            self.follow_job = engine_job
+            # Pressing it again stops following
+            self.query_one("#copy_btn", Button).label = "STOP"
+            follow_log.clear()
+            follow_log.display = True
+            self.query_one("#main-container").add_class("following")
+        elif self.follow_job is None:
+            follow_log.display = False
+            self.query_one("#main-container").remove_class("following")
+        self.preview = None
+        progress_table = self.query_one("#progress_table", DataTable)
+        progress_table.clear(columns=True)
+        progress_table.add_columns("Job", "Host", "File", "Status", "Progress", "MB/s", "ETA")
+        progress_table.cursor_type = "row"
+        progress_table.show_cursor = True
+        progress_table.display = True
+        self._refresh_progress()
+
+        await engine_job.task
+
+        if engine_job is self.follow_job:
+            self.follow_job = None
+            self.query_one("#copy_btn", Button).label = "COPY"
+        self._refresh_progress()
+        if engine_job.summary():
+            severity = "error" if engine_job.state == "failed" else "information"
+            self.notify(engine_job.summary(), title=f"Job {engine_job.id} {engine_job.state}", severity=severity, timeout=15)
+
+    async def action_preview(self) -> None:
+        """Show the estimated lines and bytes per time bucket of the date range, without copying anything.
+
+        Selecting a bucket in the table narrows the date range to it.
+        """
         loading_indicator = self.query_one("#loading_indicator", LoadingIndicator)
-        # show indicator and yield control so the UI can update
         loading_indicator.display = True
-        await asyncio.sleep(0)
+        # Queued like a copy, so it counts against the running jobs and "c" cancels it
+        engine_job = self.engine.submit(self._job_from_inputs(), preview=True)
+        await engine_job.task
+        loading_indicator.display = bool(self.engine.active_jobs())
+        preview = engine_job.result
+        if preview is None:
+            self.notify(engine_job.summary(), title=f"Preview {engine_job.state}",
+                        severity="warning" if engine_job.state == "cancelled" else "error")
+            return
+        self.preview = preview
+        self.query_one("#follow_log", Log).display = False
+        self.query_one("#main-container").remove_class("following")
+        progress_table = self.query_one("#progress_table", DataTable)
+        progress_table.clear(columns=True)
+        progress_table.add_columns("From", "To", "Lines (est.)", "MB", "")
+        progress_table.add_rows(preview_rows(preview))
+        progress_table.cursor_type = "row"
+        progress_table.show_cursor = True
+        progress_table.display = True
+        summary = f"{sparkline(preview['lines'])}\n~{sum(preview['lines']):,} lines, {sum(preview['bytes']) / (1024 * 1024):.1f} MB in {len(preview['files'])} logs"
+        if preview["skipped"]:
+            summary += f", {preview['skipped']} not previewed"
+        self.notify(summary + "\nSelect a row to narrow the date range to it.", title="Preview", timeout=15)
 
-        from_date_input = self.query_one("#from_date", Input)
-        to_date_input = self.query_one("#to_date", Input)
+    def on_data_table_row_selected(self, event: DataTable.RowSelected) -> None:
+        """Narrow the date range to the selected bucket of the preview."""
+        if self.preview is None or event.data_table.id != "progress_table":
+            return
+        edges = self.preview["edges"]
+        self.query_one("#follow", Switch).value = False
+        self.query_one("#from_date", Input).value = format_wall_time(edges[event.cursor_row])
+        self.query_one("#to_date", Input).value = format_wall_time(edges[event.cursor_row + 1])
+
+    def _job_from_inputs(self) -> dict:
+        """Job spec of the values in the form (see HarvestJob.run_job)."""
         # Query for inputs and cast each result to Input so Pylance knows about `.value`
         log_inputs = list(self.query("#path_fields Input"))
-        log_files_input = [cast(Input, inp).value for inp in log_inputs]
-        dest_path_input = self.query_one("#dest_path", Input)
+        job = {
+            "from_date": self.query_one("#from_date", Input).value,
+            "to_date": self.query_one("#to_date", Input).value,
+            "dest_path": self.query_one("#dest_path", Input).value,
+            "paths": [cast(Input, inp).value for inp in log_inputs],
+            "hosts": [],
+        }
+        if self.query_one("#copy_from_localhost", Switch).value is not True:
+            # gather ssh info (unused for local copy)
+            hosts = parse_host_list(self.query_one("#hostname", Input).value)
+            job["username"] = self.query_one("#username", Input).value
+            job["password"] = self.query_one("#password", Input).value
+            self.logger.debug(f"hosts = {hosts}, username = {job['username']}")
+            # Hosts typed in the UI share the paths and credentials, hosts from the settings file have their own
+            job["hosts"] = [{"hostname": hostname, "port": port} for hostname, port in hosts] + self.configs.get("hosts", [])
+        return job
+
+    def _refresh_progress(self) -> None:
+        """Redraw the progress table from the stats of the jobs: a row per job, then the files of the running ones and the latest one."""
+        self.query_one("#loading_indicator", LoadingIndicator).display = bool(self.engine.active_jobs())
+        progress_table = self.query_one("#progress_table", DataTable)
+        if self.preview is not None or not progress_table.display or not self.engine.jobs:
+            return
+        latest = max(self.engine.jobs)
+        rows = []
+        self.progress_row_jobs = []
+        for engine_job in reversed(self.engine.jobs.values()):
+            file_rows = engine_job.stats.progress_rows()
+            finished_files = sum(1 for row in file_rows if row[2] not in ("queued", "running", *PHASES))
+            elapsed = (engine_job.finished or time.time()) - (engine_job.started or time.time())
+            rows.append((f"#{engine_job.id}", "", engine_job.label(), engine_job.state, f"{finished_files}/{len(file_rows)} files", "", f"{elapsed:.0f}s"))
+            self.progress_row_jobs.append(engine_job.id)
+            if not engine_job.done or engine_job.id == latest:
+                rows.extend((f"#{engine_job.id}",) + row for row in file_rows)
+                self.progress_row_jobs.extend([engine_job.id] * len(file_rows))
+        cursor_row = progress_table.cursor_row
+        progress_table.clear()
+        progress_table.add_rows(rows)
+        progress_table.move_cursor(row=min(cursor_row, len(rows) - 1))
 
-        # gather ssh info (may be unused for local copy)
-        hostname_port = self.query_one("#hostname", Input).value
-        hostname = hostname_port.split(":")[0]
-        port = 22
+    def action_stop_follow(self) -> None:
+        """Stop following the logs, the job then finishes like a normal copy."""
+        if self.follow_job is not None and self.engine.cancel(self.follow_job.id):
+            self.notify("Stopping...", title="Follow")
+
+    def action_cancel_job(self) -> None:
+        """Cancel the job of the highlighted row of the progress table, or the latest unfinished job."""
+        progress_table = self.query_one("#progress_table", DataTable)
+        job_id = None
+        if self.preview is None and progress_table.display and 0 <= progress_table.cursor_row < len(self.progress_row_jobs):
+            job_id = self.progress_row_jobs[progress_table.cursor_row]
+        if job_id is None or self.engine.jobs[job_id].done:
+            active_jobs = self.engine.active_jobs()
+            job_id = active_jobs[-1].id if active_jobs else None
+        if job_id is not None and self.engine.cancel(job_id):
+            self.notify("Cancelling...", title=f"Job {job_id}")
+
+    async def on_unmount(self) -> None:
+        if self.engine is not None:
+            await self.engine.close()
+
+    def _on_follow_data(self, host: str, path: str, data: bytes) -> None:
+        """Show data appended to a followed log, called from the follower threads."""
         try:
-            if hostname_port.split(":")[1]:
-                port = int(hostname_port.split(":")[1])
-        except Exception:
-            port = 22
-        username = self.query_one("#username", Input).value
-        password = self.query_one("#password", Input).value
-
-        # run the blocking copy code in a thread so the UI can continue to animate
-        await asyncio.to_thread(
-            self._copy_sync,
-            from_date_input.value,
-            to_date_input.value,
-            dest_path_input.value,
-            log_files_input,
-            self.query_one("#copy_from_localhost", Switch).value,
-            hostname,
-            port,
-            username,
-            password,
-        )
-
-        loading_indicator.display = False
-
-    def _copy_sync(self, from_date, to_date, dest_path, log_files_input: list[str], copy_from_local: bool, hostname: str, port: int, username: str, password: str) -> None:
-        """Blocking copy logic moved to a sync helper so it can be run in a thread."""
-        # This is the same logic as before but running in a background thread.
-        if copy_from_local is True:
-            logs_cutter = LogCutter(
-            from_date=from_date,
-            to_date=to_date,
-            dest_path=dest_path,
-            )
-            # TODO: Refactor this
-            for log in log_files_input:
-                if os.path.exists(log):
-                    if os.path.isdir(log):
-                        self.logger.debug(f"Processing log directory: {log}")
-                        for logfile in os.listdir(log):
-                            log_path = os.path.join(log, logfile)
-                            if os.path.isfile(log_path):
-                                self.logger.debug(f"Processing log file: {log_path}")
-                                with open(log_path, "r") as log_file:
-                                    log_lines = log_file.readlines()
-                                    logs_cutter.cut_log(log_path, log_lines)
-                    elif os.path.isfile(log):
-                        self.logger.debug(f"Processing a single log file: {log}")
-                        with open(log, "r") as log_file:
-                            log_lines = log_file.readlines()
-                            logs_cutter.cut_log(log, log_lines)
-                else:
-                    self.logger.error(f"Log file or directory does not exist: {log}")
-        else:
-            self.logger.debug(f"hostname = {hostname}, port = {port}, username = {username}, password = {password}")
-            remote_lc = RemoteLogCutter(
-                from_date=from_date,
-                to_date=to_date,
-                dest_path=dest_path,
-                hostname=hostname,
-                username=username,
-                password=password,
-                port=port,
-            )
-            remote_lc.cut_logs(requested_log_file_paths=log_files_input)
+            self.call_from_thread(self._show_follow_data, host, path, data)
+        except RuntimeError:
+            # The app is shutting down
+            pass
 
+    def _show_follow_data(self, host: str, path: str, data: bytes) -> None:
+        prefix = f"[{host}:{os.path.basename(path)}] "
+        # The view keeps FOLLOW_LOG_MAX_LINES lines, earlier ones of a large chunk would be dropped right away
+        lines = data.decode("utf-8", "replace").splitlines()[-FOLLOW_LOG_MAX_LINES:]
+        self.query_one("#follow_log", Log).write_lines(prefix + line for line in lines)
 
     def on_button_pressed(self, event: Button.Pressed) -> None:
         """Event handler called when a button is pressed."""
         if event.button.id == "add_path":
             self.action_add_path()
-        if event.button.id == "copy_btn":
+        if event.button.id == "copy_btn" and self.follow_job is not None:
+            self.action_stop_follow()
+        elif event.button.id == "copy_btn":
             # schedule the async action so the button handler doesn't block
             asyncio.create_task(self.action_copy())
+        if event.button.id == "preview_btn":
+            asyncio.create_task(self.action_preview())
     
     def on_switch_changed(self, event: Switch.Changed) -> None:
         """Called when the switch is toggled."""
         container = self.query_one("#ssh_inputs_container", Container)
         # Use the instance value (event.switch.value) rather than the Switch class attribute.
+        if event.switch.id == "follow" and event.switch.value is True:
+            # A followed window is open at the end
+            self.query_one("#to_date", Input).value = "now"
         if event.switch.id == "copy_from_localhost" and event.switch.value is True:
             container.display = False
         elif event.switch.id == "copy_from_localhost" and event.switch.value is False:
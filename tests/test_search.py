@@ -0,0 +1,126 @@
+"""Fast randomized check of the window search of LogCutter against a brute-force scan.
+
+A few KB of log per timestamp format, in order and out of order, with stack traces between the timestamped lines.
+locate_window and locate_windows must find the first line at or after every edge, without and with time_slack.
+A small linear_scan_bytes makes the small files go through the binary search and its probes.
+For a larger, slower check of big files see `bench_cut.py --verify`.
+
+Examples:
+    python tests/test_search.py
+    python -m pytest tests
+"""
+import random
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR.parent / "src" / "log_harvester"))
+sys.path.insert(0, str(TESTS_DIR.parent / "benchmarks"))
+
+from generate_logs import FORMATS, generate  # noqa: E402
+from LogCutter import LogCutter  # noqa: E402
+
+# Size of a generated log, in MB of generate_logs
+LOG_SIZE_MB = 0.008
+# Seconds the timestamps of an out-of-order log are moved back by at most
+OUT_OF_ORDER_SKEW = 2.0
+# Seconds of the timestamps of the formats without seconds (1 by default): a line moved back by the skew can look
+# that much earlier
+FORMAT_RESOLUTION = {"human": 60.0}
+# Bytes below which the search scans linearly, small enough for a few probes on LOG_SIZE_MB
+SCAN_BYTES = 512
+# Random window sets checked per log
+WINDOW_SETS = 25
+
+
+def timestamped_lines(path: str, parser) -> list[tuple[int, float]]:
+    """(offset, timestamp) of every timestamped line of the log."""
+    timestamped = []
+    offset = 0
+    with open(path, "rb") as log_file:
+        for line in log_file:
+            line_timestamp = parser.parse(line)
+            if line_timestamp is not None:
+                timestamped.append((offset, line_timestamp))
+            offset += len(line)
+    return timestamped
+
+
+def first_offset_at_or_after(timestamped: list[tuple[int, float]], timestamp: float, file_size: int) -> int:
+    """The answer of a search by brute force: the offset of the first line whose timestamp matches or exceeds timestamp."""
+    return next((offset for offset, line_timestamp in timestamped if line_timestamp >= timestamp), file_size)
+
+
+def check_log(log_format: str, out_of_order: bool, time_slack: float, seed: int, work_dir: str) -> list[dict]:
+    """Search random windows of a generated log and return the mismatches with the brute-force scan."""
+    rng = random.Random(seed)
+    path = str(Path(work_dir) / f"{log_format}_{int(out_of_order)}.log")
+    if not Path(path).exists():
+        generate(path, log_format, size_mb=LOG_SIZE_MB, lines_per_second=0.5, stack_trace_rate=0.1, stack_trace_lines=8,
+                 out_of_order_rate=0.1 if out_of_order else 0.0, out_of_order_skew=OUT_OF_ORDER_SKEW, seed=seed)
+    mismatches = []
+    with open(path, "rb") as log_file:
+        file_size = Path(path).stat().st_size
+        parser = LogCutter("1970-01-01 00:00:00", None, work_dir).detect_timestamp_parser(log_file)
+        timestamped = timestamped_lines(path, parser)
+        first, last = timestamped[0][1], max(line_timestamp for _, line_timestamp in timestamped)
+
+        def random_date() -> str:
+            # Whole seconds from a bit before the first line to a bit after the last one
+            return datetime.fromtimestamp(int(rng.uniform(first - 10, last + 10)), timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+        for _ in range(WINDOW_SETS):
+            edges = sorted({random_date() for _ in range(6)})
+            windows = [(edges[i], edges[i + 1]) for i in range(0, len(edges) - 1, 2)]
+            for from_date, to_date in windows:
+                log_cutter = LogCutter(from_date, to_date, work_dir, time_slack=time_slack)
+                log_cutter.linear_scan_bytes = SCAN_BYTES
+                expected = (first_offset_at_or_after(timestamped, log_cutter.from_timestamp, file_size),
+                            first_offset_at_or_after(timestamped, log_cutter.to_timestamp, file_size))
+                found = log_cutter.locate_window(log_file, file_size, parser)
+                if found != expected:
+                    mismatches.append({"search": "locate_window", "window": [from_date, to_date], "expected": expected, "found": found})
+            log_cutter = LogCutter(None, None, work_dir, windows=windows, time_slack=time_slack)
+            log_cutter.linear_scan_bytes = SCAN_BYTES
+            expected = [(first_offset_at_or_after(timestamped, start, file_size), first_offset_at_or_after(timestamped, end, file_size))
+                        for start, end in log_cutter.windows]
+            found = log_cutter.locate_windows(log_file, file_size, parser)
+            if found != expected:
+                mismatches.append({"search": "locate_windows", "windows": windows, "expected": expected, "found": found})
+    return mismatches
+
+
+# (out_of_order, with_slack) of the checked logs: a slack must not change the result on a log in order,
+# and lines out of order by up to the slack must be found where the brute-force scan finds them
+CASES = [(False, False), (False, True), (True, True)]
+
+
+def run_checks(work_dir: str) -> list[str]:
+    """Check every format and case, return a description of every mismatch."""
+    failures = []
+    for seed, log_format in enumerate(FORMATS, start=1):
+        for out_of_order, with_slack in CASES:
+            time_slack = OUT_OF_ORDER_SKEW + FORMAT_RESOLUTION.get(log_format, 1.0) if with_slack else 0.0
+            for mismatch in check_log(log_format, out_of_order, time_slack, seed, work_dir):
+                failures.append(f"{log_format} out_of_order={out_of_order} time_slack={time_slack}: {mismatch}")
+    return failures
+
+
+def test_search_matches_brute_force(tmp_path):
+    failures = run_checks(str(tmp_path))
+    assert not failures, "\n".join(failures)
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as work_dir:
+        failures = run_checks(work_dir)
+    for failure in failures:
+        print(failure)
+    print(f"{len(FORMATS)} formats x {len(CASES)} cases x {WINDOW_SETS} window sets, {len(failures)} mismatches")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())